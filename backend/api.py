@@ -1,13 +1,40 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Header, Query, Request, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-import cv2
 import numpy as np
-import base64
+import asyncio
+import contextlib
 import os
+import logging
+import threading
+import time
 
+import config
 from services.presence import PresenceService
 from services.emotion import EmotionService
+from services.batching import MicroBatcher
+from services.executor import InferenceExecutor
+from services.frame import BufferPool, decode_image, decode_frame, raw_frame
+from services.session import SessionStore
+from services.registry import get_registry
+from services.tracking import FaceTracker
+from services.debug import debug_image_url, encode_debug, encode_frame_debug
+from services.face import extract_face, extract_faces, local_cascade, locator_from_config
+from services.timeline import TimelineStore, record_for, to_dicts
+from services import tracing
+from services.tracing import Trace, TraceMiddleware, TraceStore
+from services.gating import FrameGate
+from services.affect import AffectEngine
+from services.admission import AdmissionController, LatestFrame, Overloaded, Superseded
+from services.metrics import (
+    metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE, STAGE_SECONDS, REQUEST_SECONDS, STATUS_TOTAL,
+    REUSED_TOTAL, FACE_SOURCE_TOTAL, EMOTION_FAILURES_TOTAL, IN_FLIGHT,
+    ADMISSION_TOTAL, ADMISSION_QUEUED, ADMISSION_ACTIVE, STREAM_DROPPED_TOTAL, FRAME_POOL_BUFFERS_TOTAL,
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("api")
 
 app = FastAPI()
 
@@ -20,107 +47,593 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-print("Initializing Services...")
-presence_service = PresenceService()
-emotion_service = EmotionService()
+# Models are registered here but loaded and warmed up at startup (see _warm_models),
+# so importing the app stays cheap and /readyz can tell when they are hot.
+registry = get_registry()
+presence_service = PresenceService(registry=registry, preload=False, backend=config.PRESENCE_BACKEND)
+emotion_service = EmotionService(registry=registry, preload=False, backend=config.EMOTION_BACKEND, model_dir=config.MODEL_DIR)
+
+# Faces are searched for inside the upper part of YOLO's person boxes, not over the
+# whole frame; Haar (one cascade per thread) is the fast fallback without persons
+face_locator = locator_from_config(config)
+
+# Blocking stages run here instead of on the event loop
+executor = InferenceExecutor(
+    threads=config.EXECUTOR_THREADS,
+    processes=config.EXECUTOR_PROCESSES,
+    stage_limits=config.STAGE_LIMITS,
+    process_stages=config.EXECUTOR_PROCESS_STAGES,
+)
+
+# Working copies and color conversions reuse per-resolution buffers; not when
+# frames cross a process pool (decoded there, or sent there to be encoded),
+# where the buffers would be pickled copies anyway
+frame_pool = BufferPool(per_shape=config.FRAME_POOL_SIZE) if config.FRAME_POOL_SIZE and not {"decode", "encode"} & executor.process_stages else None
+
+# Concurrent requests share one forward per model
+presence_batcher = MicroBatcher(
+    presence_service.detect_presence_batch,
+    max_batch_size=config.BATCH_MAX_SIZE,
+    max_wait_ms=config.BATCH_MAX_WAIT_MS,
+    executor=executor,
+    name="presence",
+)
+emotion_batcher = MicroBatcher(
+    emotion_service.predict_batch,
+    max_batch_size=config.BATCH_MAX_SIZE,
+    max_wait_ms=config.BATCH_MAX_WAIT_MS,
+    executor=executor,
+    name="emotion",
+)
+
+# Per-client pipeline state (last boxes, last result, frame counters)
+session_store = SessionStore(
+    max_sessions=config.SESSION_MAX,
+    ttl_seconds=config.SESSION_TTL_SECONDS,
+)
+
+# Emotion history of every session, on disk
+timeline_store = TimelineStore(
+    config.TIMELINE_DIR,
+    flush_records=config.TIMELINE_FLUSH_RECORDS,
+    flush_seconds=config.TIMELINE_FLUSH_SECONDS,
+    retention_seconds=config.TIMELINE_RETENTION_HOURS * 3600.0,
+    max_sessions=config.TIMELINE_MAX_SESSIONS,
+) if config.TIMELINE else None
+
+# Opt-in per-request traces (X-Trace: 1 or sampling), viewable in a Chrome trace viewer
+trace_store = TraceStore(
+    sample_rate=config.TRACE_SAMPLE_RATE,
+    keep=config.TRACE_KEEP,
+    keep_slowest=config.TRACE_KEEP_SLOWEST,
+    directory=config.TRACE_DIR or None,
+    profile=bool(config.TRACE_PROFILE),
+    profile_interval=config.TRACE_PROFILE_INTERVAL_MS / 1000.0,
+    max_files=config.TRACE_DIR_MAX_FILES,
+) if config.TRACING else None
+if trace_store is not None:
+    app.add_middleware(TraceMiddleware, store=trace_store, header=config.TRACE_HEADER, prefix="/predict")
+
+# Bounded concurrency + latest-frame-wins per session; enough active slots to fill the executor and a batch
+admission = AdmissionController(
+    max_active=config.ADMISSION_MAX_ACTIVE or max(executor.threads, config.BATCH_MAX_SIZE),
+    max_queued=config.ADMISSION_MAX_QUEUED,
+    deadline=config.ADMISSION_DEADLINE_MS / 1000.0,
+) if config.ADMISSION else None
+
+@app.on_event("startup")
+def _start_model_warmup():
+    threading.Thread(target=_warm_models, name="model-warmup", daemon=True).start()
+    if timeline_store is not None:
+        timeline_store.start()
+    if trace_store is not None:
+        trace_store.start()
+
+def _warm_models():
+    start = time.perf_counter()
+    ok = registry.load_all(warmup=config.WARMUP_RUNS > 0, runs=config.WARMUP_RUNS)
+    if ok:
+        logger.info("Models ready in %.2fs", time.perf_counter() - start)
+    else:
+        logger.error("Some models failed to load; /readyz stays unavailable")
+
+@app.get("/healthz")
+def healthz():
+    # Liveness only: the process is up and serving HTTP
+    return {"status": "ok"}
 
-# Haar Cascade for face detection (Fast fallback)
-try:
-    face_cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-    face_cascade = cv2.CascadeClassifier(face_cascade_path)
-except:
-    face_cascade = None
+@app.get("/readyz")
+def readyz():
+    status = registry.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
 
-print("Services Ready.")
+@app.get("/metrics")
+def metrics_endpoint():
+    if admission is not None:
+        ADMISSION_QUEUED.set(admission.queued)
+        ADMISSION_ACTIVE.set(admission.active)
+    if frame_pool is not None:
+        FRAME_POOL_BUFFERS_TOTAL.set_total(frame_pool.reused, "reused")
+        FRAME_POOL_BUFFERS_TOTAL.set_total(frame_pool.allocated, "allocated")
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@contextlib.contextmanager
+def _request_trace(name, requested=False):
+    if trace_store is None or not trace_store.should_trace(requested):
+        yield None
+        return
+    trace = Trace(name)
+    token = tracing.activate(trace)
+    try:
+        yield trace
+    finally:
+        tracing.deactivate(token)
+        trace_store.finish(trace)
+
+@contextlib.contextmanager
+def _stage(name):
+    # Stage latency metric, plus a span when the request is traced
+    with STAGE_SECONDS.time(name), tracing.span(name, cpu=False):
+        yield
+
+@app.get("/traces")
+def list_traces():
+    if trace_store is None:
+        raise HTTPException(status_code=404, detail="Tracing is disabled")
+    return {"recent": trace_store.recent(), "slowest": trace_store.slowest()}
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str):
+    """
+    Chrome trace-event JSON: open it in chrome://tracing or ui.perfetto.dev.
+    """
+    trace = trace_store.get(trace_id) if trace_store is not None else None
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Unknown trace")
+    return trace.to_chrome()
+
+@app.get("/traces/{trace_id}/stacks")
+def get_trace_stacks(trace_id: str):
+    """
+    Profiler samples as folded stacks, for flamegraph.pl or speedscope
+    (TRACE_PROFILE=1; kept for the slowest traces only).
+    """
+    trace = trace_store.get(trace_id) if trace_store is not None else None
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Unknown trace")
+    return Response(content=trace.folded(), media_type="text/plain")
+
+@app.on_event("shutdown")
+def _shutdown_executor():
+    executor.shutdown(wait=False)
+    if timeline_store is not None:
+        timeline_store.close()
+    if trace_store is not None:
+        trace_store.close()
+
+class PipelineResult:
+    def __init__(self, status, analysis=None, persons=None, phones=None, face_coords=None, faces=None):
+        self.status = status
+        self.analysis = analysis
+        self.persons = persons or []
+        self.phones = phones or []
+        self.face_coords = face_coords
+        # Multi-face mode: [{"box": [x, y, w, h], "analysis": {...}}, ...], largest first
+        self.faces = faces
+        # True when the frame matched the previous one and this is the cached analysis
+        self.reused = False
+
+    def reuse(self):
+        result = PipelineResult(self.status, self.analysis, self.persons, self.phones, self.face_coords, self.faces)
+        result.reused = True
+        return result
 
 @app.post("/predict")
-async def analyze_emotion(file: UploadFile = File(...)):
+async def analyze_emotion(
+    file: UploadFile = File(...),
+    x_session_id: str = Header(None),
+    debug: str = Query(None, pattern="^(off|boxes|preview|full)$"),
+    faces: str = Query(None, pattern="^(single|multi)$"),
+):
     # Read image
     contents = await file.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    return await _predict(contents, x_session_id, debug, faces, _decode_frame, contents, frame_pool)
 
-    if img is None:
-        return {"error": "Invalid image"}
+@app.post("/predict/raw")
+async def analyze_emotion_raw(
+    request: Request,
+    x_session_id: str = Header(None),
+    debug: str = Query(None, pattern="^(off|boxes|preview|full)$"),
+    faces: str = Query(None, pattern="^(single|multi)$"),
+    width: int = Query(None, gt=0),
+    height: int = Query(None, gt=0),
+    format: str = Query("bgr", pattern="^(bgr|rgb|bgra|rgba|gray)$"),
+):
+    """
+    Same as /predict without multipart: the body is the image itself, either
+    encoded (JPEG/PNG, any content type) or, with ?width=&height=, raw pixels
+    in `format`. Raw BGR frames are analyzed in place, without a decode.
+    """
+    contents = await request.body()
+    if width and height:
+        return await _predict(contents, x_session_id, debug, faces, raw_frame,
+                              contents, width, height, format, config.FRAME_WORK_WIDTH, frame_pool, raw=True)
+    return await _predict(contents, x_session_id, debug, faces, _decode_frame, contents, frame_pool)
+
+async def _predict(contents, session_id, debug, faces, decode, *decode_args, raw=False):
+    try:
+        async with _admitted(session_id):
+            with IN_FLIGHT.track("predict"), REQUEST_SECONDS.time("predict"):
+                with _stage("decode"):
+                    frame = await executor.run("decode", decode, *decode_args)
+
+                if frame is None:
+                    return {"error": "Invalid image"}
+
+                with _holding(frame):
+                    session = session_store.get(session_id)
+                    result = await _run_pipeline(frame, session, (faces or config.FACE_MODE) == "multi")
+                    # Keep the compressed upload so /sessions/{id}/debug.jpg can render it on demand
+                    _keep_last_frame(session, contents, raw)
+
+                    return await _respond(result, frame, debug or config.DEBUG_MODE)
+    except Overloaded as e:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+            content={"error": "overloaded", "reason": e.reason, "retry_after": e.retry_after},
+        )
+    except Superseded:
+        # The same session already sent a newer frame; that one gets analyzed instead
+        return JSONResponse(status_code=409, content={"error": "superseded"})
+
+@contextlib.contextmanager
+def _holding(frame):
+    # Hands the frame's pooled buffers back once the request is done with them
+    cancelled = False
+    try:
+        yield frame
+    except asyncio.CancelledError:
+        # A worker thread may still be reading them; leave them to the GC
+        cancelled = True
+        raise
+    finally:
+        if not cancelled:
+            frame.release()
+
+def _keep_last_frame(session, contents, raw=False):
+    # Raw frames are megabytes each, too much to hold per session: no debug.jpg for those
+    session.last_frame_jpeg = None if raw else contents
+
+@app.get("/sessions/{session_id}/debug.jpg")
+async def session_debug_image(session_id: str, width: int = Query(None, gt=0)):
+    """
+    Annotated copy of the session's last frame, rendered only when asked for.
+    """
+    session = session_store.peek(session_id)
+    if session is None or session.last_frame_jpeg is None or session.last_result is None:
+        raise HTTPException(status_code=404, detail="No frame for this session")
 
-    # 1. Check Presence
-    status, persons, phones = presence_service.detect_presence(img)
+    jpg = await executor.run("encode", _encode_session_debug, session.last_frame_jpeg, session.last_result, width)
+    if not jpg:
+        raise HTTPException(status_code=404, detail="No frame for this session")
+    return Response(content=jpg, media_type="image/jpeg")
+
+@app.get("/sessions/{session_id}/timeline")
+async def session_timeline(
+    session_id: str,
+    start: float = Query(None, description="Unix time, inclusive"),
+    end: float = Query(None, description="Unix time, exclusive"),
+    bucket: float = Query(None, gt=0, description="Aggregate into buckets of this many seconds"),
+    limit: int = Query(1000, gt=0, le=100000),
+):
+    """
+    The session's recorded frames between start and end: raw records (the
+    latest `limit`), or with ?bucket=60 per-minute mean engagement, emotions
+    and presence shares.
+    """
+    if timeline_store is None or not timeline_store.exists(session_id):
+        raise HTTPException(status_code=404, detail="No timeline for this session")
+    return await executor.run("timeline", _timeline_response, session_id, start, end, bucket, limit)
+
+def _timeline_response(session_id, start, end, bucket, limit):
+    frames = timeline_store.count(session_id, start, end)
+    response = {"session_id": session_id, "frames": frames}
+    if bucket:
+        # Summed chunk by chunk; only the per-bucket totals are held in memory
+        buckets = timeline_store.buckets(session_id, bucket, start, end)
+        response["bucket"] = bucket
+        response["truncated"] = len(buckets) > limit
+        response["buckets"] = buckets[-limit:]
+    else:
+        # Only the latest `limit` records are read from the files
+        response["truncated"] = frames > limit
+        response["records"] = to_dicts(timeline_store.query(session_id, start, end, limit))
+    return response
+
+@app.websocket("/stream")
+async def stream(websocket: WebSocket, session_id: str = None, faces: str = None, trace: str = None):
+    """
+    Long-lived alternative to polling /predict: the client sends binary JPEG
+    frames and receives one compact JSON result per frame.
+    """
+    await websocket.accept()
+    session_id = session_id or session_store.new_id()
+    multi_face = (faces or config.FACE_MODE) == "multi"
+    await websocket.send_json({"session_id": session_id})
+
+    # Frames are received independently of processing, so a client sending
+    # faster than we analyze only ever waits for its newest frame.
+    pending = LatestFrame()
+    receiver = asyncio.create_task(_receive_frames(websocket, pending))
+    try:
+        while True:
+            contents = await pending.get()
+            if contents is None:
+                break
+            dropped = pending.take_dropped()
+            STREAM_DROPPED_TOTAL.inc(amount=dropped)
+
+            # ?trace=1 traces every frame of the connection, otherwise TRACE_SAMPLE_RATE applies
+            with _request_trace("/stream", trace == "1") as frame_trace:
+                try:
+                    async with _admitted(session_id):
+                        with IN_FLIGHT.track("stream"), REQUEST_SECONDS.time("stream"):
+                            with _stage("decode"):
+                                frame = await executor.run("decode", _decode_frame, contents, frame_pool)
+                            session = session_store.get(session_id)
+                            if frame is None:
+                                await websocket.send_json({"frame": session.frame_count, "error": "Invalid image"})
+                                continue
+
+                            with _holding(frame):
+                                result = await _run_pipeline(frame, session, multi_face)
+                            _keep_last_frame(session, contents)
+                except Overloaded as e:
+                    await websocket.send_json({"error": "overloaded", "reason": e.reason, "retry_after": e.retry_after, "dropped": dropped})
+                    continue
+                except Superseded:
+                    # A newer frame for this session (another socket or /predict) took its place
+                    await websocket.send_json({"error": "superseded", "dropped": dropped})
+                    continue
+                message = {
+                    "frame": session.frame_count,
+                    "status": result.status,
+                    "analysis": result.analysis,
+                    "reused": result.reused,
+                    "dropped": dropped,
+                }
+                if result.faces is not None:
+                    message["faces"] = result.faces
+            if frame_trace is not None:
+                message["trace_id"] = frame_trace.trace_id
+            await websocket.send_json(message)
+    except WebSocketDisconnect:
+        # Also raised when sending after the client already went away
+        pass
+    except Exception:
+        logger.exception("Stream for session %s failed", session_id)
+        with contextlib.suppress(Exception):
+            await websocket.close(code=1011)
+    finally:
+        receiver.cancel()
+
+async def _receive_frames(websocket, pending):
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            contents = message.get("bytes")
+            # Text frames are keep-alives
+            if contents:
+                pending.put(contents)
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        logger.exception("Receiving stream frames failed")
+    finally:
+        pending.close()
+
+def _admitted(session_id):
+    if admission is None:
+        return contextlib.nullcontext()
+    return _admission_slot(session_id)
+
+@contextlib.asynccontextmanager
+async def _admission_slot(session_id):
+    try:
+        async with admission.slot(session_id):
+            ADMISSION_TOTAL.inc("admitted")
+            yield
+    except Overloaded as e:
+        ADMISSION_TOTAL.inc(e.reason)
+        raise
+    except Superseded:
+        ADMISSION_TOTAL.inc("superseded")
+        raise
+
+def _decode_frame(contents, pool=None):
+    return decode_frame(contents, config.FRAME_WORK_WIDTH, config.FRAME_DECODE_REDUCED, pool)
+
+async def _run_pipeline(frame, session, multi_face=False):
+    # 0. Skip the models entirely if the scene hasn't meaningfully changed
+    gate = _session_gate(session)
+    if gate is not None:
+        with _stage("gate"):
+            thumb = await executor.run("gate", gate.thumbnail, frame.work)
+        cached = gate.lookup(thumb)
+        if cached is not None:
+            session.touch()
+            result = cached.reuse()
+            _update_affect(session, result)
+            session.last_result = result
+            _record_timeline(session, result)
+            STATUS_TOTAL.inc(result.status)
+            REUSED_TOTAL.inc()
+            return result
+
+    result = await _analyze_frame(frame, session, multi_face)
+    if gate is not None:
+        gate.store(thumb, result)
+    _update_affect(session, result)
+    session.last_result = result
+    _record_timeline(session, result)
+    STATUS_TOTAL.inc(result.status)
+    return result
+
+def _record_timeline(session, result):
+    # Anonymous requests have no session to keep a history for
+    if timeline_store is not None and session.session_id is not None:
+        timeline_store.append(session.session_id, record_for(result))
+
+def _update_affect(session, result):
+    # Temporal modes (angry/confused/tired/calm/focused) need the session's history
+    if result.analysis is None or session.session_id is None:
+        return
+    if session.affect is None:
+        session.affect = AffectEngine(history=config.AFFECT_HISTORY)
+    state = session.affect.update(result.analysis["all_scores"])
+    # Copy: the analysis dict may be shared with a cached result
+    result.analysis = dict(result.analysis, affect=state)
+
+def _session_gate(session):
+    if not config.FRAME_GATE or session.session_id is None:
+        return None
+    if session.frame_gate is None:
+        session.frame_gate = FrameGate(
+            threshold=config.FRAME_GATE_THRESHOLD,
+            max_age=config.FRAME_GATE_MAX_AGE,
+        )
+    return session.frame_gate
+
+async def _analyze_frame(frame, session, multi_face=False):
+    session.touch()
+
+    # 1. Check Presence (on the working resolution; boxes are reported at full resolution)
+    with _stage("presence"):
+        status, work_persons, work_phones = await presence_batcher.submit(frame.work)
+    persons, phones = frame.boxes_to_full(work_persons), frame.boxes_to_full(work_phones)
+    session.last_status = status
+    session.last_persons = persons
+    session.last_phones = phones
 
     if status != "ok":
-        # Create debug image even if failed status
-        debug_vis = img.copy()
-        # Draw persons
-        for p in persons:
-            cv2.rectangle(debug_vis, (p[0], p[1]), (p[2], p[3]), (255, 0, 0), 2)
-        # Draw phones
-        for ph in phones:
-            cv2.rectangle(debug_vis, (ph[0], ph[1]), (ph[2], ph[3]), (0, 0, 255), 2)
-            cv2.putText(debug_vis, "PHONE", (ph[0], ph[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-
-        return _response(status, None, debug_vis)
-
-    # 2. Extract Face (Haar or Person Crop)
-    face_crop, face_coords = _extract_face(img, persons, face_cascade)
+        session.last_face_coords = None
+        return PipelineResult(status, None, persons, phones)
+
+    if multi_face:
+        return await _analyze_faces(frame, session, work_persons, persons, phones)
+
+    # 2. Extract Face (Haar or Person Crop): searched on the working copy, cut from the full image
+    tracker = _session_tracker(session)
+    with _stage("face"):
+        face_crop, face_coords, source = await executor.run(
+            "face", lambda: extract_face(frame.work, work_persons, face_locator, local_cascade(), tracker, frame.full, frame.scale))
+    FACE_SOURCE_TOTAL.inc(source)
+    session.last_face_coords = face_coords
     
     if face_crop is None or face_crop.size == 0:
-        return _response("ok", None, img)
+        return PipelineResult("ok", None, persons, phones)
 
     # 3. Predict Emotion
-    scores = emotion_service.predict(face_crop)
+    with _stage("emotion"):
+        scores = await emotion_batcher.submit(face_crop)
     if not scores:
          # Failed to predict
-         return _response("ok", None, img)
+         EMOTION_FAILURES_TOTAL.inc()
+         return PipelineResult("ok", None, persons, phones, face_coords)
     
     analysis = emotion_service.analyze(scores)
+    session.last_analysis = analysis
 
-    # 4. Debug Viz
-    debug_vis = img.copy()
-    if face_coords:
-        fx, fy, fw, fh = face_coords
-        cv2.rectangle(debug_vis, (fx, fy), (fx+fw, fy+fh), (0, 255, 0), 2)
-        if analysis:
-            cv2.putText(debug_vis, analysis['valence'], (fx, max(fy-10, 20)), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-
-    return _response("ok", analysis, debug_vis)
-
-def _extract_face(img, persons, cascade):
-    # Try Haar first
-    if cascade:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4, minSize=(30, 30))
-        if len(faces) > 0:
-            largest = max(faces, key=lambda f: f[2] * f[3])
-            x, y, w, h = largest
-            # Margin
-            mx, my = int(w*0.2), int(h*0.2)
-            x1, y1 = max(0, x-mx), max(0, y-my)
-            x2, y2 = min(img.shape[1], x+w+mx), min(img.shape[0], y+h+my)
-            return img[y1:y2, x1:x2], (x, y, w, h)
-            
-    # Fallback to Person Crop Head Estimate
-    if persons:
-        # Largest person
-        p = max(persons, key=lambda b: (b[2]-b[0])*(b[3]-b[1]))
-        px1, py1, px2, py2 = p
-        pw, ph = px2-px1, py2-py1
-        # Head estimate top 25%
-        head_h = int(ph * 0.25)
-        return img[py1:py1+head_h, px1:px2], (px1, py1, pw, head_h)
-
-    return None, None
-
-def _response(status, analysis, debug_img):
-    jpg_as_text = ""
-    if debug_img is not None:
-        _, buffer = cv2.imencode('.jpg', debug_img)
-        jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-    
+    return PipelineResult("ok", analysis, persons, phones, face_coords)
+
+async def _analyze_faces(frame, session, work_persons, persons, phones):
+    """
+    Multi-face variant of steps 2-3: every face in the frame goes through
+    one batched emotion forward instead of one call per face.
+    """
+    with _stage("face"):
+        found = await executor.run(
+            "face", lambda: extract_faces(frame.work, work_persons, face_locator, local_cascade(), frame.full, frame.scale, config.MAX_FACES))
+    for _, _, source in found:
+        FACE_SOURCE_TOTAL.inc(source)
+    if not found:
+        FACE_SOURCE_TOTAL.inc("none")
+        session.last_face_coords = None
+        return PipelineResult("ok", None, persons, phones, faces=[])
+
+    with _stage("emotion"):
+        scores = await emotion_batcher.submit_many([crop for crop, _, _ in found])
+
+    faces = []
+    for (_, coords, _), face_scores in zip(found, scores):
+        if not face_scores:
+            EMOTION_FAILURES_TOTAL.inc()
+        faces.append({"box": coords, "analysis": emotion_service.analyze(face_scores)})
+
+    # The largest face stays the primary one, so single-face clients keep working
+    primary = faces[0]
+    session.last_face_coords = primary["box"]
+    if primary["analysis"] is not None:
+        session.last_analysis = primary["analysis"]
+    return PipelineResult("ok", primary["analysis"], persons, phones, primary["box"], faces)
+
+def _session_tracker(session):
+    # Only sessions that persist between frames benefit from tracking
+    if config.FACE_TRACKING == "off" or session.session_id is None:
+        return None
+    if session.face_tracker is None:
+        session.face_tracker = FaceTracker(
+            mode=config.FACE_TRACKING,
+            redetect_every=config.FACE_REDETECT_EVERY,
+            roi_margin=config.FACE_ROI_MARGIN,
+            min_confidence=config.FACE_MIN_CONFIDENCE,
+            locator=face_locator,
+        )
+    return session.face_tracker
+
+def _encode_session_debug(contents, result, max_width=None):
+    img = decode_image(contents)
+    if img is None:
+        return b""
+    return encode_debug(img, result, max_width)
+
+def _boxes(result):
+    face = [int(v) for v in result.face_coords] if result.face_coords else None
+    return {"persons": result.persons, "phones": result.phones, "face": face}
+
+async def _respond(result, frame, mode):
+    """
+    Builds the /predict payload. Debug output is opt-in:
+    off -> nothing, boxes -> coordinates only,
+    preview -> small low-quality JPEG, full -> full-size JPEG.
+    """
+    jpg = b""
+    if mode in ("preview", "full"):
+        with _stage("encode"):
+            if mode == "preview":
+                jpg = await executor.run("encode", encode_frame_debug, frame, result, config.DEBUG_PREVIEW_WIDTH, config.DEBUG_PREVIEW_QUALITY)
+            else:
+                jpg = await executor.run("encode", encode_frame_debug, frame, result)
+
+    response = _response(result.status, result.analysis, jpg)
+    response["reused"] = result.reused
+    if result.faces is not None:
+        response["faces"] = result.faces
+    if mode != "off":
+        response["boxes"] = _boxes(result)
+    return response
+
+def _response(status, analysis, jpg):
     return {
         "status": status,
         "analysis": analysis,
-        "debug_image": f"data:image/jpeg;base64,{jpg_as_text}" if jpg_as_text else None
+        "debug_image": debug_image_url(jpg),
     }
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
-
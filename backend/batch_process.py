@@ -0,0 +1,465 @@
+"""
+Headless analysis of recorded sessions (video files or frame directories).
+
+    python batch_process.py session1.mp4 session2.mp4 --output results.csv
+    python batch_process.py recordings/frames/ --stride 5 --output results.parquet
+
+Frames flow through a pipeline of stages connected by bounded queues:
+
+    read -> decode -> presence -> face -> emotion -> write
+
+Each stage is a small pool of threads (OpenCV and torch release the GIL);
+presence and emotion collect micro-batches so one forward serves many
+frames. The services are the same ones the API uses. Rows are written in
+frame order per source, as CSV, JSONL or Parquet (needs pyarrow).
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import config
+from services.emotion import EMOTION_LABELS, EmotionService, analyze_batch
+from services.face import extract_face, local_cascade, locator_from_config
+from services.frame import frame_from_image
+from services.presence import PresenceService
+from services.registry import get_registry
+
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+COLUMNS = (
+    ["source", "frame", "time_s", "status", "persons", "phones",
+     "face_x", "face_y", "face_w", "face_h", "valence", "engagement_score", "dominant_emotion"]
+    + list(EMOTION_LABELS)
+)
+
+# Marks the end of the stream; every stage forwards it once all its workers are done
+STOP = object()
+
+
+class FrameItem:
+    def __init__(self, source, index, time_s=None, image=None, path=None):
+        self.source = source
+        self.index = index
+        self.time_s = time_s
+        self.image = image
+        self.path = path
+
+        self.frame = None
+        self.status = None
+        self.work_persons = []
+        self.persons = []
+        self.phones = []
+        self.face_coords = None
+        self.crop = None
+        self.scores = None
+        self.valence = None
+        self.engagement = None
+
+    def fail(self):
+        self.status = "error"
+        self.frame = None
+        self.crop = None
+        self.scores = None
+        self.valence = None
+        self.engagement = None
+
+    def row(self):
+        row = {
+            "source": self.source,
+            "frame": self.index,
+            "time_s": round(self.time_s, 3) if self.time_s is not None else None,
+            "status": self.status,
+            "persons": len(self.persons),
+            "phones": len(self.phones),
+            "valence": self.valence,
+            "engagement_score": self.engagement,
+            "dominant_emotion": None,
+        }
+        x, y, w, h = self.face_coords if self.face_coords else (None, None, None, None)
+        row.update(face_x=x, face_y=y, face_w=w, face_h=h)
+        for i, label in enumerate(EMOTION_LABELS):
+            row[label] = round(float(self.scores[i]), 4) if self.scores is not None else None
+        if self.scores is not None:
+            row["dominant_emotion"] = EMOTION_LABELS[int(np.argmax(self.scores))]
+        return row
+
+
+class Stage:
+    """
+    `workers` threads moving items from `inbox` to `outbox`. fn takes a list
+    of up to `batch_size` items and returns an iterable of items to forward.
+    """
+
+    def __init__(self, name, fn, inbox, outbox, workers=1, batch_size=1, batch_wait=0.005):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._live = self.workers
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def join(self):
+        for t in self._threads:
+            t.join()
+
+    def _run(self):
+        try:
+            while True:
+                batch, stopped = self._collect()
+                if batch:
+                    self._process(batch)
+                if stopped:
+                    return
+        finally:
+            # Even if a worker dies, the stages downstream (and write_ordered) must see the end
+            self._finish()
+
+    def _process(self, batch):
+        start = time.perf_counter()
+        forwarded = set()
+        failed = 0
+        try:
+            for out in self.fn(batch):
+                forwarded.add(id(out))
+                self.outbox.put(out)
+        except Exception as e:
+            # One bad frame (corrupt image, OpenCV/torch error) must not stall the run:
+            # the rest of the batch goes on marked as errors
+            print(f"{self.name}: {type(e).__name__}: {e}")
+            for item in batch:
+                if isinstance(item, FrameItem) and id(item) not in forwarded:
+                    item.fail()
+                    self.outbox.put(item)
+            failed = len(batch) - len(forwarded)
+        with self._lock:
+            self.items += len(batch)
+            self.errors += failed
+            self.busy_seconds += time.perf_counter() - start
+
+    def _collect(self):
+        item = self.inbox.get()
+        if item is STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self.inbox.get(timeout=timeout) if timeout > 0 else self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _finish(self):
+        # Let sibling workers see the end too; the last one tells the next stage
+        self.inbox.put(STOP)
+        with self._lock:
+            self._live -= 1
+            last = self._live == 0
+        if last:
+            self.outbox.put(STOP)
+
+
+# --- Stage functions -------------------------------------------------------
+
+def list_sources(paths):
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            if any(f.lower().endswith(IMAGE_EXTS) for f in os.listdir(path)):
+                sources.append(path)
+            else:
+                sources.extend(sorted(p for p in glob.glob(os.path.join(path, "*")) if p.lower().endswith(VIDEO_EXTS)))
+        else:
+            sources.append(path)
+    return sources
+
+
+def read_source(source, stride=1, durations=None):
+    """
+    Yields FrameItems for a video file (already decoded) or an image
+    directory (paths, decoded later by the decode stage).
+    """
+    if os.path.isdir(source):
+        paths = sorted(p for p in glob.glob(os.path.join(source, "*")) if p.lower().endswith(IMAGE_EXTS))
+        for i, path in enumerate(paths[::stride]):
+            yield FrameItem(source, i, path=path)
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        print(f"Could not open {source}")
+        return
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    index, emitted = 0, 0
+    try:
+        while True:
+            # grab() skips the decode of frames dropped by the stride
+            if not cap.grab():
+                break
+            if index % stride == 0:
+                ok, img = cap.retrieve()
+                if ok:
+                    yield FrameItem(source, emitted, index / fps if fps else None, image=img)
+                    emitted += 1
+            index += 1
+    finally:
+        cap.release()
+        if durations is not None and fps:
+            durations[source] = index / fps
+
+
+def make_reader(stride, durations):
+    def read(sources):
+        for source in sources:
+            yield from read_source(source, stride, durations)
+    return read
+
+
+def make_decoder(work_width):
+    def decode(items):
+        for item in items:
+            img = item.image if item.image is not None else cv2.imread(item.path)
+            item.image = None
+            if img is None:
+                item.status = "invalid"
+            else:
+                item.frame = frame_from_image(img, work_width)
+            yield item
+    return decode
+
+
+def make_presence(presence):
+    def detect(items):
+        valid = [item for item in items if item.frame is not None]
+        results = presence.detect_presence_batch([item.frame.work for item in valid]) if valid else []
+        for item, (status, persons, phones) in zip(valid, results):
+            item.status = status
+            item.work_persons = persons
+            item.persons = item.frame.boxes_to_full(persons)
+            item.phones = item.frame.boxes_to_full(phones)
+        return items
+    return detect
+
+
+def make_face(locator):
+    def extract(items):
+        cascade = local_cascade()
+        for item in items:
+            if item.status == "ok":
+                frame = item.frame
+                crop, coords, _ = extract_face(frame.work, item.work_persons, locator, cascade, None, frame.full, frame.scale)
+                if crop is not None and crop.size:
+                    item.crop = crop
+                    item.face_coords = coords
+            # Full frames are the bulk of the memory in flight; only the crop is needed from here on
+            item.frame = None
+            yield item
+    return extract
+
+
+def make_emotion(emotion):
+    def predict(items):
+        scored = [item for item in items if item.crop is not None]
+        if scored:
+            probs = emotion.predict_batch_probs([item.crop for item in scored])
+            if probs is not None:
+                batch = analyze_batch(probs)
+                for item, p, valence, engagement in zip(scored, batch.probs, batch.valence_labels(), batch.engagement.tolist()):
+                    item.scores = p
+                    item.valence = valence
+                    item.engagement = engagement
+        for item in items:
+            item.crop = None
+        return items
+    return predict
+
+
+# --- Output ----------------------------------------------------------------
+
+class CsvSink:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlSink:
+    def __init__(self, path):
+        self.file = open(path, "w")
+
+    def write(self, row):
+        self.file.write(json.dumps(row) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    def __init__(self, path, row_group=4096):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self.pa = pa
+        self.schema = pa.schema(
+            [("source", pa.string()), ("frame", pa.int64()), ("time_s", pa.float64()), ("status", pa.string()),
+             ("persons", pa.int32()), ("phones", pa.int32()),
+             ("face_x", pa.int32()), ("face_y", pa.int32()), ("face_w", pa.int32()), ("face_h", pa.int32()),
+             ("valence", pa.string()), ("engagement_score", pa.int32()), ("dominant_emotion", pa.string())]
+            + [(label, pa.float32()) for label in EMOTION_LABELS]
+        )
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.row_group = row_group
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+SINKS = {"csv": CsvSink, "jsonl": JsonlSink, "parquet": ParquetSink}
+
+
+def write_ordered(inbox, sink):
+    """
+    Writes rows in frame order per source; out-of-order frames wait in a
+    small buffer until their predecessors arrive. Returns the row count.
+    """
+    next_index = {}
+    pending = {}
+    written = 0
+    while True:
+        item = inbox.get()
+        if item is STOP:
+            break
+        pending[(item.source, item.index)] = item
+        i = next_index.get(item.source, 0)
+        while (item.source, i) in pending:
+            sink.write(pending.pop((item.source, i)).row())
+            written += 1
+            i += 1
+        next_index[item.source] = i
+    # Anything left had a gap before it (e.g. an unreadable frame); keep it anyway
+    for key in sorted(pending, key=lambda k: (k[0], k[1])):
+        sink.write(pending[key].row())
+        written += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze recorded sessions offline with the /predict pipeline.")
+    parser.add_argument("inputs", nargs="+", help="Video files, frame directories, or directories of videos")
+    parser.add_argument("--output", required=True, help="Output file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--format", choices=sorted(SINKS), help="Output format (default: from the extension)")
+    parser.add_argument("--stride", type=int, default=1, help="Analyze every Nth frame")
+    parser.add_argument("--work-width", type=int, default=config.FRAME_WORK_WIDTH)
+    parser.add_argument("--readers", type=int, default=0, help="Sources read in parallel (default: up to 4)")
+    parser.add_argument("--decoders", type=int, default=2)
+    parser.add_argument("--face-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=64)
+    args = parser.parse_args()
+
+    sources = list_sources(args.inputs)
+    if not sources:
+        print("No inputs found.")
+        return 1
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if fmt not in SINKS:
+        parser.error(f"unknown output format: {fmt}")
+
+    # Only the models this pipeline uses get registered, and so loaded
+    registry = get_registry()
+    presence = PresenceService(registry=registry, preload=False, backend=config.PRESENCE_BACKEND)
+    emotion = EmotionService(registry=registry, preload=False, backend=config.EMOTION_BACKEND, model_dir=config.MODEL_DIR)
+    if not registry.load_all(warmup=config.WARMUP_RUNS > 0, runs=config.WARMUP_RUNS):
+        print("Some models failed to load; results will be incomplete.")
+
+    source_q = queue.Queue()
+    for source in sources:
+        source_q.put(source)
+    source_q.put(STOP)
+    queues = [queue.Queue(maxsize=args.queue_size) for _ in range(5)]
+
+    durations = {}
+    stages = [
+        Stage("read", make_reader(max(1, args.stride), durations), source_q, queues[0],
+              workers=args.readers or min(4, len(sources))),
+        Stage("decode", make_decoder(args.work_width), queues[0], queues[1], workers=args.decoders),
+        Stage("presence", make_presence(presence), queues[1], queues[2], batch_size=args.batch_size),
+        Stage("face", make_face(locator_from_config(config)), queues[2], queues[3], workers=args.face_workers),
+        Stage("emotion", make_emotion(emotion), queues[3], queues[4], batch_size=args.batch_size),
+    ]
+
+    sink = SINKS[fmt](args.output)
+    start = time.perf_counter()
+    for stage in stages:
+        stage.start()
+    try:
+        written = write_ordered(queues[4], sink)
+    finally:
+        sink.close()
+    for stage in stages:
+        stage.join()
+    wall = time.perf_counter() - start
+
+    print(f"{written} frame(s) from {len(sources)} source(s) in {wall:.1f}s ({written / wall:.1f} frames/s)")
+    footage = sum(durations.values())
+    if footage:
+        print(f"{footage:.1f}s of video, {footage / wall:.1f}x real time")
+    for stage in stages:
+        # Busy time summed over a stage's workers; the busiest stage is the bottleneck
+        errors = f"  errors {stage.errors}" if stage.errors else ""
+        print(f"   {stage.name:<9} {stage.workers:>2} worker(s)  busy {stage.busy_seconds:>8.2f}s{errors}")
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+"""
+Per-stage microbenchmarks for the /predict pipeline.
+
+Each stage is timed in isolation, plus the whole chain end to end, on
+synthetic frames at several resolutions and/or recorded frames:
+
+    python benchmark.py --resolutions 320x240 640x480 1280x720 --output bench.json
+    python benchmark.py --frames recordings/ --baseline bench.json
+
+Results (p50/p95/p99 latency in ms, throughput, resident memory before and
+after each stage, and the process-wide peak) are written as JSON. With --baseline, stages whose p50 or p95 got slower than
+--threshold are reported and the exit code is 1.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+import config
+from services.debug import debug_image_url, render_debug
+from services.emotion import EmotionService
+from services.face import extract_face, local_cascade, locator_from_config
+from services.frame import BufferPool, decode_image, decode_frame, encode_jpeg, raw_frame
+from services.presence import PresenceService
+from services.registry import get_registry
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def synthetic_frame(width, height, seed=0):
+    """
+    Webcam-like frame: noisy gradient background with a bright face-sized blob.
+    """
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(40, 200, width, dtype=np.float32)[None, :, None]
+    frame = np.clip(gradient + rng.normal(0, 12, size=(height, width, 3)), 0, 255).astype(np.uint8)
+    center = (width // 2, height // 3)
+    axes = (max(8, width // 10), max(10, height // 6))
+    cv2.ellipse(frame, center, axes, 0, 0, 360, (150, 170, 200), -1)
+    return frame
+
+
+def load_frames(frames_dir, limit):
+    frames = []
+    for path in sorted(glob.glob(os.path.join(frames_dir, "*"))):
+        if path.lower().endswith(IMAGE_EXTS):
+            img = cv2.imread(path)
+            if img is not None:
+                frames.append(img)
+        if limit and len(frames) >= limit:
+            break
+    return frames
+
+
+def peak_rss_mb():
+    # High-water mark of the whole process so far, not of any one stage.
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def current_rss_mb():
+    # Resident set size right now (Linux); None where /proc isn't available
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def measure(fn, inputs, iterations, warmup):
+    rss_before = current_rss_mb()
+    for i in range(warmup):
+        fn(inputs[i % len(inputs)])
+
+    timings = np.empty(iterations, dtype=np.float64)
+    start_all = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(inputs[i % len(inputs)])
+        timings[i] = time.perf_counter() - start
+    total = time.perf_counter() - start_all
+    rss_after = current_rss_mb()
+
+    ms = timings * 1000.0
+    return {
+        "iterations": iterations,
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "throughput_per_s": round(iterations / total, 2) if total > 0 else None,
+        # What the stage (warmup included) left resident; transient peaks inside a call aren't seen
+        "rss_before_mb": round(rss_before, 1) if rss_before is not None else None,
+        "rss_after_mb": round(rss_after, 1) if rss_after is not None else None,
+        "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None,
+        "process_peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def load_services():
+    # The same presence and emotion services /predict uses, built from config
+    registry = get_registry()
+    presence = PresenceService(registry=registry, preload=False, backend=config.PRESENCE_BACKEND)
+    emotion = EmotionService(registry=registry, preload=False, backend=config.EMOTION_BACKEND, model_dir=config.MODEL_DIR)
+    return presence, emotion
+
+
+def debug_result(status, persons, phones):
+    # The PipelineResult fields render_debug reads
+    return SimpleNamespace(status=status, analysis=None, persons=persons, phones=phones, face_coords=None, faces=None)
+
+
+def build_stages(frames, presence, emotion):
+    """
+    Stage name -> (fn, inputs). Inputs are prepared up front so each stage
+    only pays for its own work.
+    """
+    locator = locator_from_config(config)
+    cascade = local_cascade()
+
+    def decode(jpg, pool=None):
+        return decode_frame(jpg, config.FRAME_WORK_WIDTH, config.FRAME_DECODE_REDUCED, pool)
+
+    def face(img, persons, cascade, **kwargs):
+        return extract_face(img, persons, locator, cascade, **kwargs)
+
+    jpegs = [encode_jpeg(f, 90) for f in frames]
+    raws = [f.tobytes() for f in frames]
+    pool = BufferPool()
+
+    def pooled(frame):
+        frame.release()
+        return frame
+    detections = [presence.detect_presence(f) for f in frames]
+
+    # Person boxes for the fallback path: YOLO's if it found someone, else a centered guess
+    persons = []
+    for f, (_, found, _) in zip(frames, detections):
+        h, w = f.shape[:2]
+        persons.append(found or [[w // 4, h // 8, 3 * w // 4, h]])
+
+    crops = []
+    for f, p in zip(frames, persons):
+        crop, _, _ = face(f, p, cascade)
+        crops.append(crop if crop is not None and crop.size else f[: f.shape[0] // 3])
+    scores = [emotion.predict(c) or {} for c in crops]
+    results = [debug_result(status, found, phones) for status, found, phones in detections]
+
+    def end_to_end(jpg):
+        frame = decode(jpg)
+        status, found, phones = presence.detect_presence(frame.work)
+        analysis = None
+        if status == "ok":
+            crop, _, _ = face(frame.work, found, cascade, full=frame.full, scale=frame.scale)
+            if crop is not None and crop.size:
+                s = emotion.predict(crop)
+                analysis = emotion.analyze(s) if s else None
+        return {"status": status, "analysis": analysis, "debug_image": None}
+
+    return {
+        "decode": (decode_image, jpegs),
+        "decode_frame": (decode, jpegs),
+        "decode_frame_pooled": (lambda jpg: pooled(decode(jpg, pool)), jpegs),
+        "raw_frame_pooled": (
+            lambda i: pooled(raw_frame(raws[i], frames[i].shape[1], frames[i].shape[0], "bgr", config.FRAME_WORK_WIDTH, pool)),
+            list(range(len(frames))),
+        ),
+        "presence": (presence.detect_presence, frames),
+        "extract_face_person_roi": (lambda i: face(frames[i], persons[i], cascade), list(range(len(frames)))),
+        "extract_face_fullframe": (lambda i: face(frames[i], [], cascade), list(range(len(frames)))),
+        "extract_face_fallback": (lambda i: face(frames[i], persons[i], None), list(range(len(frames)))),
+        "emotion_predict": (emotion.predict, crops),
+        "analyze": (emotion.analyze, scores),
+        "response_encode": (
+            lambda i: debug_image_url(encode_jpeg(render_debug(frames[i], results[i]))),
+            list(range(len(frames))),
+        ),
+        "end_to_end": (end_to_end, jpegs),
+    }
+
+
+def run(frame_sets, stages, iterations, warmup):
+    results = {}
+    presence, emotion = load_services()
+    for label, frames in frame_sets.items():
+        print(f"== {label} ({len(frames)} frame(s))")
+        try:
+            available = build_stages(frames, presence, emotion)
+        except Exception as e:
+            print(f"   skipped: {e}")
+            results[f"*@{label}"] = {"skipped": str(e)}
+            continue
+
+        for name in stages:
+            fn, inputs = available[name]
+            key = f"{name}@{label}"
+            try:
+                results[key] = measure(fn, inputs, iterations, warmup)
+            except Exception as e:
+                results[key] = {"skipped": str(e)}
+                print(f"   {name:<22} skipped: {e}")
+                continue
+            r = results[key]
+            print(f"   {name:<22} p50 {r['p50_ms']:>9.3f} ms  p95 {r['p95_ms']:>9.3f} ms  "
+                  f"p99 {r['p99_ms']:>9.3f} ms  {r['throughput_per_s']:>9} /s")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns the stages whose p50 or p95 grew by more than `threshold` (a fraction).
+    """
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base or "skipped" in current or "skipped" in base:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if base[metric] and current[metric] > base[metric] * (1 + threshold):
+                regressions.append((key, metric, base[metric], current[metric]))
+    return regressions
+
+
+def parse_resolution(value):
+    w, _, h = value.lower().partition("x")
+    return int(w), int(h)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each /predict pipeline stage.")
+    parser.add_argument("--resolutions", nargs="*", default=["320x240", "640x480", "1280x720"])
+    parser.add_argument("--frames", help="Directory of recorded frames to benchmark as well")
+    parser.add_argument("--max-frames", type=int, default=64)
+    parser.add_argument("--stages", nargs="*", help="Subset of stages (default: all)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against a previously saved results JSON")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown before flagging (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    frame_sets = {}
+    for res in args.resolutions:
+        w, h = parse_resolution(res)
+        frame_sets[f"{w}x{h}"] = [synthetic_frame(w, h, seed) for seed in range(4)]
+    if args.frames:
+        recorded = load_frames(args.frames, args.max_frames)
+        if recorded:
+            frame_sets["recorded"] = recorded
+        else:
+            print(f"No frames found in {args.frames}")
+
+    all_stages = ["decode", "decode_frame", "decode_frame_pooled", "raw_frame_pooled", "presence", "extract_face_person_roi", "extract_face_fullframe", "extract_face_fallback",
+                  "emotion_predict", "analyze", "response_encode", "end_to_end"]
+    stages = args.stages or all_stages
+    unknown = set(stages) - set(all_stages)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "presence_backend": config.PRESENCE_BACKEND,
+            "emotion_backend": config.EMOTION_BACKEND,
+            "frame_work_width": config.FRAME_WORK_WIDTH,
+            "frame_decode_reduced": config.FRAME_DECODE_REDUCED,
+        },
+        "results": run(frame_sets, stages, args.iterations, args.warmup),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+        regressions = compare(report["results"], baseline, args.threshold)
+        for key, metric, before, after in regressions:
+            print(f"REGRESSION {key} {metric}: {before:.3f} -> {after:.3f} ms")
+        if regressions:
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,157 @@
+import threading
+
 import cv2
 import numpy as np
-from sklearn.cluster import KMeans
+
+from services import tracing
+
+# Skin range in OpenCV HSV (H is 0-179); the second range catches reddish hues wrapping around 180
+SKIN_LOWER = np.array([0, 20, 50], dtype=np.uint8)
+SKIN_UPPER = np.array([25, 255, 255], dtype=np.uint8)
+SKIN_LOWER_RED = np.array([170, 20, 50], dtype=np.uint8)
+SKIN_UPPER_RED = np.array([180, 255, 255], dtype=np.uint8)
+
+
+class ColorAnalyzer:
+    """
+    Per-frame color analysis: dominant color and skin brightness.
+
+    Instead of fitting a fresh KMeans on 4096 pixels, the resized crop is
+    quantized into a 16x16x16 color histogram and a weighted k-means runs
+    over the occupied bins (typically a few hundred), seeded from the
+    heaviest bins or, with `warm=True`, from the previous call's centers.
+    Resize, HSV and mask buffers are reused between calls, so one analyzer
+    must not be shared across threads.
+    """
+
+    def __init__(self, size=64, bits=4, max_iter=10):
+        self.size = size
+        self.bits = bits
+        self.max_iter = max_iter
+
+        self._small = np.empty((size, size, 3), dtype=np.uint8)
+        self._hsv = None
+        self._mask = None
+        self._mask_red = None
+        self._centers = None
+
+    def dominant_color(self, img, k=3, warm=False):
+        """
+        BGR color of the largest of k color clusters, as ints.
+        """
+        if img is None or img.size == 0:
+            return (0, 0, 0)
+        cv2.resize(img, (self.size, self.size), dst=self._small)
+        colors, weights = self._histogram(self._small.reshape(-1, 3))
+
+        k = min(k, len(colors))
+        init = self._centers if warm and self._centers is not None and len(self._centers) == k else None
+        centers, labels = _weighted_kmeans(colors, weights, k, init, self.max_iter)
+        self._centers = centers
+
+        counts = np.bincount(labels, weights=weights, minlength=k)
+        return tuple(map(int, centers[np.argmax(counts)]))
+
+    def dominant_colors(self, crops, k=3, warm=False):
+        """
+        Batch form of dominant_color over many crops, sharing the buffers.
+        """
+        return [self.dominant_color(crop, k, warm) for crop in crops]
+
+    def skin_brightness(self, img_bgr):
+        """
+        Mean HSV value (0-255) of the skin pixels, or of the whole crop when
+        under 5% of it looks like skin.
+        """
+        hsv = self._buffer("_hsv", img_bgr.shape, 3)
+        cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV, dst=hsv)
+
+        mask = self._buffer("_mask", img_bgr.shape, 1)
+        mask_red = self._buffer("_mask_red", img_bgr.shape, 1)
+        cv2.inRange(hsv, SKIN_LOWER, SKIN_UPPER, dst=mask)
+        cv2.inRange(hsv, SKIN_LOWER_RED, SKIN_UPPER_RED, dst=mask_red)
+        cv2.bitwise_or(mask, mask_red, dst=mask)
+
+        pixel_count = img_bgr.shape[0] * img_bgr.shape[1]
+        if cv2.countNonZero(mask) < 0.05 * pixel_count:
+            # Very dark skin or bad lighting: fall back to the whole image average
+            return cv2.mean(hsv)[2]
+        return cv2.mean(hsv, mask=mask)[2]
+
+    def skin_brightness_batch(self, crops):
+        return [self.skin_brightness(crop) for crop in crops]
+
+    def _histogram(self, pixels):
+        # Pack the top `bits` of each channel into one bin index, then keep the
+        # mean color and pixel count of every occupied bin
+        shift = 8 - self.bits
+        q = (pixels >> shift).astype(np.int32)
+        idx = (q[:, 0] << (2 * self.bits)) | (q[:, 1] << self.bits) | q[:, 2]
+        n_bins = 1 << (3 * self.bits)
+
+        counts = np.bincount(idx, minlength=n_bins)
+        occupied = np.flatnonzero(counts)
+        weights = counts[occupied].astype(np.float64)
+        colors = np.empty((len(occupied), 3), dtype=np.float64)
+        for c in range(3):
+            colors[:, c] = np.bincount(idx, weights=pixels[:, c], minlength=n_bins)[occupied] / weights
+        return colors, weights
+
+    def _buffer(self, name, shape, channels):
+        shape = (shape[0], shape[1], channels) if channels > 1 else (shape[0], shape[1])
+        buf = getattr(self, name)
+        if buf is None or buf.shape != shape:
+            buf = np.empty(shape, dtype=np.uint8)
+            setattr(self, name, buf)
+        return buf
+
+
+def _weighted_kmeans(points, weights, k, init=None, max_iter=10):
+    """
+    Lloyd's k-means over weighted points. Seeds deterministically: the
+    heaviest point, then repeatedly the point with the largest
+    weight x squared distance to its nearest center.
+    """
+    if init is None:
+        centers = np.empty((k, points.shape[1]), dtype=np.float64)
+        centers[0] = points[np.argmax(weights)]
+        d2 = ((points - centers[0]) ** 2).sum(axis=1)
+        for i in range(1, k):
+            centers[i] = points[np.argmax(weights * d2)]
+            d2 = np.minimum(d2, ((points - centers[i]) ** 2).sum(axis=1))
+    else:
+        centers = np.array(init, dtype=np.float64)
+
+    labels = None
+    for _ in range(max_iter):
+        dist = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        new_labels = dist.argmin(axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        totals = np.bincount(labels, weights=weights, minlength=k)
+        for c in range(points.shape[1]):
+            sums = np.bincount(labels, weights=weights * points[:, c], minlength=k)
+            # Empty clusters keep their previous center
+            np.divide(sums, totals, out=centers[:, c], where=totals > 0)
+    return centers, labels
+
+
+_local = threading.local()
+
+
+def _analyzer():
+    analyzer = getattr(_local, "analyzer", None)
+    if analyzer is None:
+        analyzer = _local.analyzer = ColorAnalyzer()
+    return analyzer
+
 
 def dominant_color(img, k=3):
-    # resize for speed
     if img.size == 0:
         return (0, 0, 0)
-    img = cv2.resize(img, (64, 64))
-    img = img.reshape((-1, 3))
-
-    kmeans = KMeans(n_clusters=k, n_init=10)
-    labels = kmeans.fit_predict(img)
-    counts = np.bincount(labels)
-
-    dominant = kmeans.cluster_centers_[np.argmax(counts)]
-    return tuple(map(int, dominant))
+    with tracing.span("color.dominant"):
+        return _analyzer().dominant_color(img, k)
 
 def get_skin_tone_prediction(img_bgr):
     """
@@ -23,38 +160,9 @@ def get_skin_tone_prediction(img_bgr):
     if img_bgr is None or img_bgr.size == 0:
          return "Unknown", []
 
-    # 1. Use HSV Masking to Isolate Skin
-    # Convert to HSV
-    hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
-    
-    # Define skin color range in HSV
-    # These are broad ranges for human skin
-    lower_skin = np.array([0, 20, 50], dtype=np.uint8)
-    upper_skin = np.array([25, 255, 255], dtype=np.uint8)
-    
-    # Create mask
-    mask1 = cv2.inRange(hsv, lower_skin, upper_skin)
-    
-    # Check for reddish skin (hue wrapping 170-180)
-    lower_skin2 = np.array([170, 20, 50], dtype=np.uint8)
-    upper_skin2 = np.array([180, 255, 255], dtype=np.uint8)
-    mask2 = cv2.inRange(hsv, lower_skin2, upper_skin2)
-    
-    # Combine masks
-    skin_mask = cv2.add(mask1, mask2)
-    
-    # Extract skin pixels
-    # We only care about the Value channel (Brightness)
-    v_channel = hsv[:, :, 2]
-    skin_brightness_values = v_channel[skin_mask > 0]
-    
-    # Debug/Fallback: If very few skin pixels found (<5%), assume the whole crop is skin (or bad lighting)
-    pixel_count = img_bgr.shape[0] * img_bgr.shape[1]
-    if len(skin_brightness_values) < (0.05 * pixel_count):
-        avg_brightness = np.mean(v_channel) # fallback to whole image avg
-        # Maybe it's just really dark skin or weird lighting?
-    else:
-        avg_brightness = np.mean(skin_brightness_values)
+    # 1. Average brightness (HSV value) of the skin pixels
+    with tracing.span("color.skin_brightness"):
+        avg_brightness = _analyzer().skin_brightness(img_bgr)
     
     # 2. Decision Threshold
     # Range is 0-255. 
@@ -0,0 +1,167 @@
+import os
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_list(name, default=""):
+    raw = os.environ.get(name, default)
+    return [item.strip() for item in raw.split(",") if item.strip()]
+
+
+def _env_limits(name, default=""):
+    # "decode=4,encode=2" -> {"decode": 4, "encode": 2}
+    limits = {}
+    for item in _env_list(name, default):
+        stage, _, value = item.partition("=")
+        try:
+            limits[stage.strip()] = int(value)
+        except ValueError:
+            continue
+    return limits
+
+
+# Micro-batching of model forwards across concurrent /predict requests.
+# A batch is flushed once it holds BATCH_MAX_SIZE items or the oldest item
+# has waited BATCH_MAX_WAIT_MS.
+BATCH_MAX_SIZE = _env_int("BATCH_MAX_SIZE", 8)
+BATCH_MAX_WAIT_MS = _env_float("BATCH_MAX_WAIT_MS", 10.0)
+
+# Executor layer that keeps blocking OpenCV/torch work off the event loop.
+# EXECUTOR_THREADS=0 picks a size from the core count. Stages named in
+# EXECUTOR_PROCESS_STAGES (only "decode" and "encode" are process-safe) run
+# on a pool of EXECUTOR_PROCESSES workers instead of threads.
+EXECUTOR_THREADS = _env_int("EXECUTOR_THREADS", 0)
+EXECUTOR_PROCESSES = _env_int("EXECUTOR_PROCESSES", 0)
+EXECUTOR_PROCESS_STAGES = _env_list("EXECUTOR_PROCESS_STAGES", "decode,encode")
+STAGE_LIMITS = _env_limits("STAGE_LIMITS", "decode=4,face=4,encode=2")
+
+# Server-side per-client state for /stream and /predict (X-Session-Id header).
+SESSION_MAX = _env_int("SESSION_MAX", 5000)
+SESSION_TTL_SECONDS = _env_float("SESSION_TTL_SECONDS", 300.0)
+
+# Debug visualization in /predict responses: off, boxes, preview or full.
+# Requests can override it with ?debug=...
+DEBUG_MODE = os.environ.get("DEBUG_MODE", "off")
+DEBUG_PREVIEW_WIDTH = _env_int("DEBUG_PREVIEW_WIDTH", 160)
+DEBUG_PREVIEW_QUALITY = _env_int("DEBUG_PREVIEW_QUALITY", 50)
+
+# Synthetic warmup inferences per model at startup (0 disables warmup).
+WARMUP_RUNS = _env_int("WARMUP_RUNS", 2)
+
+# Inference backends: torch (eager), onnx (ONNX Runtime CPU), torchscript or
+# onnx-int8 (statically quantized ONNX; check it with quant_eval.py first).
+# Exported models are produced by export_models.py; YOLO exports sit next
+# to yolov8n.pt, emotion exports in MODEL_DIR.
+PRESENCE_BACKEND = os.environ.get("PRESENCE_BACKEND", "torch")
+EMOTION_BACKEND = os.environ.get("EMOTION_BACKEND", "torch")
+MODEL_DIR = os.environ.get("MODEL_DIR", "models")
+
+# Per-session face tracking: "roi" searches around the last face box,
+# "tracker" follows it with an OpenCV MIL tracker, "off" always scans the
+# full frame. A full-frame Haar pass still runs every FACE_REDETECT_EVERY
+# frames and whenever the face is lost.
+FACE_TRACKING = os.environ.get("FACE_TRACKING", "roi")
+FACE_REDETECT_EVERY = _env_int("FACE_REDETECT_EVERY", 15)
+FACE_ROI_MARGIN = _env_float("FACE_ROI_MARGIN", 0.5)
+FACE_MIN_CONFIDENCE = _env_float("FACE_MIN_CONFIDENCE", 0.0)
+
+# Frame-difference gating: reuse a session's last analysis while the scene
+# is unchanged. Threshold is the mean abs difference of 32x24 grayscale
+# thumbnails (0-255); cached results are never older than FRAME_GATE_MAX_AGE s.
+FRAME_GATE = _env_int("FRAME_GATE", 1)
+FRAME_GATE_THRESHOLD = _env_float("FRAME_GATE_THRESHOLD", 3.0)
+FRAME_GATE_MAX_AGE = _env_float("FRAME_GATE_MAX_AGE", 3.0)
+
+# Frames of emotion history kept per session by the affect-state engine.
+AFFECT_HISTORY = _env_int("AFFECT_HISTORY", 20)
+
+# Multi-resolution frames: presence detection, the Haar search and the frame
+# gate run on a copy at most FRAME_WORK_WIDTH px wide (0 keeps the client's
+# resolution), while face crops are still cut from the full-size image.
+# FRAME_DECODE_REDUCED=1 decodes JPEGs straight at 1/2, 1/4 or 1/8 scale and
+# decodes full size only when a face crop is needed; it pays off when many
+# frames are gated, have no user, or come from high-resolution cameras.
+FRAME_WORK_WIDTH = _env_int("FRAME_WORK_WIDTH", 640)
+FRAME_DECODE_REDUCED = _env_int("FRAME_DECODE_REDUCED", 0)
+
+# Face mode: "single" analyzes the largest face, "multi" every face in the
+# frame (up to MAX_FACES) in one batched emotion forward, for shared screens
+# and classrooms. Requests can override it with ?faces=single|multi. Multi
+# mode scans the full frame each time instead of using face tracking.
+FACE_MODE = os.environ.get("FACE_MODE", "single")
+MAX_FACES = _env_int("MAX_FACES", 8)
+
+# Admission control in front of the pipeline. At most ADMISSION_MAX_ACTIVE
+# frames are analyzed at once (0 = max(executor threads, BATCH_MAX_SIZE)) and
+# at most ADMISSION_MAX_QUEUED wait; a newer frame from the same session
+# replaces its waiting one. Frames that can't start within
+# ADMISSION_DEADLINE_MS are shed with 503 + Retry-After instead of being
+# analyzed seconds late. ADMISSION=0 admits everything.
+ADMISSION = _env_int("ADMISSION", 1)
+ADMISSION_MAX_ACTIVE = _env_int("ADMISSION_MAX_ACTIVE", 0)
+ADMISSION_MAX_QUEUED = _env_int("ADMISSION_MAX_QUEUED", 32)
+ADMISSION_DEADLINE_MS = _env_float("ADMISSION_DEADLINE_MS", 1000.0)
+
+# Face search inside YOLO person boxes: only the upper FACE_SEARCH_REGION of
+# each box is scanned, for faces FACE_SIZE_MIN..FACE_SIZE_MAX times the box
+# width. FACE_DETECTOR is "haar", "yunet" (cv2.FaceDetectorYN, FACE_DETECTOR_MODEL
+# = face_detection_yunet_2023mar.onnx) or "dnn" (OpenCV's res10 SSD,
+# FACE_DETECTOR_MODEL = the .caffemodel, FACE_DETECTOR_CONFIG = deploy.prototxt).
+# A missing model file falls back to Haar. Frames without person boxes still
+# get a full-frame Haar search.
+FACE_DETECTOR = os.environ.get("FACE_DETECTOR", "haar")
+FACE_DETECTOR_MODEL = os.environ.get("FACE_DETECTOR_MODEL", os.path.join(MODEL_DIR, "face_detection_yunet_2023mar.onnx"))
+FACE_DETECTOR_CONFIG = os.environ.get("FACE_DETECTOR_CONFIG", "")
+FACE_DETECTOR_SCORE = _env_float("FACE_DETECTOR_SCORE", 0.6)
+FACE_SEARCH_REGION = _env_float("FACE_SEARCH_REGION", 0.6)
+FACE_SIZE_MIN = _env_float("FACE_SIZE_MIN", 0.15)
+FACE_SIZE_MAX = _env_float("FACE_SIZE_MAX", 0.9)
+
+# Idle frame buffers kept per resolution for working copies and raw-frame
+# color conversions, so steady-state requests don't allocate frame-sized
+# arrays (0 disables the pool).
+FRAME_POOL_SIZE = _env_int("FRAME_POOL_SIZE", 8)
+
+# Per-session emotion timelines: one fixed-width record per analyzed frame
+# of a session (X-Session-Id or /stream), appended to TIMELINE_DIR/<id>.<pid>.tl
+# in batches of TIMELINE_FLUSH_RECORDS or every TIMELINE_FLUSH_SECONDS, and
+# served by /sessions/{id}/timeline. TIMELINE=0 disables recording.
+# Timelines untouched for TIMELINE_RETENTION_HOURS are deleted, and at most
+# TIMELINE_MAX_SESSIONS are kept (least recently written go first; 0 = no cap).
+TIMELINE = _env_int("TIMELINE", 1)
+TIMELINE_DIR = os.environ.get("TIMELINE_DIR", "timelines")
+TIMELINE_FLUSH_RECORDS = _env_int("TIMELINE_FLUSH_RECORDS", 64)
+TIMELINE_FLUSH_SECONDS = _env_float("TIMELINE_FLUSH_SECONDS", 5.0)
+TIMELINE_RETENTION_HOURS = _env_float("TIMELINE_RETENTION_HOURS", 168.0)
+TIMELINE_MAX_SESSIONS = _env_int("TIMELINE_MAX_SESSIONS", 5000)
+
+# Per-request tracing: requests to /predict* with "X-Trace: 1" (TRACE_HEADER)
+# or a TRACE_SAMPLE_RATE share of all requests record nested spans with wall
+# and CPU time, served as Chrome trace JSON at /traces/{id} (the id comes
+# back in X-Trace-Id). The last TRACE_KEEP traces and the TRACE_KEEP_SLOWEST
+# slowest are kept, and also written to TRACE_DIR if set (at most
+# TRACE_DIR_MAX_FILES, oldest deleted first). TRACE_PROFILE=1 additionally
+# samples Python stacks every TRACE_PROFILE_INTERVAL_MS while a traced
+# request runs (folded stacks at /traces/{id}/stacks, slowest only).
+# Off by default; TRACING=1 turns it on.
+TRACING = _env_int("TRACING", 0)
+TRACE_HEADER = os.environ.get("TRACE_HEADER", "X-Trace")
+TRACE_SAMPLE_RATE = _env_float("TRACE_SAMPLE_RATE", 0.0)
+TRACE_KEEP = _env_int("TRACE_KEEP", 100)
+TRACE_KEEP_SLOWEST = _env_int("TRACE_KEEP_SLOWEST", 10)
+TRACE_DIR = os.environ.get("TRACE_DIR", "")
+TRACE_DIR_MAX_FILES = _env_int("TRACE_DIR_MAX_FILES", 1000)
+TRACE_PROFILE = _env_int("TRACE_PROFILE", 0)
+TRACE_PROFILE_INTERVAL_MS = _env_float("TRACE_PROFILE_INTERVAL_MS", 5.0)
@@ -1,10 +1,14 @@
-from ultralytics import YOLO
 import cv2
 import numpy as np
 
+from services.registry import get_registry
+
 class PersonDetector:
-    def __init__(self, model_path="yolov8n.pt", conf=0.5):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path="yolov8n.pt", conf=0.5, registry=None):
+        # Shares the YOLO instance with PresenceService through the registry
+        self.registry = registry or get_registry()
+        self.model_path = model_path
+        self.model = self.registry.yolo(model_path)
         self.conf = conf
 
     def detect(self, img, classes=[0], conf=None):
@@ -1,15 +1,17 @@
 import numpy as np
-from hsemotion.facial_emotions import HSEmotionRecognizer
+
+from services.registry import get_registry
+from services.emotion import analyze_scores
 
 class EmotionDetector:
-    def __init__(self, model_name='enet_b0_8_best_vgaf'):
+    def __init__(self, model_name='enet_b0_8_best_vgaf', registry=None):
         """
         Initializes the EmotionDetector with HSEmotion (ENet-B0).
+        The model instance is shared with EmotionService through the registry.
         """
-        print(f"Loading HSEmotion model: {model_name}...")
+        self.registry = registry or get_registry()
         try:
-            self.model = HSEmotionRecognizer(model_name=model_name, device='cpu')
-            print("HSEmotion model loaded.")
+            self.model = self.registry.hsemotion(model_name)
         except Exception as e:
             print(f"Error loading HSEmotion: {e}")
             self.model = None
@@ -37,47 +39,30 @@ class EmotionDetector:
             else:
                 img = np.array(image_array)
 
-            emotion, scores = self.model.predict_emotions(img, logits=False)
+            _, probs = self.model.predict_multi_emotions([np.ascontiguousarray(img)], logits=False)
             
-            # scores is a dict like {'Anger': 0.01, 'Contempt':...}
             # HSEmotion labels: Anger, Contempt, Disgust, Fear, Happiness, Neutral, Sadness, Surprise
-            
             # Normalize to lower case for consistency
-            scores = {k.lower(): v for k, v in scores.items()}
-            
-            happiness = scores.get('happiness', 0.0)
-            neutral = scores.get('neutral', 0.0)
-            surprise = scores.get('surprise', 0.0)
-            anger = scores.get('anger', 0.0)
-            sadness = scores.get('sadness', 0.0)
-            disgust = scores.get('disgust', 0.0)
-            fear = scores.get('fear', 0.0)
-            
-            # Valence and Engagement Logic
-            val_pos = happiness
-            val_neg = anger + sadness + disgust + fear
-            val_neu = neutral + surprise
-            
-            if val_pos > val_neg and val_pos > val_neu:
-                valence_label = "Positive"
-            elif val_neg > val_pos:
-                valence_label = "Negative"
-            else:
-                valence_label = "Neutral"
+            labels = [self.model.idx_to_class[i].lower() for i in range(probs.shape[1])]
+            scores = {label: float(v) for label, v in zip(labels, probs[0])}
 
-            # Engagement Score
-            engagement_raw = (happiness * 1.0) + (surprise * 0.9) + (anger * 0.8) + (fear * 0.7) + (neutral * 0.1) + (sadness * 0.2)
-            engagement_score = min(max(int(engagement_raw * 100), 0), 100)
+            # Valence and Engagement Logic, shared with EmotionService (scalar path)
+            analysis = analyze_scores(scores)
+            valence_label = analysis["valence"]
+            if valence_label not in ("Positive", "Negative"):
+                # The driver only shows the coarse label, not "Neutral-X"
+                valence_label = "Neutral"
 
+            emotions = analysis["emotions"]
             return {
                 "emotions": {
-                    "happiness": round(happiness, 4),
-                    "neutral": round(neutral, 4),
-                    "surprise": round(surprise, 4),
-                    "anger": round(anger, 4)
+                    "happiness": emotions["happiness"],
+                    "neutral": emotions["neutral"],
+                    "surprise": emotions["surprise"],
+                    "anger": emotions["anger"]
                 },
                 "valence": valence_label,
-                "engagement_score": engagement_score,
+                "engagement_score": analysis["engagement_score"],
                 "all_scores": scores
             }
 
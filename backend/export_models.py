@@ -0,0 +1,245 @@
+import argparse
+import glob
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from services.backends import (
+    EMOTION_BACKENDS,
+    TorchEmotionBackend,
+    emotion_export_module,
+    emotion_model_key,
+    load_onnx_emotion,
+    load_torchscript_emotion,
+    presence_model_path,
+    read_model_meta,
+    write_model_meta,
+)
+from services.quantization import (
+    CALIBRATION_METHODS,
+    emotion_calibration_batches,
+    presence_calibration_batches,
+    quantize_onnx,
+)
+from services.registry import get_registry
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def export_emotion(recognizer, fmt, path):
+    import torch
+
+    module = emotion_export_module(recognizer)
+    dummy = torch.zeros(1, 3, recognizer.img_size, recognizer.img_size)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    with torch.no_grad():
+        if fmt == "onnx":
+            torch.onnx.export(
+                module, dummy, path,
+                input_names=["input"], output_names=["logits"],
+                dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+                opset_version=17,
+            )
+        elif fmt == "torchscript":
+            traced = torch.jit.freeze(torch.jit.trace(module, dummy))
+            traced.save(path)
+        else:
+            raise ValueError(f"Unknown format: {fmt}")
+
+    labels = [recognizer.idx_to_class[i] for i in range(len(recognizer.idx_to_class))]
+    write_model_meta(path, labels, recognizer.img_size)
+    print(f"Exported emotion model -> {path}")
+
+
+def export_presence(model_path, fmt):
+    from ultralytics import YOLO
+
+    # Dynamic batch axis so micro-batched predicts work on the ONNX graph
+    out = YOLO(model_path).export(format=fmt, dynamic=(fmt == "onnx"))
+    print(f"Exported presence model -> {out}")
+    return out
+
+
+def calibration_faces(images):
+    """
+    Face crops to calibrate the emotion model on: the largest Haar face of
+    each image, or the whole image when there is none (face-crop datasets).
+    """
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    faces = []
+    for img in images:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        found = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4, minSize=(30, 30))
+        if len(found):
+            x, y, w, h = max(found, key=lambda f: f[2] * f[3])
+            faces.append(img[y:y + h, x:x + w])
+        else:
+            faces.append(img)
+    return faces
+
+
+def quantize_emotion(float_path, int8_path, faces, mode, method):
+    meta = read_model_meta(float_path)
+    batches = emotion_calibration_batches(faces, meta["img_size"]) if mode == "static" else None
+    quantize_onnx(float_path, int8_path, batches, method)
+    write_model_meta(int8_path, meta["labels"], meta["img_size"])
+    print(f"Quantized emotion model ({mode}) -> {int8_path}")
+
+
+def quantize_presence(model_path, frames, mode, method):
+    float_path = presence_model_path(model_path, "onnx")
+    int8_path = presence_model_path(model_path, "onnx-int8")
+    batches = presence_calibration_batches(frames) if mode == "static" else None
+    quantize_onnx(float_path, int8_path, batches, method)
+    print(f"Quantized presence model ({mode}) -> {int8_path}")
+
+
+def load_samples(samples_dir, count, seed=0):
+    """
+    Images from samples_dir, or seeded synthetic frames if none are given.
+    """
+    images = []
+    if samples_dir:
+        for path in sorted(glob.glob(os.path.join(samples_dir, "*"))):
+            if path.lower().endswith(IMAGE_EXTS):
+                img = cv2.imread(path)
+                if img is not None:
+                    images.append(img)
+    if images:
+        return images[:count] if count else images
+
+    rng = np.random.default_rng(seed)
+    for i in range(count or 16):
+        h, w = rng.integers(64, 480), rng.integers(64, 640)
+        gradient = np.linspace(0, 255, w, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 25, size=(h, w, 3))
+        images.append(np.clip(gradient + noise, 0, 255).astype(np.uint8))
+    return images
+
+
+def check_emotion(recognizer, backend, faces, tol):
+    rgb_faces = [np.ascontiguousarray(f[..., ::-1]) for f in faces]
+    ref = TorchEmotionBackend(recognizer).predict_proba(rgb_faces)
+    out = backend.predict_proba(rgb_faces)
+
+    max_diff = float(np.max(np.abs(ref - out)))
+    agree = float(np.mean(np.argmax(ref, axis=1) == np.argmax(out, axis=1)))
+    ok = max_diff <= tol
+    print(f"  emotion[{backend.name}]: max |dp| = {max_diff:.2e}, top-1 agreement = {agree:.1%} -> {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def _iou(a, b):
+    xA, yA = max(a[0], b[0]), max(a[1], b[1])
+    xB, yB = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, xB - xA) * max(0.0, yB - yA)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _detections(model, img):
+    result = model.predict(img, conf=0.3, classes=[0, 67], verbose=False)[0]
+    return [(int(b.cls[0]), [float(v) for v in b.xyxy[0]], float(b.conf[0])) for b in result.boxes]
+
+
+def check_presence(ref_model, model, frames, iou_tol, conf_tol, label):
+    matched = total = 0
+    worst_conf = 0.0
+    for img in frames:
+        ref = _detections(ref_model, img)
+        out = _detections(model, img)
+        total += len(ref)
+        for cls, box, conf in ref:
+            best = max(
+                ((_iou(box, b), c) for k, b, c in out if k == cls),
+                default=(0.0, 0.0),
+            )
+            if best[0] >= iou_tol:
+                matched += 1
+                worst_conf = max(worst_conf, abs(best[1] - conf))
+
+    if total == 0:
+        print(f"  presence[{label}]: no reference detections on these frames, pass --samples with real frames")
+        return True
+    ok = matched == total and worst_conf <= conf_tol
+    print(f"  presence[{label}]: matched {matched}/{total} boxes (IoU >= {iou_tol}), max |dconf| = {worst_conf:.3f} -> {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export presence/emotion models and check parity with eager PyTorch.")
+    parser.add_argument("--formats", nargs="+", default=["onnx", "torchscript"], choices=[b for b in EMOTION_BACKENDS if b != "torch"])
+    parser.add_argument("--presence-model", default="yolov8n.pt")
+    parser.add_argument("--emotion-model", default="enet_b0_8_best_vgaf")
+    parser.add_argument("--model-dir", default="models")
+    parser.add_argument("--skip-export", action="store_true", help="Only run the parity check on existing exports")
+    parser.add_argument("--check", action="store_true", help="Compare exported outputs against eager PyTorch")
+    parser.add_argument("--samples", help="Directory of frames / face crops used for the parity check")
+    parser.add_argument("--count", type=int, default=32)
+    parser.add_argument("--emotion-tol", type=float, default=1e-3, help="Max abs difference in emotion probabilities")
+    parser.add_argument("--iou-tol", type=float, default=0.9)
+    parser.add_argument("--conf-tol", type=float, default=0.02)
+    parser.add_argument("--calibration", help="Directory of representative frames for onnx-int8 calibration")
+    parser.add_argument("--calibration-count", type=int, default=128)
+    parser.add_argument("--quant-mode", choices=["static", "dynamic"], default="static",
+                        help="static: int8 weights and activations (calibrated); dynamic: int8 weights only")
+    parser.add_argument("--calibration-method", choices=CALIBRATION_METHODS, default="minmax")
+    args = parser.parse_args()
+
+    registry = get_registry()
+    recognizer = registry.hsemotion(args.emotion_model)
+    yolo = registry.yolo(args.presence_model)
+
+    if not args.skip_export:
+        for fmt in args.formats:
+            if fmt == "onnx-int8":
+                continue
+            _, path = emotion_model_key(fmt, args.emotion_model, args.model_dir)
+            export_emotion(recognizer, fmt, path)
+            export_presence(args.presence_model, fmt)
+
+        if "onnx-int8" in args.formats:
+            # Quantized from the float ONNX graphs, exported first if missing
+            _, float_path = emotion_model_key("onnx", args.emotion_model, args.model_dir)
+            _, int8_path = emotion_model_key("onnx-int8", args.emotion_model, args.model_dir)
+            if not os.path.exists(float_path):
+                export_emotion(recognizer, "onnx", float_path)
+            if not os.path.exists(presence_model_path(args.presence_model, "onnx")):
+                export_presence(args.presence_model, "onnx")
+
+            calibration = []
+            if args.quant_mode == "static":
+                if not args.calibration:
+                    print("Warning: calibrating on synthetic frames; pass --calibration with real frames")
+                calibration = load_samples(args.calibration, args.calibration_count)
+            quantize_emotion(float_path, int8_path, calibration_faces(calibration), args.quant_mode, args.calibration_method)
+            quantize_presence(args.presence_model, calibration, args.quant_mode, args.calibration_method)
+
+    if not args.check:
+        return 0
+
+    from ultralytics import YOLO
+
+    samples = load_samples(args.samples, args.count)
+    print(f"Parity check on {len(samples)} {'sample' if args.samples else 'synthetic'} images")
+    ok = True
+    for fmt in args.formats:
+        if fmt == "onnx-int8":
+            # Not expected to match float to these tolerances; see quant_eval.py
+            print("  onnx-int8: skipped, compare it against float with quant_eval.py")
+            continue
+        _, path = emotion_model_key(fmt, args.emotion_model, args.model_dir)
+        backend = load_onnx_emotion(path) if fmt == "onnx" else load_torchscript_emotion(path)
+        ok &= check_emotion(recognizer, backend, samples, args.emotion_tol)
+
+        exported = YOLO(presence_model_path(args.presence_model, fmt), task="detect")
+        ok &= check_presence(yolo, exported, samples, args.iou_tol, args.conf_tol, fmt)
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
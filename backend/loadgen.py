@@ -0,0 +1,282 @@
+"""
+Load generator: N simulated webcam clients posting frames to /predict.
+
+    python loadgen.py --clients 8 --fps 1 --duration 30
+    python loadgen.py --url http://localhost:8000 --sweep 1 2 4 8 16 32 --fps 2 --output load.json
+    python loadgen.py --frames recordings/ --sessions --clients 16
+
+Each client behaves like App.tsx: every 1/fps seconds it grabs the next
+frame and sends it as a multipart POST, skipping the tick if its previous
+request is still in flight (--overlap sends anyway, like the old frontend).
+Frames are synthetic webcam-like JPEGs unless --frames points at recordings;
+each client starts at a different offset into them.
+
+Without --url the app runs in-process (httpx ASGI transport, with the app's
+startup and shutdown hooks run around the whole sweep as uvicorn would, so
+models are warmed up and the timeline flusher and trace sampler run), which
+also measures the client's own overhead; point --url at a uvicorn or
+serve.py instance to size a real deployment.
+
+Per level the report has offered and achieved frames/s, p50/p95/p99
+latency, skipped ticks (client still waiting), late results (slower than
+--deadline, default one frame interval), HTTP errors, and the distribution
+of response `status` values. With --sweep the client count is stepped up
+and the knee is the last level that still keeps up: achieved >= 95% of
+offered and p99 within the deadline.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+from benchmark import load_frames, parse_resolution, synthetic_frame
+from services.frame import encode_jpeg
+
+
+class ClientStats:
+    def __init__(self):
+        self.latencies = []
+        self.sent = 0
+        self.skipped = 0
+        self.late = 0
+        self.errors = Counter()
+        self.statuses = Counter()
+
+
+async def run_client(client, index, jpegs, fps, duration, deadline, stats, session, overlap, path):
+    interval = 1.0 / fps
+    headers = {"X-Session-Id": f"loadgen-{index}"} if session else {}
+    in_flight = set()
+    frame = index * 7
+
+    async def send(jpg):
+        start = time.perf_counter()
+        try:
+            r = await client.post(path, files={"file": ("image.jpg", jpg, "image/jpeg")}, headers=headers)
+        except httpx.HTTPError as e:
+            stats.errors[type(e).__name__] += 1
+            return
+        latency = time.perf_counter() - start
+        if r.status_code != 200:
+            stats.errors[str(r.status_code)] += 1
+            return
+        stats.latencies.append(latency)
+        if latency > deadline:
+            stats.late += 1
+        body = r.json()
+        stats.statuses[body.get("status") or body.get("error") or "unknown"] += 1
+
+    # Clients don't start in lockstep, same as real browsers
+    await asyncio.sleep(interval * (index * 0.618 % 1.0))
+    next_tick = time.perf_counter()
+    end = next_tick + duration
+    while next_tick < end:
+        if in_flight and not overlap:
+            stats.skipped += 1
+        else:
+            stats.sent += 1
+            task = asyncio.create_task(send(jpegs[frame % len(jpegs)]))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        frame += 1
+        next_tick += interval
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+
+async def run_levels(make_client, serving, levels, jpegs, args):
+    # One event loop for the whole sweep: the in-process app's batchers and semaphores are bound to it
+    results = []
+    async with serving():
+        for clients in levels:
+            r = await run_level(make_client, clients, jpegs, args)
+            results.append(r)
+            print_level(r)
+    return results
+
+
+async def run_level(make_client, clients, jpegs, args):
+    stats = [ClientStats() for _ in range(clients)]
+    async with make_client() as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            run_client(client, i, jpegs, args.fps, args.duration, args.deadline, stats[i], args.sessions, args.overlap, args.path)
+            for i in range(clients)
+        ])
+        elapsed = time.perf_counter() - start
+    return summarize(clients, stats, elapsed, args)
+
+
+def summarize(clients, stats, elapsed, args):
+    latencies = np.array([l for s in stats for l in s.latencies]) * 1000.0
+    statuses, errors = Counter(), Counter()
+    for s in stats:
+        statuses.update(s.statuses)
+        errors.update(s.errors)
+    ticks = sum(s.sent + s.skipped for s in stats)
+    # Offered = ticks actually generated over the same window as achieved (start stagger and tail included)
+    offered = ticks / elapsed if elapsed > 0 else 0.0
+    achieved = len(latencies) / elapsed if elapsed > 0 else 0.0
+
+    def pct(q):
+        return round(float(np.percentile(latencies, q)), 1) if len(latencies) else None
+
+    return {
+        "clients": clients,
+        "nominal_fps": round(clients * args.fps, 2),
+        "offered_fps": round(offered, 2),
+        "achieved_fps": round(achieved, 2),
+        "sent": sum(s.sent for s in stats),
+        "completed": int(len(latencies)),
+        "skipped": sum(s.skipped for s in stats),
+        "skipped_ratio": round(sum(s.skipped for s in stats) / ticks, 4) if ticks else 0.0,
+        "late": sum(s.late for s in stats),
+        "errors": dict(errors),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(float(latencies.max()), 1) if len(latencies) else None,
+        "statuses": dict(statuses),
+    }
+
+
+def keeps_up(level, deadline_ms):
+    return (level["achieved_fps"] >= 0.95 * level["offered_fps"]
+            and level["p99_ms"] is not None and level["p99_ms"] <= deadline_ms
+            and not level["errors"])
+
+
+def print_level(r):
+    print(f"   {r['clients']:>4} clients  offered {r['offered_fps']:>7.2f}/s  achieved {r['achieved_fps']:>7.2f}/s  "
+          f"p50 {r['p50_ms']} ms  p99 {r['p99_ms']} ms  skipped {r['skipped']}  late {r['late']}  "
+          f"errors {sum(r['errors'].values())}  {r['statuses']}")
+
+
+async def wait_ready(registry, poll=0.1):
+    # The startup hook loads and warms up the models on a thread, like /readyz waits for
+    while not registry.ready:
+        errors = [m["error"] for m in registry.status()["models"].values() if m["error"]]
+        if errors:
+            raise SystemExit(f"Models failed to load: {errors[0]}")
+        await asyncio.sleep(poll)
+
+
+def client_factory(args):
+    """
+    (factory for an httpx.AsyncClient, async context manager factory that
+    keeps the server up for the run, server settings if known).
+    """
+    if args.url:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        return (lambda: httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits),
+                contextlib.nullcontext, None)
+
+    import api
+
+    @contextlib.asynccontextmanager
+    async def serving():
+        # ASGITransport sends no lifespan events: run the startup/shutdown hooks here
+        async with api.app.router.lifespan_context(api.app):
+            print("Loading models in-process...")
+            await wait_ready(api.registry)
+            yield
+
+    transport = httpx.ASGITransport(app=api.app)
+    server = {
+        "executor_threads": api.executor.threads,
+        "executor_processes": api.executor.processes,
+        "batch_max_size": api.config.BATCH_MAX_SIZE,
+        "batch_max_wait_ms": api.config.BATCH_MAX_WAIT_MS,
+        "presence_backend": api.config.PRESENCE_BACKEND,
+        "emotion_backend": api.config.EMOTION_BACKEND,
+        "admission": bool(api.config.ADMISSION),
+        "frame_gate": bool(api.config.FRAME_GATE),
+    }
+    return lambda: httpx.AsyncClient(transport=transport, base_url="http://loadgen", timeout=args.timeout), serving, server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent webcam clients against /predict.")
+    parser.add_argument("--url", help="Server base URL (default: run the app in-process)")
+    parser.add_argument("--path", default="/predict")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--sweep", type=int, nargs="*", help="Client counts to step through instead of --clients")
+    parser.add_argument("--fps", type=float, default=1.0, help="Frames per second per client (App.tsx: 1)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per level")
+    parser.add_argument("--deadline", type=float, help="Seconds after which a result counts as late (default: 1/fps)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--sessions", action="store_true", help="Send an X-Session-Id per client (App.tsx doesn't)")
+    parser.add_argument("--overlap", action="store_true", help="Send every tick even while a request is in flight")
+    parser.add_argument("--frames", help="Directory of recorded frames to replay")
+    parser.add_argument("--max-frames", type=int, default=64)
+    parser.add_argument("--resolution", default="640x480", help="Synthetic frame size")
+    parser.add_argument("--quality", type=int, default=92, help="JPEG quality (react-webcam's default is 0.92)")
+    parser.add_argument("--label", help="Describe the server configuration in the report")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+    if args.deadline is None:
+        args.deadline = 1.0 / args.fps
+
+    frames = load_frames(args.frames, args.max_frames) if args.frames else []
+    if args.frames and not frames:
+        parser.error(f"No frames found in {args.frames}")
+    if not frames:
+        w, h = parse_resolution(args.resolution)
+        frames = [synthetic_frame(w, h, seed) for seed in range(16)]
+    jpegs = [encode_jpeg(f, args.quality) for f in frames]
+
+    make_client, serving, server = client_factory(args)
+    levels = args.sweep or [args.clients]
+    print(f"Target {args.url or 'in-process'}{args.path}, {args.fps} fps per client, {args.duration}s per level, "
+          f"{len(jpegs)} frame(s) of {frames[0].shape[1]}x{frames[0].shape[0]}")
+
+    results = asyncio.run(run_levels(make_client, serving, levels, jpegs, args))
+
+    deadline_ms = args.deadline * 1000.0
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "target": args.url or "in-process",
+            "path": args.path,
+            "fps": args.fps,
+            "duration": args.duration,
+            "deadline_ms": deadline_ms,
+            "sessions": args.sessions,
+            "overlap": args.overlap,
+            "cpu_count": os.cpu_count(),
+            # Free text for what --url is running, e.g. "serve.py --workers 4 --threads 2"
+            "label": args.label,
+            "server": server,
+        },
+        "levels": results,
+    }
+
+    if len(results) > 1:
+        best = max(results, key=lambda r: r["achieved_fps"])
+        knee = None
+        for r in results:
+            if not keeps_up(r, deadline_ms):
+                break
+            knee = r
+        report["max_throughput"] = {"clients": best["clients"], "achieved_fps": best["achieved_fps"]}
+        report["knee"] = {"clients": knee["clients"], "achieved_fps": knee["achieved_fps"]} if knee else None
+        print(f"Max throughput {best['achieved_fps']}/s at {best['clients']} clients; "
+              + (f"keeps up to {knee['clients']} clients ({knee['achieved_fps']}/s)" if knee else "saturated from the first level"))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,116 +1,302 @@
+import argparse
 import cv2
 import sys
+import threading
+import time
 import numpy as np
 from detector import PersonDetector
 from emotion_detector import EmotionDetector
+from services.face import head_box
+from services.registry import get_registry
+from services.tracking import FaceTracker
 import logging
 
 # Configure basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+
+class LatestSlot:
+    """
+    Single-item handoff between threads where only the newest value matters:
+    put() overwrites whatever hasn't been picked up yet (latest frame wins),
+    wait_newer() blocks until something newer than `seq` arrives.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._value = None
+        self.seq = 0
+
+    def put(self, value):
+        with self._cond:
+            self._value = value
+            self.seq += 1
+            self._cond.notify_all()
+
+    def get(self):
+        with self._cond:
+            return self.seq, self._value
+
+    def wait_newer(self, seq, timeout=None, stop=None):
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.seq <= seq:
+                if stop is not None and stop.is_set():
+                    return seq, None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return seq, None
+                self._cond.wait(0.1 if remaining is None else min(remaining, 0.1))
+            return self.seq, self._value
+
+
+class RateCounter:
+    def __init__(self):
+        self.count = 0
+        self.start = time.monotonic()
+        self._window_count = 0
+        self._window_start = self.start
+
+    def tick(self):
+        self.count += 1
+        self._window_count += 1
+
+    def window(self):
+        # Rate since the previous call, then start a new window
+        now = time.monotonic()
+        rate = self._window_count / max(now - self._window_start, 1e-6)
+        self._window_count, self._window_start = 0, now
+        return rate
+
+    def overall(self):
+        return self.count / max(time.monotonic() - self.start, 1e-6)
+
+
+def open_source(source):
+    # "0", "1"... are camera indices, anything else a video file or stream URL
+    return cv2.VideoCapture(int(source) if source.isdigit() else source)
+
+
+def capture_loop(cap, frames, stop, rate, pace_fps=0.0):
+    """
+    Reads frames as fast as the source delivers them and publishes only the
+    newest one, so the camera buffer never backs up behind inference.
+    Video files are paced to `pace_fps` to behave like a live camera.
+    """
+    interval = 1.0 / pace_fps if pace_fps > 0 else 0.0
+    next_due = time.monotonic()
+    while not stop.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.put(frame)
+        rate.tick()
+        if interval:
+            next_due += interval
+            delay = next_due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_due = time.monotonic()
+    stop.set()
+
+
+def analyze(frame, detector, emotion_model, face_cascade, face_tracker):
+    """
+    Face (Haar, falling back to the top of the largest person box) and
+    emotion for one frame. Returns (face_coords, results) for the overlay.
+    """
+    # A. Face Detection
+    found = face_tracker.locate(frame, face_cascade)
+    faces = [found] if found is not None else []
+
+    face_crop = None
+    face_coords = None
+
+    if len(faces) > 0:
+        # Largest face
+        (x, y, w, h) = max(faces, key=lambda f: f[2] * f[3])
+
+        # Margin
+        mx, my = int(w*0.2), int(h*0.2)
+        x1 = max(0, x - mx)
+        y1 = max(0, y - my)
+        x2 = min(frame.shape[1], x + w + mx)
+        y2 = min(frame.shape[0], y + h + my)
+
+        face_crop = frame[y1:y2, x1:x2]
+        face_coords = (x, y, w, h)
+
+    # B. Fallback to Body if no face
+    else:
+        detections = detector.detect(frame, classes=[0])
+        # filter just in case
+        persons = [d[0] for d in detections if d[1] == 0]
+
+        if persons:
+             # Largest person
+            largest_person = max(persons, key=lambda p: (p[2]-p[0]) * (p[3]-p[1]))
+            hx, hy, hw, hh = head_box(largest_person)
+            face_crop = frame[hy:hy+hh, hx:hx+hw]
+            face_coords = (hx, hy, hw, hh)
+
+    # C. Predict Emotion
+    if face_crop is not None and face_crop.size > 0:
+        try:
+            results = emotion_model.detect_emotion(face_crop)
+            if "error" not in results:
+                return face_coords, results
+        except Exception as e:
+            # logging.error(f"Prediction Error: {e}")
+            pass
+    return face_coords, None
+
+
+def inference_loop(frames, overlays, stop, rate, detector, emotion_model):
+    # Haar for face
+    face_cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+    face_cascade = cv2.CascadeClassifier(face_cascade_path)
+    # Full-frame Haar only every few frames, ROI search around the last face otherwise
+    face_tracker = FaceTracker()
+
+    seq = 0
+    while not stop.is_set():
+        seq, frame = frames.wait_newer(seq, stop=stop)
+        if frame is None:
+            continue
+        face_coords, results = analyze(frame, detector, emotion_model, face_cascade, face_tracker)
+        overlays.put((seq, face_coords, results))
+        rate.tick()
+
+
+def draw_overlay(frame, face_coords, results):
+    # D. Viz
+    if face_coords is None or results is None:
+        return
+    fx, fy, fw, fh = face_coords
+    cv2.rectangle(frame, (fx, fy), (fx+fw, fy+fh), (0, 255, 0), 2)
+
+    # Valence Label
+    cv2.putText(frame, f"{results['valence']}", (fx, max(fy-10, 20)),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+    # Top Emotions
+    y_off = fy + fh + 20
+    for en, es in sorted(results['emotions'].items(), key=lambda x:x[1], reverse=True)[:2]:
+         cv2.putText(frame, f"{en}: {es:.2f}", (fx, y_off),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+         y_off += 25
+
+    # Engagement
+    cv2.putText(frame, f"Engagement: {results['engagement_score']}%", (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+
+
 def main():
     """
     Driver code to test Emotion Detection logic locally without the web backend.
+
+    Capture, inference and rendering run in separate threads: the display
+    always shows the newest camera frame with the most recent overlay, so
+    its fps is no longer capped by inference.
     """
+    parser = argparse.ArgumentParser(description="Local emotion detection driver.")
+    parser.add_argument("--source", default="0", help="Camera index or video file (default: 0)")
+    parser.add_argument("--headless", action="store_true", help="No window; just run and report fps")
+    parser.add_argument("--no-pace", action="store_true", help="Read video files as fast as possible instead of at their fps")
+    parser.add_argument("--duration", type=float, default=0, help="Stop after this many seconds (0 = until the source ends or 'q')")
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between fps reports")
+    args = parser.parse_args()
+
     print("--------------------------------------------------")
     print("Emotion Detection Driver Code")
-    print("Press 'q' to quit.")
+    print("Press 'q' to quit." if not args.headless else "Headless mode, Ctrl+C to quit.")
     print("--------------------------------------------------")
 
     # 1. Initialize Detectors
     try:
         # We don't strictly one for emotion, but good for fallback body detection
         detector = PersonDetector("yolov8n.pt", conf=0.5)
-        emotion_model = EmotionDetector() 
+        emotion_model = EmotionDetector()
     except Exception as e:
         logging.error(f"Failed to initialize models: {e}")
         return
 
-    # 2. Open Camera
-    cap = cv2.VideoCapture(0)
+    # Warm up so the first camera frame isn't slowed by lazy torch init
+    registry = get_registry()
+    registry.load_all(warmup=True)
+    for name, info in registry.status()["models"].items():
+        logging.info(f"{name}: load {info['load_seconds']}s, warmup {info['warmup_seconds']}s")
+
+    # 2. Open Camera (or video file)
+    cap = open_source(args.source)
     if not cap.isOpened():
-        logging.error("Could not open webcam.")
+        logging.error(f"Could not open source {args.source}.")
         return
 
-    # Haar for face
-    face_cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-    face_cascade = cv2.CascadeClassifier(face_cascade_path)
+    pace_fps = 0.0
+    if not args.source.isdigit() and not args.no_pace:
+        pace_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    frames, overlays = LatestSlot(), LatestSlot()
+    stop = threading.Event()
+    capture_rate, inference_rate, render_rate = RateCounter(), RateCounter(), RateCounter()
 
-        # A. Face Detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-        
-        face_crop = None
-        face_coords = None
-
-        if len(faces) > 0:
-            # Largest face
-            (x, y, w, h) = max(faces, key=lambda f: f[2] * f[3])
-            
-            # Margin
-            mx, my = int(w*0.2), int(h*0.2)
-            x1 = max(0, x - mx)
-            y1 = max(0, y - my)
-            x2 = min(frame.shape[1], x + w + mx)
-            y2 = min(frame.shape[0], y + h + my)
-            
-            face_crop = frame[y1:y2, x1:x2]
-            face_coords = (x, y, w, h)
-        
-        # B. Fallback to Body if no face
-        else:
-            detections = detector.detect(frame, classes=[0])
-            # filter just in case
-            persons = [d[0] for d in detections if d[1] == 0]
-            
-            if persons:
-                 # Largest person
-                largest_person = max(persons, key=lambda p: (p[2]-p[0]) * (p[3]-p[1]))
-                px1, py1, px2, py2 = largest_person
-                phead_h = int((py2 - py1) * 0.25) # Guess head is top 25%
-                face_crop = frame[py1:py1+phead_h, px1:px2]
-                face_coords = (px1, py1, px2-px1, phead_h)
-
-        # C. Predict Emotion
-        if face_crop is not None and face_crop.size > 0:
-            try:
-                results = emotion_model.detect_emotion(face_crop)
-                
-                # D. Viz
-                fx, fy, fw, fh = face_coords
-                cv2.rectangle(frame, (fx, fy), (fx+fw, fy+fh), (0, 255, 0), 2)
-                
-                # Valence Label
-                cv2.putText(frame, f"{results['valence']}", (fx, max(fy-10, 20)), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-                
-                # Top Emotions
-                y_off = fy + fh + 20
-                for en, es in sorted(results['emotions'].items(), key=lambda x:x[1], reverse=True)[:2]:
-                     cv2.putText(frame, f"{en}: {es:.2f}", (fx, y_off), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-                     y_off += 25
-                
-                # Engagement
-                cv2.putText(frame, f"Engagement: {results['engagement_score']}%", (10, 30), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-
-            except Exception as e:
-                # logging.error(f"Prediction Error: {e}") 
-                pass
-
-        cv2.imshow("Emotion Driver Test", frame)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    threads = [
+        threading.Thread(target=capture_loop, args=(cap, frames, stop, capture_rate, pace_fps), name="capture", daemon=True),
+        threading.Thread(target=inference_loop, args=(frames, overlays, stop, inference_rate, detector, emotion_model),
+                         name="inference", daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    # 3. Render on the main thread (imshow must stay there on most platforms)
+    started = time.monotonic()
+    next_report = started + args.report_every
+    shown_seq = 0
+    lag_total = 0
+    try:
+        while not stop.is_set():
+            shown_seq, frame = frames.wait_newer(shown_seq, timeout=0.5, stop=stop)
+            if frame is None:
+                continue
+            overlay_seq, overlay = overlays.get()
+            if overlay is not None:
+                # How many frames old the overlay is when it's shown
+                lag_total += shown_seq - overlay[0]
+
+            if not args.headless:
+                # Draw on a copy: the inference thread may still be reading this frame
+                vis = frame.copy()
+                if overlay is not None:
+                    draw_overlay(vis, overlay[1], overlay[2])
+                cv2.imshow("Emotion Driver Test", vis)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+            render_rate.tick()
+
+            now = time.monotonic()
+            if now >= next_report:
+                logging.info(f"capture {capture_rate.window():.1f} fps | inference {inference_rate.window():.1f} fps | "
+                             f"render {render_rate.window():.1f} fps")
+                next_report = now + args.report_every
+            if args.duration and now - started >= args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for t in threads:
+            t.join(timeout=2.0)
+        cap.release()
+        if not args.headless:
+            cv2.destroyAllWindows()
 
-    cap.release()
-    cv2.destroyAllWindows()
+    logging.info(f"Captured {capture_rate.count} frames ({capture_rate.overall():.1f} fps), "
+                 f"analyzed {inference_rate.count} ({inference_rate.overall():.1f} fps), "
+                 f"rendered {render_rate.count} ({render_rate.overall():.1f} fps); "
+                 f"{capture_rate.count - inference_rate.count} frames skipped by inference, "
+                 f"overlay lag {lag_total / max(render_rate.count, 1):.1f} frames on average")
 
 if __name__ == "__main__":
     main()
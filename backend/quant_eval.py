@@ -0,0 +1,243 @@
+"""
+Accuracy check of the quantized (onnx-int8) models against float.
+
+    python quant_eval.py --frames samples/frames --faces samples/faces
+    python quant_eval.py --frames samples/frames --labels samples/labels.json --output quant_report.json
+
+The same frames and face crops go through the reference backend (torch by
+default) and onnx-int8, and the report covers:
+
+  - emotion: valence label agreement, top-1 emotion agreement and
+    engagement-score drift (crops from --faces plus faces cut from --frames)
+  - presence: person/phone recall of the quantized detector against the
+    reference (or against labeled boxes), and presence-status agreement
+  - mean latency of both backends
+
+--labels is optional JSON keyed by file name:
+    {"frame_001.jpg": {"persons": [[x1, y1, x2, y2]], "phones": [], "valence": "Positive"}}
+With labels, both backends are also scored against them.
+
+Exit code 1 if a metric is outside --min-valence-agreement,
+--max-engagement-drift or --min-recall.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import config
+from export_models import _iou
+from services.emotion import EmotionService, analyze_batch
+from services.face import extract_face, local_cascade, locator_from_config
+from services.presence import PresenceService
+from services.registry import get_registry
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_images(directory, limit=0):
+    items = []
+    if not directory:
+        return items
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        if path.lower().endswith(IMAGE_EXTS):
+            img = cv2.imread(path)
+            if img is not None:
+                items.append((os.path.basename(path), img))
+        if limit and len(items) >= limit:
+            break
+    return items
+
+
+def coarse(label):
+    # "Neutral-Happy" and friends count as Neutral
+    return label.split("-")[0]
+
+
+def run_emotion(service, crops, batch_size=16):
+    probs = []
+    start = time.perf_counter()
+    for i in range(0, len(crops), batch_size):
+        batch = service.predict_batch_probs(crops[i:i + batch_size])
+        if batch is None:
+            raise RuntimeError(f"{service.backend_name} emotion model failed to score a batch")
+        probs.append(batch)
+    seconds = time.perf_counter() - start
+    return analyze_batch(np.concatenate(probs)), seconds
+
+
+def compare_emotion(ref, quant, names, labels):
+    ref_valence, q_valence = ref.valence_labels(), quant.valence_labels()
+    drift = np.abs(ref.engagement.astype(np.int32) - quant.engagement.astype(np.int32))
+    report = {
+        "crops": len(names),
+        "valence_agreement": float(np.mean([a == b for a, b in zip(ref_valence, q_valence)])),
+        "coarse_valence_agreement": float(np.mean([coarse(a) == coarse(b) for a, b in zip(ref_valence, q_valence)])),
+        "top1_agreement": float(np.mean(ref.probs.argmax(axis=1) == quant.probs.argmax(axis=1))),
+        "max_prob_diff": float(np.max(np.abs(ref.probs - quant.probs))),
+        "engagement_drift_mean": float(drift.mean()),
+        "engagement_drift_p95": float(np.percentile(drift, 95)),
+        "engagement_drift_max": int(drift.max()),
+    }
+
+    truth = [(i, labels[n]["valence"]) for i, n in enumerate(names) if "valence" in labels.get(n, {})]
+    if truth:
+        for key, valence in (("reference", ref_valence), ("quantized", q_valence)):
+            report[f"{key}_valence_accuracy"] = float(np.mean([coarse(valence[i]) == coarse(v) for i, v in truth]))
+        report["labeled_crops"] = len(truth)
+    return report
+
+
+def recall(truth_boxes, found_boxes, iou=0.5):
+    matched, used = 0, set()
+    for box in truth_boxes:
+        best, best_j = 0.0, None
+        for j, other in enumerate(found_boxes):
+            if j not in used:
+                overlap = _iou(box, other)
+                if overlap > best:
+                    best, best_j = overlap, j
+        if best >= iou:
+            matched += 1
+            used.add(best_j)
+    return matched, len(truth_boxes)
+
+
+def compare_presence(frames, ref_service, quant_service, labels, iou):
+    counts = {"person": [0, 0], "phone": [0, 0]}
+    labeled = {"reference": {"person": [0, 0], "phone": [0, 0]}, "quantized": {"person": [0, 0], "phone": [0, 0]}}
+    status_agree = 0
+    ref_results, timings = [], {"reference": 0.0, "quantized": 0.0}
+
+    for name, img in frames:
+        start = time.perf_counter()
+        ref = ref_service.detect_presence(img)
+        timings["reference"] += time.perf_counter() - start
+        start = time.perf_counter()
+        quant = quant_service.detect_presence(img)
+        timings["quantized"] += time.perf_counter() - start
+        ref_results.append(ref)
+
+        status_agree += ref[0] == quant[0]
+        for cls, idx in (("person", 1), ("phone", 2)):
+            m, t = recall(ref[idx], quant[idx], iou)
+            counts[cls][0] += m
+            counts[cls][1] += t
+
+        truth = labels.get(name, {})
+        for key, result in (("reference", ref), ("quantized", quant)):
+            for cls, idx in (("person", 1), ("phone", 2)):
+                if f"{cls}s" in truth:
+                    m, t = recall(truth[f"{cls}s"], result[idx], iou)
+                    labeled[key][cls][0] += m
+                    labeled[key][cls][1] += t
+
+    report = {"frames": len(frames), "status_agreement": status_agree / len(frames) if frames else None}
+    for cls, (m, t) in counts.items():
+        report[f"{cls}_recall"] = m / t if t else None
+        report[f"{cls}_reference_boxes"] = t
+    for key, per_class in labeled.items():
+        for cls, (m, t) in per_class.items():
+            if t:
+                report[f"{key}_{cls}_recall_vs_labels"] = m / t
+    return report, ref_results, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare onnx-int8 models against float on a local sample set.")
+    parser.add_argument("--frames", help="Directory of full frames (presence + faces cut from them)")
+    parser.add_argument("--faces", help="Directory of face crops (emotion only)")
+    parser.add_argument("--labels", help="Optional labels JSON keyed by file name")
+    parser.add_argument("--reference", default="torch", choices=["torch", "onnx", "torchscript"])
+    parser.add_argument("--presence-model", default="yolov8n.pt")
+    parser.add_argument("--emotion-model", default="enet_b0_8_best_vgaf")
+    parser.add_argument("--model-dir", default=config.MODEL_DIR)
+    parser.add_argument("--limit", type=int, default=0, help="Max images per directory")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU for a detection to count as recalled")
+    parser.add_argument("--min-valence-agreement", type=float, default=0.95)
+    parser.add_argument("--max-engagement-drift", type=float, default=3.0, help="Mean absolute drift, in score points")
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    frames = load_images(args.frames, args.limit)
+    faces = load_images(args.faces, args.limit)
+    if not frames and not faces:
+        parser.error("pass --frames and/or --faces with some images")
+    labels = {}
+    if args.labels:
+        with open(args.labels) as f:
+            labels = json.load(f)
+
+    registry = get_registry()
+    services = {}
+    for key, backend in (("reference", args.reference), ("quantized", "onnx-int8")):
+        services[key] = (
+            PresenceService(args.presence_model, registry=registry, backend=backend),
+            EmotionService(args.emotion_model, registry=registry, backend=backend, model_dir=args.model_dir),
+        )
+    # Warm everything up so the first batch doesn't skew the latency numbers
+    registry.load_all(warmup=True)
+
+    report = {"reference": args.reference, "quantized": "onnx-int8"}
+    failures = []
+
+    crops, names = [img for _, img in faces], [name for name, _ in faces]
+    if frames:
+        presence, ref_results, timings = compare_presence(frames, services["reference"][0], services["quantized"][0], labels, args.iou)
+        presence["reference_ms"] = round(timings["reference"] / len(frames) * 1000, 2)
+        presence["quantized_ms"] = round(timings["quantized"] / len(frames) * 1000, 2)
+        report["presence"] = presence
+        for cls in ("person", "phone"):
+            value = presence[f"{cls}_recall"]
+            if value is not None and value < args.min_recall:
+                failures.append(f"{cls} recall {value:.3f} < {args.min_recall}")
+
+        # Faces are cut using the reference detections, so both emotion models see identical crops
+        locator, cascade = locator_from_config(config), local_cascade()
+        for (name, img), (status, persons, _) in zip(frames, ref_results):
+            if status != "ok":
+                continue
+            crop, _, _ = extract_face(img, persons, locator, cascade)
+            if crop is not None and crop.size:
+                crops.append(crop)
+                names.append(name)
+
+    if crops:
+        ref, ref_s = run_emotion(services["reference"][1], crops)
+        quant, quant_s = run_emotion(services["quantized"][1], crops)
+        emotion = compare_emotion(ref, quant, names, labels)
+        emotion["reference_ms_per_crop"] = round(ref_s / len(crops) * 1000, 3)
+        emotion["quantized_ms_per_crop"] = round(quant_s / len(crops) * 1000, 3)
+        report["emotion"] = emotion
+        if emotion["valence_agreement"] < args.min_valence_agreement:
+            failures.append(f"valence agreement {emotion['valence_agreement']:.3f} < {args.min_valence_agreement}")
+        if emotion["engagement_drift_mean"] > args.max_engagement_drift:
+            failures.append(f"engagement drift {emotion['engagement_drift_mean']:.2f} > {args.max_engagement_drift}")
+
+    report["failures"] = failures
+    for section in ("presence", "emotion"):
+        if section in report:
+            print(f"{section}:")
+            for key, value in report[section].items():
+                print(f"   {key:<34} {round(value, 4) if isinstance(value, float) else value}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        return 1
+    print("Quantized models are within limits.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
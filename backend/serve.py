@@ -0,0 +1,199 @@
+"""
+Pre-fork server for api.py.
+
+The parent imports the app and loads the model weights once, then forks
+the uvicorn workers onto one shared listening socket. Workers inherit the
+weights through copy-on-write (torch weights are additionally moved to
+shared memory), so N workers don't cost N copies of YOLO and HSEmotion:
+
+    python serve.py --workers 8 --port 8000
+    python serve.py --workers 8 --threads 4 --pin
+
+Each worker gets cores / workers intra-op threads (torch, OpenCV, ONNX
+Runtime) and, with --pin, its own slice of the CPUs. Warmup runs inside
+each worker after the fork, since torch/OpenMP thread pools started in the
+parent don't survive it.
+
+Sessions and /metrics are per worker: /stream clients stay on one worker,
+but /predict callers relying on X-Session-Id should be routed sticky.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+# Kinds whose loaders start native thread pools (ONNX Runtime sessions);
+# those are loaded in each worker instead of in the parent.
+FORK_UNSAFE_KINDS = ("emotion-onnx",)
+
+logger = logging.getLogger("serve")
+
+
+def available_cores():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def plan_workers(workers, cores, threads=0):
+    """
+    Returns (threads, cpus) per worker. Without an explicit thread count
+    the cores are split evenly; CPU slices wrap around when oversubscribed.
+    """
+    per_worker = threads or max(1, len(cores) // workers)
+    plans = []
+    for i in range(workers):
+        start = (i * per_worker) % len(cores)
+        cpus = sorted({cores[(start + j) % len(cores)] for j in range(per_worker)})
+        plans.append((per_worker, cpus))
+    return plans
+
+
+def configure_threads(threads, cpus=None):
+    """
+    Caps the intra-op threads of this process and optionally pins it to `cpus`.
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    import cv2
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before the first inter-op parallel call
+        pass
+
+
+def preload_models(registry, share_memory=True):
+    start = time.perf_counter()
+    for kind, name in registry.registered():
+        if kind in FORK_UNSAFE_KINDS:
+            continue
+        try:
+            registry.get(kind, name)
+        except Exception as e:
+            # The worker's startup warmup reports it again and keeps /readyz at 503
+            logger.error("Preload of %s model %s failed: %s", kind, name, e)
+    shared = registry.share_memory() if share_memory else 0
+    logger.info("Preloaded models in %.2fs (%d moved to shared memory)", time.perf_counter() - start, shared)
+
+
+def bind_socket(host, port, backlog):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index, threads, cpus, sock, args):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    configure_threads(threads, cpus if args.pin else None)
+
+    import uvicorn
+    import api
+
+    logger.info("Worker %d (pid %d): %d thread(s)%s", index, os.getpid(), threads,
+                f", cpus {cpus}" if args.pin else "")
+    server = uvicorn.Server(uvicorn.Config(api.app, log_level=args.log_level, lifespan="on"))
+    server.run(sockets=[sock])
+
+
+def spawn(index, plan, sock, args):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(index, *plan, sock, args)
+        except Exception:
+            logger.exception("Worker %d crashed", index)
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve api.py from pre-forked workers sharing one copy of the models.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: cores / 4)")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--pin", action="store_true", help="Pin each worker to its own slice of CPUs")
+    parser.add_argument("--no-share-memory", action="store_true", help="Rely on copy-on-write only")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    cores = available_cores()
+    workers = args.workers or max(1, len(cores) // 4)
+    plans = plan_workers(workers, cores, args.threads)
+    threads = plans[0][0]
+
+    # Read by OpenMP/MKL (torch) and ONNX Runtime when they start up, so this
+    # has to happen before the first import; the explicit env still wins.
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    os.environ.setdefault("MKL_NUM_THREADS", str(threads))
+    os.environ.setdefault("EXECUTOR_THREADS", str(threads * 2 + 4))
+
+    import api
+
+    preload_models(api.registry, share_memory=not args.no_share_memory)
+
+    sock = bind_socket(args.host, args.port, args.backlog)
+    logger.info("Listening on %s:%d with %d worker(s) x %d thread(s)", args.host, args.port, workers, threads)
+
+    # Keep the imported heap out of the cyclic GC so its collections in the
+    # workers don't touch (and un-share) every inherited object
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+    for i, plan in enumerate(plans):
+        children[spawn(i, plan, sock, args)] = i
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning("Worker %d (pid %d) exited with status %d; restarting", index, pid, os.waitstatus_to_exitcode(status))
+        time.sleep(1.0)
+        children[spawn(index, plans[index], sock, args)] = index
+
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    """
+    The frame was shed: the wait queue is full or it could not start before
+    its deadline. `retry_after` is a hint in whole seconds.
+    """
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Superseded(Exception):
+    """
+    A newer frame from the same session arrived while this one was waiting.
+    """
+
+
+class AdmissionController:
+    """
+    Bounded admission in front of the pipeline.
+
+    At most `max_active` frames run at once and at most `max_queued` wait
+    for a slot. A session has at most one waiting frame: a newer one
+    supersedes it, so a backed-up client only ever gets its latest frame
+    analyzed. Frames that can't start within `deadline` seconds are shed
+    instead of being analyzed long after the face has changed. Together
+    this bounds the latency of every admitted frame to roughly
+    deadline + one pipeline pass.
+
+    Single event loop only; the waiters are plain asyncio futures.
+    """
+
+    def __init__(self, max_active=16, max_queued=32, deadline=1.0, min_retry_after=1):
+        self.max_active = max(1, max_active)
+        self.max_queued = max(0, max_queued)
+        self.deadline = deadline
+        self.min_retry_after = min_retry_after
+
+        self.active = 0
+        # future -> session_id, in arrival order
+        self._waiters = OrderedDict()
+        self._by_session = {}
+        # Smoothed time a frame holds its slot, for Retry-After estimates
+        self._hold_seconds = 0.0
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def retry_after(self):
+        # Time for the queue ahead to drain through the active slots
+        drain = self._hold_seconds * (self.queued + 1) / self.max_active
+        return max(self.min_retry_after, math.ceil(drain))
+
+    @asynccontextmanager
+    async def slot(self, session_id=None):
+        await self.acquire(session_id)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            held = time.perf_counter() - start
+            self._hold_seconds = held if not self._hold_seconds else 0.8 * self._hold_seconds + 0.2 * held
+            self.release()
+
+    async def acquire(self, session_id=None):
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+            return
+
+        if session_id is not None:
+            older = self._by_session.pop(session_id, None)
+            if older is not None:
+                self._waiters.pop(older, None)
+                if not older.done():
+                    older.set_exception(Superseded())
+
+        if len(self._waiters) >= self.max_queued:
+            raise Overloaded("queue_full", self.retry_after())
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[fut] = session_id
+        if session_id is not None:
+            self._by_session[session_id] = fut
+
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.deadline)
+        except asyncio.TimeoutError:
+            self._forget(fut)
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                # Granted just as the deadline hit: hand the slot on
+                self.release()
+            raise Overloaded("deadline", self.retry_after())
+        except asyncio.CancelledError:
+            self._forget(fut)
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self.release()
+            raise
+        finally:
+            if not fut.done():
+                fut.cancel()
+
+    def release(self):
+        # Hand the slot straight to the oldest live waiter
+        while self._waiters:
+            fut, session_id = self._waiters.popitem(last=False)
+            if self._by_session.get(session_id) is fut:
+                del self._by_session[session_id]
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    def _forget(self, fut):
+        session_id = self._waiters.pop(fut, None)
+        if session_id is not None and self._by_session.get(session_id) is fut:
+            del self._by_session[session_id]
+
+
+class LatestFrame:
+    """
+    Per-connection mailbox for /stream: the receiver overwrites whatever
+    frame hasn't been picked up yet (latest frame wins), the processing
+    loop waits for the next one. Frames overwritten unseen are counted.
+    """
+
+    def __init__(self):
+        self._event = asyncio.Event()
+        self._value = None
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, value):
+        if self._value is not None:
+            self.dropped += 1
+        self._value = value
+        self._event.set()
+
+    def close(self):
+        self.closed = True
+        self._event.set()
+
+    async def get(self):
+        # None once the connection is closed and nothing is left
+        while self._value is None and not self.closed:
+            self._event.clear()
+            await self._event.wait()
+        value, self._value = self._value, None
+        return value
+
+    def take_dropped(self):
+        dropped, self.dropped = self.dropped, 0
+        return dropped
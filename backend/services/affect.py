@@ -0,0 +1,116 @@
+import time
+
+import numpy as np
+
+from services.emotion import (
+    EMOTION_LABELS, ANGER, FEAR, HAPPINESS, NEUTRAL, SADNESS, SURPRISE, scores_vector,
+)
+
+# Mode timers, in the priority order they are checked
+T_ANGRY, T_CONFUSED, T_TIRED, T_CALM, T_FOCUSED = range(5)
+
+
+class AffectEngine:
+    """
+    Incremental port of the frontend's useAffectState hook, one per session.
+
+    Emotion vectors go into a fixed-size ring buffer with running sums, so
+    each update is O(1) and the memory per session is fixed:
+    history x 8 float32 plus a few scalars.
+    """
+
+    def __init__(self, history=20, trend_window=5):
+        self.history = history
+        self.trend_window = min(trend_window, history)
+
+        self._ring = np.zeros((history, len(EMOTION_LABELS)), dtype=np.float32)
+        self._sum = np.zeros(len(EMOTION_LABELS), dtype=np.float64)
+        self._count = 0
+        self._pos = 0
+
+        # surprise + fear of the last `trend_window` frames
+        self._trend_sum = 0.0
+        self._timers = np.zeros(5, dtype=np.float64)
+        self._last_update = None
+
+    def __len__(self):
+        return min(self._count, self.history)
+
+    def mean(self):
+        """
+        Mean emotion vector over the history window.
+        """
+        n = len(self)
+        return (self._sum / n).astype(np.float32) if n else np.zeros_like(self._sum, dtype=np.float32)
+
+    def update(self, scores, now=None):
+        """
+        Feeds one frame (score dict or vector) and returns the derived state
+        {stress, bored, confused, confident, mode}.
+        """
+        vec = scores if isinstance(scores, np.ndarray) else scores_vector(scores)
+        now = time.monotonic() if now is None else now
+        dt = 0.0 if self._last_update is None else max(0.0, now - self._last_update)
+        self._last_update = now
+
+        happy, sad, angry = float(vec[HAPPINESS]), float(vec[SADNESS]), float(vec[ANGER])
+        fear, surprise, neutral = float(vec[FEAR]), float(vec[SURPRISE]), float(vec[NEUTRAL])
+
+        # Instantaneous derived states
+        stress = angry + fear + sad
+        confident = happy - fear
+        confusion_base = surprise + fear
+
+        self._push(vec)
+
+        # Confusion: boosted when surprise + fear rises above its recent average
+        confusion = confusion_base
+        n = len(self)
+        if n > 2:
+            window = min(n, self.trend_window)
+            if confusion_base > self._trend_sum / window + 0.1:
+                confusion += 0.2
+
+        t = self._timers
+        # Angry/Frustrated decays slowly, the others reset once the signal is lost
+        t[T_ANGRY] = t[T_ANGRY] + dt if (angry > 0.25 or stress > 0.4) else max(0.0, t[T_ANGRY] - dt)
+        t[T_TIRED] = t[T_TIRED] + dt if sad > 0.35 else max(0.0, t[T_TIRED] - dt)
+        t[T_FOCUSED] = t[T_FOCUSED] + dt if neutral > 0.5 else 0.0
+        t[T_CALM] = t[T_CALM] + dt if (happy > 0.25 or confident > 0.3) else 0.0
+        t[T_CONFUSED] = t[T_CONFUSED] + dt if confusion > 0.5 else 0.0
+
+        if t[T_ANGRY] >= 1.5:
+            mode = 'angry_frustrated'
+        elif t[T_CONFUSED] >= 1.0:
+            mode = 'confused'
+        elif t[T_TIRED] >= 2.5:
+            mode = 'tired'
+        elif t[T_CALM] >= 2.0:
+            mode = 'calm_exploratory'
+        elif t[T_FOCUSED] >= 2.0:
+            mode = 'focused'
+        else:
+            mode = 'neutral'
+
+        return {
+            "stress": round(stress, 4),
+            "bored": round(neutral, 4),
+            "confused": round(confusion, 4),
+            "confident": round(confident, 4),
+            "mode": mode,
+        }
+
+    def _push(self, vec):
+        # Drop the oldest vector from the running sums once the ring is full
+        if self._count >= self.history:
+            self._sum -= self._ring[self._pos]
+        # ... and the one leaving the confusion trend window
+        if self._count >= self.trend_window:
+            old = self._ring[(self._pos - self.trend_window) % self.history]
+            self._trend_sum -= float(old[SURPRISE]) + float(old[FEAR])
+
+        self._ring[self._pos] = vec
+        self._sum += vec
+        self._trend_sum += float(vec[SURPRISE]) + float(vec[FEAR])
+        self._pos = (self._pos + 1) % self.history
+        self._count += 1
@@ -0,0 +1,216 @@
+import json
+import os
+from abc import ABC, abstractmethod
+
+import numpy as np
+from PIL import Image
+
+# HSEmotion's 8-class label order (idx_to_class of the *_8 models)
+HSEMOTION_LABELS = ['Anger', 'Contempt', 'Disgust', 'Fear', 'Happiness', 'Neutral', 'Sadness', 'Surprise']
+
+# Same normalization as HSEmotionRecognizer.test_transforms
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+EMOTION_BACKENDS = ("torch", "onnx", "torchscript", "onnx-int8")
+
+
+def emotion_model_key(backend, model_name, model_dir="models"):
+    """
+    Registry (kind, name) for an emotion model served by `backend`.
+    Exported backends are keyed by the path of their exported file.
+    """
+    if backend == "torch":
+        return "hsemotion", model_name
+    if backend == "onnx":
+        return "emotion-onnx", os.path.join(model_dir, model_name + ".onnx")
+    if backend == "onnx-int8":
+        # Same runtime as "onnx", just the quantized graph
+        return "emotion-onnx", os.path.join(model_dir, model_name + ".int8.onnx")
+    if backend == "torchscript":
+        return "emotion-torchscript", os.path.join(model_dir, model_name + ".torchscript")
+    raise ValueError(f"Unknown emotion backend: {backend}")
+
+
+def presence_model_path(model_path, backend):
+    """
+    Ultralytics serves .pt, .onnx and .torchscript weights with the same
+    pre/post-processing, so a presence backend is just a weights file.
+    """
+    stem, _ = os.path.splitext(model_path)
+    if backend == "torch":
+        return model_path
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "onnx-int8":
+        return stem + ".int8.onnx"
+    if backend == "torchscript":
+        return stem + ".torchscript"
+    raise ValueError(f"Unknown presence backend: {backend}")
+
+
+def softmax(logits):
+    e_x = np.exp(logits - np.max(logits, axis=1, keepdims=True))
+    return e_x / e_x.sum(axis=1, keepdims=True)
+
+
+def preprocess_faces(rgb_faces, img_size=224):
+    """
+    (N, 3, img_size, img_size) network input for RGB face crops, shared by
+    every emotion backend and int8 calibration.
+    """
+    # PIL bilinear resize, as torchvision's Resize does on PIL images
+    batch = np.empty((len(rgb_faces), img_size, img_size, 3), dtype=np.float32)
+    for i, face in enumerate(rgb_faces):
+        img = Image.fromarray(np.ascontiguousarray(face)).resize((img_size, img_size), Image.BILINEAR)
+        batch[i] = np.asarray(img, dtype=np.float32)
+    batch /= 255.0
+    batch -= IMAGENET_MEAN
+    batch /= IMAGENET_STD
+    return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+
+class EmotionBackend(ABC):
+    """
+    Runs the HSEmotion classifier on RGB face crops.
+    Subclasses only implement forward(); pre- and post-processing are shared
+    so every backend returns the same (N, len(labels)) probability matrix.
+    """
+
+    name = "base"
+
+    def __init__(self, labels=None, img_size=224):
+        self.labels = list(labels or HSEMOTION_LABELS)
+        self.img_size = img_size
+
+    @property
+    def idx_to_class(self):
+        return dict(enumerate(self.labels))
+
+    def preprocess(self, rgb_faces):
+        return preprocess_faces(rgb_faces, self.img_size)
+
+    @abstractmethod
+    def forward(self, batch):
+        """
+        Logits, (N, len(labels)), for a preprocessed (N, 3, H, W) batch.
+        """
+
+    def predict_logits(self, rgb_faces):
+        return self.forward(self.preprocess(rgb_faces))
+
+    def predict_proba(self, rgb_faces):
+        return softmax(self.predict_logits(rgb_faces))
+
+
+class TorchEmotionBackend(EmotionBackend):
+    """
+    Eager PyTorch through HSEmotionRecognizer itself (the reference path).
+    """
+
+    name = "torch"
+
+    def __init__(self, recognizer):
+        labels = [recognizer.idx_to_class[i] for i in range(len(recognizer.idx_to_class))]
+        super().__init__(labels, recognizer.img_size)
+        self.recognizer = recognizer
+
+    def predict_logits(self, rgb_faces):
+        _, scores = self.recognizer.predict_multi_emotions(list(rgb_faces), logits=True)
+        return scores
+
+    def forward(self, batch):
+        import torch
+        with torch.no_grad():
+            features = self.recognizer.model(torch.from_numpy(batch)).numpy()
+        return self.recognizer.get_probab(features)
+
+
+class OnnxEmotionBackend(EmotionBackend):
+    """
+    ONNX Runtime on CPU, from a file written by export_models.py.
+    """
+
+    name = "onnx"
+
+    def __init__(self, path, labels=None, img_size=224, threads=0):
+        super().__init__(labels, img_size)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.path = path
+
+    def forward(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class TorchScriptEmotionBackend(EmotionBackend):
+    """
+    Frozen TorchScript graph, from a file written by export_models.py.
+    """
+
+    name = "torchscript"
+
+    def __init__(self, path, labels=None, img_size=224):
+        super().__init__(labels, img_size)
+        import torch
+
+        self.module = torch.jit.load(path, map_location="cpu").eval()
+        self.path = path
+
+    def forward(self, batch):
+        import torch
+        with torch.no_grad():
+            return self.module(torch.from_numpy(batch)).numpy()
+
+
+def read_model_meta(path):
+    """
+    Labels and input size saved next to an exported model (<model>.json).
+    """
+    meta_path = os.path.splitext(path)[0] + ".json"
+    if not os.path.exists(meta_path):
+        return {"labels": HSEMOTION_LABELS, "img_size": 224}
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def write_model_meta(path, labels, img_size):
+    meta_path = os.path.splitext(path)[0] + ".json"
+    with open(meta_path, "w") as f:
+        json.dump({"labels": list(labels), "img_size": int(img_size)}, f)
+
+
+def load_onnx_emotion(path):
+    meta = read_model_meta(path)
+    # ONNX Runtime sizes its intra-op pool from the core count and ignores
+    # OMP_NUM_THREADS, so honour it here (serve.py sets it per worker)
+    try:
+        threads = int(os.environ.get("OMP_NUM_THREADS", 0))
+    except ValueError:
+        threads = 0
+    return OnnxEmotionBackend(path, meta["labels"], meta["img_size"], threads=threads)
+
+
+def load_torchscript_emotion(path):
+    meta = read_model_meta(path)
+    return TorchScriptEmotionBackend(path, meta["labels"], meta["img_size"])
+
+
+def emotion_export_module(recognizer):
+    """
+    nn.Module producing HSEmotion logits from a normalized NCHW batch.
+    HSEmotionRecognizer strips the classifier from its network and applies it
+    in NumPy, so it is put back here to export a single graph.
+    """
+    import torch
+
+    classifier = torch.nn.Linear(recognizer.classifier_weights.shape[1], recognizer.classifier_weights.shape[0])
+    classifier.weight.data = torch.from_numpy(np.ascontiguousarray(recognizer.classifier_weights))
+    classifier.bias.data = torch.from_numpy(np.ascontiguousarray(recognizer.classifier_bias))
+    return torch.nn.Sequential(recognizer.model, classifier).eval()
@@ -0,0 +1,121 @@
+import asyncio
+
+from services import tracing
+
+
+class MicroBatcher:
+    """
+    Groups single items submitted by concurrent requests into one call of
+    `batch_fn(items) -> results`, so N requests share one model forward.
+
+    A batch is flushed when it reaches `max_batch_size` or when the first
+    item in it has waited `max_wait_ms`. Batches run one at a time; items
+    arriving while a forward is running simply form the next batch.
+
+    `executor` is either an InferenceExecutor (the batch runs as stage `name`)
+    or any concurrent.futures executor; None uses the loop's default pool.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=10.0, executor=None, name="batch"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.executor = executor
+        self.name = name
+
+        # Created lazily on the running loop (see _ensure_worker)
+        self._pending = []
+        self._wakeup = None
+        self._worker = None
+        self._loop = None
+
+    async def submit(self, item):
+        """
+        Queue one item and wait for its own result.
+        """
+        loop = asyncio.get_running_loop()
+        self._ensure_worker(loop)
+
+        fut = loop.create_future()
+        self._pending.append((item, fut, tracing.active()))
+        self._wakeup.set()
+        return await fut
+
+    async def submit_many(self, items):
+        return await asyncio.gather(*(self.submit(item) for item in items))
+
+    def _ensure_worker(self, loop):
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            if self._loop is not loop:
+                # Items queued on a previous (closed) loop can never be served
+                self._pending = []
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+
+            # Give concurrent requests a short window to join the batch
+            deadline = loop.time() + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self._wakeup.clear()
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if self._pending:
+                # Leftovers start the next batch straight away
+                self._wakeup.set()
+
+            # Requests that were cancelled (client went away) are not worth a forward
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                continue
+
+            await self._flush(loop, batch)
+
+    async def _flush(self, loop, batch):
+        items = [item for item, _, _ in batch]
+        # The forward works for every traced request in the batch
+        traces = tuple({trace: None for _, _, traced in batch for trace in traced})
+        token = tracing.activate(traces)
+        error = None
+        try:
+            with tracing.span(f"{self.name}.batch", cpu=False, size=len(items)):
+                if hasattr(self.executor, "run"):
+                    results = await self.executor.run(self.name, self.batch_fn, items)
+                else:
+                    results = await loop.run_in_executor(self.executor, self.batch_fn, items)
+        except Exception as e:
+            error = e
+        finally:
+            tracing.deactivate(token)
+
+        if error is not None:
+            if len(batch) > 1:
+                # Items come from unrelated requests: retry each on its own so
+                # only the submitter of a bad item sees the error
+                for entry in batch:
+                    if not entry[1].done():
+                        await self._flush(loop, [entry])
+                return
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(error)
+            return
+
+        for (_, fut, _), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
@@ -0,0 +1,73 @@
+import base64
+
+import cv2
+
+from services.frame import encode_jpeg
+
+
+def render_debug(img, result, max_width=None):
+    """
+    Draws the result's boxes on a copy of img, downscaled to max_width if given.
+    `result` is a PipelineResult (status, persons, phones, face_coords,
+    analysis, faces).
+    """
+    scale = 1.0
+    if max_width and img.shape[1] > max_width:
+        scale = max_width / img.shape[1]
+        size = (max_width, max(1, int(round(img.shape[0] * scale))))
+        debug_vis = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    elif result.status != "ok" or result.analysis is not None or result.faces:
+        debug_vis = img.copy()
+    else:
+        # Nothing to draw
+        return img
+
+    if result.status != "ok":
+        # Create debug image even if failed status
+        _draw_presence(debug_vis, _scale_boxes(result.persons, scale), _scale_boxes(result.phones, scale))
+    elif result.faces:
+        for face in result.faces:
+            _draw_face(debug_vis, _scale_boxes([face["box"]], scale)[0], face["analysis"])
+    elif result.analysis is not None:
+        _draw_face(debug_vis, _scale_boxes([result.face_coords], scale)[0], result.analysis)
+    return debug_vis
+
+
+def encode_debug(img, result, max_width=None, quality=95):
+    return encode_jpeg(render_debug(img, result, max_width), quality)
+
+
+def encode_frame_debug(frame, result, max_width=None, quality=95):
+    # Module-level so the Frame (and its lazy full decode) can go to the process pool
+    return encode_debug(frame.full, result, max_width, quality)
+
+
+def debug_image_url(jpg):
+    # The /predict "debug_image" field: a data URL, or None without an image
+    if not jpg:
+        return None
+    return "data:image/jpeg;base64," + base64.b64encode(jpg).decode("utf-8")
+
+
+def _scale_boxes(boxes, scale):
+    if scale == 1.0:
+        return boxes
+    return [[int(v * scale) for v in b] if b is not None else None for b in boxes]
+
+
+def _draw_presence(debug_vis, persons, phones):
+    # Draw persons
+    for p in persons:
+        cv2.rectangle(debug_vis, (p[0], p[1]), (p[2], p[3]), (255, 0, 0), 2)
+    # Draw phones
+    for ph in phones:
+        cv2.rectangle(debug_vis, (ph[0], ph[1]), (ph[2], ph[3]), (0, 0, 255), 2)
+        cv2.putText(debug_vis, "PHONE", (ph[0], ph[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+
+
+def _draw_face(debug_vis, face_coords, analysis):
+    if face_coords:
+        fx, fy, fw, fh = face_coords
+        cv2.rectangle(debug_vis, (fx, fy), (fx + fw, fy + fh), (0, 255, 0), 2)
+        if analysis:
+            cv2.putText(debug_vis, analysis['valence'], (fx, max(fy - 10, 20)), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
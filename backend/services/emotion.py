@@ -1,100 +1,279 @@
 import numpy as np
-from hsemotion.facial_emotions import HSEmotionRecognizer
 import os
-import torch
+
+from services import tracing
+from services.registry import get_registry
+from services.backends import HSEMOTION_LABELS, emotion_model_key, TorchEmotionBackend
+
+# HSEmotion label order, lower-cased (the keys of predict() score dicts)
+EMOTION_LABELS = tuple(label.lower() for label in HSEMOTION_LABELS)
+_IDX = {label: i for i, label in enumerate(EMOTION_LABELS)}
+ANGER, CONTEMPT, DISGUST, FEAR, HAPPINESS, NEUTRAL, SADNESS, SURPRISE = range(len(EMOTION_LABELS))
+
+# Valence codes used by analyze_batch; analyze() returns the label
+VALENCE_LABELS = ("Neutral", "Positive", "Negative", "Neutral-Happy", "Neutral-Angry", "Neutral-Sad")
+V_NEUTRAL, V_POSITIVE, V_NEGATIVE, V_NEUTRAL_HAPPY, V_NEUTRAL_ANGRY, V_NEUTRAL_SAD = range(len(VALENCE_LABELS))
+
+# Emotions reported in analysis["emotions"], in response order
+REPORTED_EMOTIONS = ("happiness", "neutral", "surprise", "anger", "sadness", "fear", "disgust")
+_REPORTED_IDX = np.array([_IDX[label] for label in REPORTED_EMOTIONS])
+
+
+def scores_vector(scores, dtype=np.float32):
+    """
+    Score dict (EmotionService.predict output) -> vector in EMOTION_LABELS order.
+    Missing labels count as 0.
+    """
+    vec = np.zeros(len(EMOTION_LABELS), dtype=dtype)
+    for label, value in scores.items():
+        i = _IDX.get(label)
+        if i is not None:
+            vec[i] = value
+    return vec
+
+
+class BatchAnalysis:
+    """
+    Compact result of analyze_batch: one row per score vector.
+    Dicts are only built by to_dicts(), at the JSON boundary.
+    """
+
+    def __init__(self, probs, valence, engagement):
+        self.probs = probs            # (N, 8) float
+        self.valence = valence        # (N,) int8 code into VALENCE_LABELS
+        self.engagement = engagement  # (N,) int16, 0-100
+
+    def __len__(self):
+        return len(self.valence)
+
+    def valence_labels(self):
+        return [VALENCE_LABELS[v] for v in self.valence.tolist()]
+
+    def to_dicts(self, all_scores=None):
+        """
+        Same shape as EmotionService.analyze(). `all_scores` optionally
+        supplies the original score dicts to echo back.
+        """
+        emotions = np.round(self.probs[:, _REPORTED_IDX], 4).tolist()
+        valence = self.valence_labels()
+        engagement = self.engagement.tolist()
+        if all_scores is None:
+            all_scores = [dict(zip(EMOTION_LABELS, row)) for row in self.probs.tolist()]
+
+        return [
+            {
+                "emotions": dict(zip(REPORTED_EMOTIONS, emotions[i])),
+                "valence": valence[i],
+                "engagement_score": engagement[i],
+                "all_scores": all_scores[i],
+            }
+            for i in range(len(self))
+        ]
+
+
+def _valence_code(happiness, neutral, surprise, anger, sadness, disgust, fear):
+    # Scalar twin of the valence rules in analyze_batch()
+    val_pos = happiness
+    val_neg = anger + sadness + disgust + fear
+    val_neu = neutral + surprise
+
+    if val_pos > val_neg and val_pos > val_neu:
+        return V_POSITIVE
+    if val_neg > val_pos:
+        return V_NEGATIVE
+
+    # If neutral dominant but secondary emotion is significant (>0.2)
+    max_non_neutral = max(happiness, anger, sadness, disgust, fear, surprise)
+    if max_non_neutral > 0.2:
+        if happiness == max_non_neutral: return V_NEUTRAL_HAPPY
+        if anger == max_non_neutral: return V_NEUTRAL_ANGRY
+        if sadness == max_non_neutral: return V_NEUTRAL_SAD
+    return V_NEUTRAL
+
+
+def analyze_scores(scores):
+    """
+    Valence and engagement for one score dict (EmotionService.predict
+    output), or None without scores.
+    """
+    if not scores:
+        return None
+
+    # Scalar path: for a single vector NumPy call overhead outweighs the work.
+    # Same rules as analyze_batch().
+    happiness = scores.get('happiness', 0.0)
+    neutral = scores.get('neutral', 0.0)
+    surprise = scores.get('surprise', 0.0)
+    anger = scores.get('anger', 0.0)
+    sadness = scores.get('sadness', 0.0)
+    disgust = scores.get('disgust', 0.0)
+    fear = scores.get('fear', 0.0)
+
+    valence = VALENCE_LABELS[_valence_code(happiness, neutral, surprise, anger, sadness, disgust, fear)]
+    engagement_raw = (happiness * 1.0) + (surprise * 0.9) + (anger * 0.8) + (fear * 0.7) + (neutral * 0.1) + (sadness * 0.2)
+    engagement_score = min(max(int(engagement_raw * 100), 0), 100)
+
+    return {
+        "emotions": {
+            "happiness": round(happiness, 4),
+            "neutral": round(neutral, 4),
+            "surprise": round(surprise, 4),
+            "anger": round(anger, 4),
+            "sadness": round(sadness, 4),
+            "fear": round(fear, 4),
+            "disgust": round(disgust, 4)
+        },
+        "valence": valence,
+        "engagement_score": engagement_score,
+        "all_scores": scores
+    }
+
+
+def analyze_batch(probs):
+    """
+    Valence, "Neutral-X" secondary class and engagement for an (N, 8) array
+    of emotion probabilities in HSEmotion label order, without Python loops.
+    """
+    p = np.asarray(probs, dtype=np.float64).reshape(-1, len(EMOTION_LABELS))
+    happiness, neutral, surprise = p[:, HAPPINESS], p[:, NEUTRAL], p[:, SURPRISE]
+    anger, sadness, disgust, fear = p[:, ANGER], p[:, SADNESS], p[:, DISGUST], p[:, FEAR]
+
+    # Valence
+    val_pos = happiness
+    val_neg = anger + sadness + disgust + fear
+    val_neu = neutral + surprise
+
+    positive = (val_pos > val_neg) & (val_pos > val_neu)
+    negative = ~positive & (val_neg > val_pos)
+
+    # Neutral dominant but a secondary emotion is significant (> 0.2): "Neutral-X"
+    max_non_neutral = np.max(p[:, [HAPPINESS, ANGER, SADNESS, DISGUST, FEAR, SURPRISE]], axis=1)
+    secondary = max_non_neutral > 0.2
+    neutral_code = np.select(
+        [secondary & (happiness == max_non_neutral),
+         secondary & (anger == max_non_neutral),
+         secondary & (sadness == max_non_neutral)],
+        [V_NEUTRAL_HAPPY, V_NEUTRAL_ANGRY, V_NEUTRAL_SAD],
+        default=V_NEUTRAL,
+    )
+    valence = np.where(positive, V_POSITIVE, np.where(negative, V_NEGATIVE, neutral_code)).astype(np.int8)
+
+    # Engagement (summed in the same order as before so scores at bucket edges don't shift)
+    engagement_raw = (happiness * 1.0) + (surprise * 0.9) + (anger * 0.8) + (fear * 0.7) + (neutral * 0.1) + (sadness * 0.2)
+    engagement = np.clip(np.trunc(engagement_raw * 100), 0, 100).astype(np.int16)
+
+    return BatchAnalysis(p, valence, engagement)
 
 class EmotionService:
-    def __init__(self, model_name='enet_b0_8_best_vgaf'):
-        self.model = None
-        self.load_model(model_name)
+    def __init__(self, model_name='enet_b0_8_best_vgaf', registry=None, preload=True, backend="torch", model_dir="models"):
+        """
+        backend: "torch" (eager HSEmotion), "onnx" or "torchscript".
+        Exported backends read <model_dir>/<model_name>.<ext> written by export_models.py.
+        """
+        self.registry = registry or get_registry()
+        self.backend_name = backend
+        self.model_dir = model_dir
+        self._backend = None
+        self.load_model(model_name, preload)
+
+    def load_model(self, model_name, preload=True):
+        self.model_name = model_name
+        self.model_key = emotion_model_key(self.backend_name, model_name, self.model_dir)
+        self.registry.register(*self.model_key)
+        if not preload:
+            return True
+        # Errors are logged and remembered by the registry; predict() then returns None
+        return self.model is not None
 
-    def load_model(self, model_name):
-        print(f"Loading HSEmotion model: {model_name}...")
+    @property
+    def model(self):
+        """
+        The registry object behind this service: an HSEmotionRecognizer for
+        the torch backend, an EmotionBackend for exported ones. None if it failed to load.
+        """
         try:
-            # Check if we can force download or handle cache issues?
-            # HSEmotion uses torch.hub.load logic internally or similar.
-            self.model = HSEmotionRecognizer(model_name=model_name, device='cpu')
-            print("HSEmotion model loaded successfully.")
-        except Exception as e:
-            print(f"Error loading HSEmotion: {e}")
-            # Fallback?
-            # If "WeightsUnpickler error", maybe delete cache?
-            # We can't easily fix it here without file access.
-            self.model = None
+            return self.registry.get(*self.model_key)
+        except Exception:
+            return None
 
-    def predict(self, face_img):
-        if self.model is None:
+    @property
+    def backend(self):
+        model = self.model
+        if model is None:
             return None
+        if self.backend_name != "torch":
+            return model
+        if self._backend is None or self._backend.recognizer is not model:
+            self._backend = TorchEmotionBackend(model)
+        return self._backend
+
+    def predict(self, face_img):
+        return self.predict_batch([face_img])[0]
+
+    def predict_batch(self, face_imgs):
+        """
+        Runs one emotion forward over a list of BGR face crops.
+        Returns one normalized score dict per crop (None if it could not be scored).
+        """
+        probs, labels = self.predict_batch_array(face_imgs)
+        if probs is None:
+            if len(face_imgs) > 1 and self.backend is not None:
+                # Crops come from unrelated requests: retry them one by one so
+                # a single bad crop doesn't cost the others their analysis
+                return [self.predict_batch([face_img])[0] for face_img in face_imgs]
+            return [None] * len(face_imgs)
+
+        # Normalize scores
+        return [{label: float(v) for label, v in zip(labels, row)} for row in probs.tolist()]
+
+    def predict_batch_array(self, face_imgs):
+        """
+        Array form of predict_batch: ((N, C) probabilities, lower-cased labels),
+        or (None, None) if the batch could not be scored.
+        """
+        backend = self.backend
+        if backend is None or not face_imgs:
+            return None, None
 
         try:
-            if isinstance(face_img, np.ndarray):
-                # Ensure RGB
-                if face_img.shape[-1] == 3:
-                     # OpenCV is BGR, Model likely wants RGB
-                     face_img = face_img[..., ::-1]
-            
-            emotion, scores = self.model.predict_emotions(face_img, logits=False)
-            
-            # Normalize scores
-            scores_norm = {k.lower(): v for k, v in scores.items()}
-            
-            return scores_norm
+            rgb_faces = []
+            for face_img in face_imgs:
+                if isinstance(face_img, np.ndarray):
+                    # Ensure RGB
+                    if face_img.shape[-1] == 3:
+                         # OpenCV is BGR, Model likely wants RGB
+                         face_img = face_img[..., ::-1]
+                    # PIL needs a contiguous buffer
+                    face_img = np.ascontiguousarray(face_img)
+                rgb_faces.append(face_img)
+
+            with tracing.span("emotion.forward", batch=len(rgb_faces), backend=self.backend_name):
+                probs = backend.predict_proba(rgb_faces)
+            return probs, [label.lower() for label in backend.labels]
         except Exception as e:
             print(f"Emotion Prediction Error: {e}")
+            return None, None
+
+    def predict_batch_probs(self, face_imgs):
+        """
+        (N, 8) probabilities in EMOTION_LABELS order, ready for analyze_batch(),
+        or None if the batch could not be scored.
+        """
+        probs, labels = self.predict_batch_array(face_imgs)
+        if probs is None:
             return None
+        if tuple(labels) != EMOTION_LABELS:
+            probs = np.stack([scores_vector(dict(zip(labels, row))) for row in probs.tolist()])
+        return probs
 
     def analyze(self, scores):
         """
-        Derive valence and engagement from raw scores.
+        Derive valence and engagement from raw scores, see analyze_scores().
         """
-        if not scores:
-            return None
+        return analyze_scores(scores)
 
-        happiness = scores.get('happiness', 0.0)
-        neutral = scores.get('neutral', 0.0)
-        surprise = scores.get('surprise', 0.0)
-        anger = scores.get('anger', 0.0)
-        sadness = scores.get('sadness', 0.0)
-        disgust = scores.get('disgust', 0.0)
-        fear = scores.get('fear', 0.0)
-        
-        # Valence
-        val_pos = happiness
-        val_neg = anger + sadness + disgust + fear
-        val_neu = neutral + surprise
-        
-        if val_pos > val_neg and val_pos > val_neu:
-            valence = "Positive"
-        elif val_neg > val_pos:
-            valence = "Negative"
-        else:
-            # If neutral dominant but secondary emotion is significant (>0.2)
-            # detect it as "Neutral+"
-            max_non_neutral = max(happiness, anger, sadness, disgust, fear, surprise)
-            if max_non_neutral > 0.2:
-                 # Check which one
-                 if happiness == max_non_neutral: valence = "Neutral-Happy"
-                 elif anger == max_non_neutral: valence = "Neutral-Angry"
-                 elif sadness == max_non_neutral: valence = "Neutral-Sad"
-                 else: valence = "Neutral"
-            else:
-                 valence = "Neutral"
-
-        # Engagement
-        engagement_raw = (happiness * 1.0) + (surprise * 0.9) + (anger * 0.8) + (fear * 0.7) + (neutral * 0.1) + (sadness * 0.2)
-        engagement_score = min(max(int(engagement_raw * 100), 0), 100)
-
-        return {
-            "emotions": {
-                "happiness": round(happiness, 4),
-                "neutral": round(neutral, 4),
-                "surprise": round(surprise, 4),
-                "anger": round(anger, 4),
-                "sadness": round(sadness, 4),
-                "fear": round(fear, 4),
-                "disgust": round(disgust, 4)
-            },
-            "valence": valence,
-            "engagement_score": engagement_score,
-            "all_scores": scores
-        }
+    def analyze_batch(self, probs):
+        """
+        Vectorized analyze() over an (N, 8) probability array, see analyze_batch().
+        """
+        return analyze_batch(probs)
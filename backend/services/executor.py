@@ -0,0 +1,93 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+
+from services import tracing
+
+
+class InferenceExecutor:
+    """
+    Runs blocking pipeline stages (decode, YOLO, Haar, HSEmotion, encode) off
+    the asyncio event loop so uvicorn keeps accepting connections meanwhile.
+
+    OpenCV and torch release the GIL, so a thread pool is the default. Stages
+    listed in `process_stages` go to a process pool instead; their functions
+    and arguments must be picklable (see services/frame.py).
+
+    `stage_limits` caps how many calls of one stage may run at once, e.g.
+    {"decode": 4, "encode": 2}. Stages without a limit only share the pool size.
+    """
+
+    def __init__(self, threads=None, processes=0, stage_limits=None, process_stages=()):
+        self.threads = threads or min(32, (os.cpu_count() or 1) + 4)
+        self.processes = max(0, processes or 0)
+        self.stage_limits = dict(stage_limits or {})
+        self.process_stages = set(process_stages) if self.processes else set()
+
+        # Pools and asyncio primitives are created lazily, so an executor can
+        # be built at import time (or before a fork) and restarted after shutdown.
+        self._thread_pool = None
+        self._process_pool = None
+        self._semaphores = {}
+
+    @property
+    def thread_pool(self):
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="inference")
+        return self._thread_pool
+
+    @property
+    def process_pool(self):
+        if self._process_pool is None and self.processes:
+            self._process_pool = ProcessPoolExecutor(max_workers=self.processes)
+        return self._process_pool
+
+    def pool_for(self, stage):
+        if stage in self.process_stages:
+            return self.process_pool
+        return self.thread_pool
+
+    async def run(self, stage, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) on the pool assigned to `stage`, honouring its concurrency limit.
+        """
+        loop = asyncio.get_running_loop()
+        call = partial(fn, *args, **kwargs) if kwargs else partial(fn, *args)
+        pool = self.pool_for(stage)
+        if stage not in self.process_stages:
+            if tracing.active():
+                call = partial(_traced, f"{stage}.run", call)
+            # Worker threads see the caller's context variables (the request's trace)
+            call = partial(contextvars.copy_context().run, call)
+
+        sem = self._semaphore(stage)
+        if sem is None:
+            return await loop.run_in_executor(pool, call)
+        async with sem:
+            return await loop.run_in_executor(pool, call)
+
+    def _semaphore(self, stage):
+        limit = self.stage_limits.get(stage)
+        if not limit:
+            return None
+        sem = self._semaphores.get(stage)
+        if sem is None:
+            sem = asyncio.Semaphore(limit)
+            self._semaphores[stage] = sem
+        return sem
+
+    def shutdown(self, wait=True):
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=wait)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait)
+            self._process_pool = None
+        self._semaphores = {}
+
+
+def _traced(name, call):
+    with tracing.span(name):
+        return call()
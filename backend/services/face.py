@@ -0,0 +1,302 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from services import tracing
+
+FACE_DETECTORS = ("haar", "yunet", "dnn")
+
+HAAR_CASCADE_PATH = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml") if hasattr(cv2, "data") else None
+
+_cascade_local = threading.local()
+
+
+class FaceLocator:
+    """
+    Finds faces inside YOLO person boxes instead of scanning the whole frame.
+
+    Only the upper `region` of each person box (padded a little, YOLO often
+    clips the top of the head) is searched, for faces between `size_range`
+    times the box width, so Haar skips most of its pyramid levels and the
+    DNN detectors run on a small, downscaled window.
+
+    Detectors:
+      - "haar": the cascade passed to locate() (the caller owns it, it is
+        not thread-safe)
+      - "yunet": cv2.FaceDetectorYN with a local ONNX model
+        (face_detection_yunet_2023mar.onnx)
+      - "dnn": OpenCV's ResNet-10 SSD face detector via cv2.dnn, from a local
+        res10_300x300_ssd_iter_140000.caffemodel + deploy.prototxt
+    A DNN detector whose model can't be loaded falls back to Haar.
+
+    Boxes are (x, y, w, h) in the coordinates of the image passed in.
+    """
+
+    def __init__(self, detector="haar", model_path=None, config_path=None, region=0.6,
+                 size_range=(0.15, 0.9), min_face=20, score_threshold=0.6, dnn_input=320):
+        self.detector = detector if detector in FACE_DETECTORS else "haar"
+        self.model_path = model_path
+        self.config_path = config_path
+        self.region = region
+        self.size_range = size_range
+        self.min_face = min_face
+        self.score_threshold = score_threshold
+        # Longest side a search window is scaled down to before a DNN forward
+        self.dnn_input = dnn_input
+
+        if self.detector != "haar" and not (model_path and os.path.exists(model_path)):
+            print(f"Face detector '{self.detector}' model not found at {model_path}; using Haar")
+            self.detector = "haar"
+        self._local = threading.local()
+
+    def locate(self, img, persons, cascade=None, max_faces=None):
+        """
+        One face per person box at most: [(box, person), ...] with box None
+        for persons where no face was found, largest person first.
+        """
+        ordered = sorted(persons, key=lambda b: (b[2] - b[0]) * (b[3] - b[1]), reverse=True)
+        if max_faces:
+            ordered = ordered[:max_faces]
+        with tracing.span("face.locate", detector=self.detector, persons=len(ordered)):
+            return [(self._search_person(img, p, cascade), p) for p in ordered]
+
+    def largest(self, img, persons, cascade=None):
+        # Face of the largest person, or None
+        found = self.locate(img, persons, cascade, max_faces=1)
+        return found[0][0] if found else None
+
+    def search_window(self, img, person):
+        # Upper part of the person box, padded by 10% of its width on the top and sides
+        px1, py1, px2, py2 = (int(v) for v in person)
+        pad = int((px2 - px1) * 0.1)
+        x1, y1 = max(0, px1 - pad), max(0, py1 - pad)
+        x2 = min(img.shape[1], px2 + pad)
+        y2 = min(img.shape[0], py1 + int((py2 - py1) * self.region))
+        return x1, y1, x2, y2
+
+    def face_sizes(self, person):
+        pw = person[2] - person[0]
+        lo, hi = self.size_range
+        min_side = max(self.min_face, int(pw * lo))
+        return min_side, max(min_side + 1, int(pw * hi))
+
+    def _search_person(self, img, person, cascade):
+        min_side, max_side = self.face_sizes(person)
+        return self.search_region(img, self.search_window(img, person), min_side, max_side, cascade)
+
+    def search_region(self, img, window, min_side, max_side, cascade=None):
+        """
+        Largest face with a side between min_side and max_side inside
+        window (x1, y1, x2, y2) of img, or None. Used for person boxes and
+        by FaceTracker to re-find a face around its last box.
+        """
+        x1, y1, x2, y2 = window
+        if x2 - x1 < min_side or y2 - y1 < min_side:
+            return None
+        roi = img[y1:y2, x1:x2]
+
+        if self.detector == "haar":
+            faces = self._haar(roi, cascade, min_side, max_side)
+        else:
+            faces = self._dnn(roi, min_side, max_side)
+        if not faces:
+            return None
+        fx, fy, fw, fh = max(faces, key=lambda f: f[2] * f[3])
+        return int(fx + x1), int(fy + y1), int(fw), int(fh)
+
+    def _haar(self, roi, cascade, min_side, max_side):
+        if cascade is None:
+            return []
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+        faces = cascade.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=4, minSize=(min_side, min_side), maxSize=(max_side, max_side))
+        return [tuple(int(v) for v in f) for f in faces]
+
+    def _dnn(self, roi, min_side, max_side):
+        h, w = roi.shape[:2]
+        f = min(1.0, self.dnn_input / max(h, w))
+        small = roi if f == 1.0 else cv2.resize(roi, (max(1, int(w * f)), max(1, int(h * f))), interpolation=cv2.INTER_AREA)
+
+        if self.detector == "yunet":
+            faces = self._yunet(small)
+        else:
+            faces = self._ssd(small)
+
+        found = []
+        for x, y, fw, fh in faces:
+            x, y, fw, fh = x / f, y / f, fw / f, fh / f
+            # The window is cut for one face size range; drop boxes well outside it
+            if 0.7 * min_side <= max(fw, fh) <= 1.3 * max_side:
+                found.append((max(0, int(x)), max(0, int(y)), int(fw), int(fh)))
+        return found
+
+    def _yunet(self, img):
+        net = getattr(self._local, "net", None)
+        if net is None:
+            net = cv2.FaceDetectorYN.create(self.model_path, "", (320, 320), self.score_threshold, 0.3, 50)
+            self._local.net = net
+        net.setInputSize((img.shape[1], img.shape[0]))
+        _, faces = net.detect(img)
+        if faces is None:
+            return []
+        return [tuple(face[:4]) for face in faces]
+
+    def _ssd(self, img):
+        net = getattr(self._local, "net", None)
+        if net is None:
+            net = cv2.dnn.readNet(self.model_path, self.config_path or "")
+            self._local.net = net
+        h, w = img.shape[:2]
+        net.setInput(cv2.dnn.blobFromImage(img, 1.0, (300, 300), (104.0, 177.0, 123.0)))
+        detections = net.forward().reshape(-1, 7)
+        faces = []
+        for det in detections[detections[:, 2] >= self.score_threshold]:
+            x1, y1, x2, y2 = det[3:7] * np.array([w, h, w, h])
+            if x2 > x1 and y2 > y1:
+                faces.append((x1, y1, x2 - x1, y2 - y1))
+        return faces
+
+
+def head_box(person):
+    """
+    Head estimate for a person box with no detected face: a square centered
+    at the top, sized from the box so that both an upper-body (webcam) box
+    and a full-body box give roughly one head. Returns (x, y, w, h).
+    """
+    px1, py1, px2, py2 = (int(v) for v in person)
+    pw, ph = px2 - px1, py2 - py1
+    side = max(1, int(min(pw * 0.55, ph * 0.4)))
+    x = px1 + (pw - side) // 2
+    return x, py1, side, side
+
+
+def locator_from_config(config):
+    """
+    FaceLocator with the FACE_* settings of `config` (the config module).
+    """
+    return FaceLocator(
+        detector=config.FACE_DETECTOR,
+        model_path=config.FACE_DETECTOR_MODEL,
+        config_path=config.FACE_DETECTOR_CONFIG,
+        region=config.FACE_SEARCH_REGION,
+        size_range=(config.FACE_SIZE_MIN, config.FACE_SIZE_MAX),
+        score_threshold=config.FACE_DETECTOR_SCORE,
+    )
+
+
+def local_cascade():
+    """
+    This thread's Haar cascade (CascadeClassifier is not safe to share
+    across threads), or None when OpenCV has no cascade data.
+    """
+    cascade = getattr(_cascade_local, "cascade", None)
+    if cascade is None:
+        if HAAR_CASCADE_PATH is None:
+            return None
+        cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+        if cascade.empty():
+            return None
+        _cascade_local.cascade = cascade
+    return cascade
+
+
+def extract_face(img, persons, locator, cascade=None, tracker=None, full=None, scale=1.0):
+    """
+    Finds the face on img (boxes in img coordinates) and cuts it from `full`,
+    the same frame at `scale` times the size. Returns (crop, [x, y, w, h],
+    source) in full-image coordinates, source being the detector that found
+    it ("roi" or "tracker" when the tracker followed the last face),
+    "person_crop" for a head estimate, or "none" (crop None).
+    """
+    if full is None:
+        full = img
+    source = "haar" if not persons else locator.detector
+    if persons:
+        # Only the upper part of the largest person box is searched
+        search = lambda: locator.largest(img, persons, cascade)
+    elif cascade:
+        # No person box to go by: full-frame Haar
+        search = lambda: _largest_face(img, cascade)
+    else:
+        search = None
+
+    if search is not None:
+        # With a tracker the search only runs every N frames, ROI / tracker otherwise
+        if tracker is not None:
+            found, how = tracker.locate_with_source(img, cascade, search=search)
+            if how != "search":
+                source = how
+        else:
+            found = search()
+        if found is not None:
+            return _crop_face(full, found, scale) + (source,)
+
+    # Fallback to a head estimate from the largest person box
+    if persons:
+        p = max(persons, key=lambda b: (b[2] - b[0]) * (b[3] - b[1]))
+        return _crop_head(full, p, scale) + ("person_crop",)
+
+    return None, None, "none"
+
+
+def extract_faces(img, persons, locator, cascade=None, full=None, scale=1.0, max_faces=8):
+    """
+    Multi-face variant of extract_face: the face inside each person box, or
+    a head-crop guess where none is found. Without person boxes, every Haar
+    face in the frame. Returns up to max_faces (crop, [x, y, w, h], source)
+    in full-image coordinates, largest first.
+    """
+    if full is None:
+        full = img
+    found = []
+    if persons:
+        for face, person in locator.locate(img, persons, cascade, max_faces):
+            if face is not None:
+                found.append((locator.detector, face, face[2] * face[3]))
+            else:
+                _, _, w, h = head_box(person)
+                found.append(("person_crop", person, w * h))
+    elif cascade:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        for f in cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4, minSize=(30, 30)):
+            found.append(("haar", [int(v) for v in f], int(f[2]) * int(f[3])))
+    found.sort(key=lambda item: item[2], reverse=True)
+
+    results = []
+    for source, rect, _ in found[:max_faces]:
+        crop, coords = _crop_head(full, rect, scale) if source == "person_crop" else _crop_face(full, rect, scale)
+        if crop.size:
+            results.append((crop, coords, source))
+    return results
+
+
+def _largest_face(img, cascade):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    with tracing.span("face.haar_fullframe", size=f"{img.shape[1]}x{img.shape[0]}"):
+        faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4, minSize=(30, 30))
+    if len(faces) == 0:
+        return None
+    return tuple(int(v) for v in max(faces, key=lambda f: f[2] * f[3]))
+
+
+def _crop_face(full, rect, scale=1.0):
+    # Face box (x, y, w, h) plus a 20% margin
+    x, y, w, h = _scale_rect(rect, scale)
+    mx, my = int(w * 0.2), int(h * 0.2)
+    x1, y1 = max(0, x - mx), max(0, y - my)
+    x2, y2 = min(full.shape[1], x + w + mx), min(full.shape[0], y + h + my)
+    return full[y1:y2, x1:x2], [x, y, w, h]
+
+
+def _crop_head(full, person, scale=1.0):
+    # Head estimate: a square at the top center of the person box
+    x, y, w, h = head_box(_scale_rect(person, scale))
+    return full[y:y + h, x:x + w], [x, y, w, h]
+
+
+def _scale_rect(rect, scale):
+    if scale == 1.0:
+        return [int(v) for v in rect]
+    return [int(round(v * scale)) for v in rect]
@@ -0,0 +1,228 @@
+import io
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Stateless image helpers. They live at module level so they can be shipped
+# to a process pool as well as run on threads.
+
+
+def decode_image(contents, flags=cv2.IMREAD_COLOR):
+    """
+    Decodes JPEG/PNG bytes into a BGR image. Returns None for invalid data.
+    """
+    if not contents:
+        return None
+    nparr = np.frombuffer(contents, np.uint8)
+    return cv2.imdecode(nparr, flags)
+
+
+def encode_jpeg(img, quality=95):
+    """
+    Encodes a BGR image to JPEG bytes. Returns b"" on failure.
+    """
+    ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        return b""
+    return buffer.tobytes()
+
+
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 of the size, skipping most of the IDCT work
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+class Frame:
+    """
+    One uploaded image at two resolutions: `work`, at most the configured
+    working width, for presence detection, the Haar search and the frame
+    gate; and `full`, the client's resolution, which face crops and debug
+    images are cut from. Coordinates found on `work` map back with `to_full`.
+
+    When the working copy was decoded at reduced scale, `full` is decoded
+    from the original bytes only on first access.
+
+    Arrays borrowed from a BufferPool are listed in `pooled`; release()
+    hands them back once nothing reads the frame any more.
+    """
+
+    def __init__(self, work, scale=1.0, full=None, contents=None, pool=None, pooled=()):
+        self.work = work
+        self.scale = scale
+        self._full = full
+        self._contents = contents
+        self._pool = pool
+        self.pooled = list(pooled)
+
+    def __getstate__(self):
+        # A copy sent to another process doesn't own the pooled buffers (nor the pool's lock)
+        state = dict(self.__dict__)
+        state["_pool"] = None
+        state["pooled"] = []
+        return state
+
+    def release(self):
+        if self._pool is not None:
+            for buf in self.pooled:
+                self._pool.release(buf)
+        self.pooled = []
+        self._pool = None
+
+    @property
+    def full(self):
+        if self._full is None:
+            self._full = decode_image(self._contents) if self._contents is not None else None
+            if self._full is None:
+                # Undecodable at full size: fall back to the working copy
+                self._full = cv2.resize(self.work, None, fx=self.scale, fy=self.scale) if self.scale != 1.0 else self.work
+            self._contents = None
+        return self._full
+
+    def to_full(self, values):
+        """
+        Scales a box (x1, y1, x2, y2 or x, y, w, h) from working to full coordinates.
+        """
+        if values is None or self.scale == 1.0:
+            return values
+        return [int(round(v * self.scale)) for v in values]
+
+    def boxes_to_full(self, boxes):
+        return [self.to_full(b) for b in boxes]
+
+
+class BufferPool:
+    """
+    Reusable frame-sized uint8 arrays, keyed by shape. Clients stream at a
+    handful of fixed resolutions, so after the first few frames the working
+    copies and color conversions of every request land in an already
+    allocated (and already paged-in) buffer instead of a fresh one.
+
+    At most `per_shape` idle buffers are kept for each shape and at most
+    `max_shapes` shapes; the least recently used shape is dropped first.
+    """
+
+    def __init__(self, per_shape=8, max_shapes=8):
+        self.per_shape = per_shape
+        self.max_shapes = max_shapes
+        self.reused = 0
+        self.allocated = 0
+        self._free = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, shape):
+        shape = tuple(shape)
+        with self._lock:
+            free = self._free.get(shape)
+            if free:
+                self._free.move_to_end(shape)
+                self.reused += 1
+                return free.pop()
+            self.allocated += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, buf):
+        with self._lock:
+            free = self._free.setdefault(buf.shape, [])
+            self._free.move_to_end(buf.shape)
+            if len(free) < self.per_shape:
+                free.append(buf)
+            while len(self._free) > self.max_shapes:
+                self._free.popitem(last=False)
+
+
+def _jpeg_width(contents):
+    # Header-only read; None for anything that isn't a JPEG
+    try:
+        with Image.open(io.BytesIO(contents)) as im:
+            return im.width if im.format == "JPEG" else None
+    except Exception:
+        return None
+
+
+def decode_frame(contents, work_width=0, reduced=False, pool=None):
+    """
+    Decodes upload bytes into a Frame whose working copy is at most
+    `work_width` pixels wide (0 keeps the full resolution). With `reduced`,
+    JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale and the full image
+    is only decoded if something asks for it. Returns None for invalid data.
+
+    With a `pool`, the downscaled working copy is written into a pooled
+    buffer. cv2.imdecode has no output argument, so the decoded image itself
+    is always a fresh array.
+    """
+    if not contents:
+        return None
+
+    if reduced and work_width:
+        full_width = _jpeg_width(contents)
+        factor = 1
+        for f in (8, 4, 2):
+            if full_width and full_width // f >= work_width:
+                factor = f
+                break
+        if factor > 1:
+            work = decode_image(contents, REDUCED_FLAGS[factor])
+            if work is None:
+                return None
+            pooled = []
+            if work.shape[1] > work_width:
+                work = _downscale(work, work_width, pool)
+                pooled = [work] if pool is not None else []
+            return Frame(work, full_width / work.shape[1], contents=contents, pool=pool, pooled=pooled)
+
+    full = decode_image(contents)
+    if full is None:
+        return None
+    return frame_from_image(full, work_width, pool)
+
+
+def frame_from_image(full, work_width=0, pool=None, pooled=()):
+    """
+    Frame around an already decoded image (video frames, cv2.imread).
+    """
+    pooled = list(pooled)
+    if work_width and full.shape[1] > work_width:
+        work = _downscale(full, work_width, pool)
+        if pool is not None:
+            pooled.append(work)
+        return Frame(work, full.shape[1] / work.shape[1], full=full, pool=pool, pooled=pooled)
+    return Frame(full, 1.0, full=full, pool=pool, pooled=pooled)
+
+
+# Raw pixel layouts accepted by raw_frame: channels and conversion to BGR
+RAW_FORMATS = {
+    "bgr": (3, None),
+    "rgb": (3, cv2.COLOR_RGB2BGR),
+    "bgra": (4, cv2.COLOR_BGRA2BGR),
+    "rgba": (4, cv2.COLOR_RGBA2BGR),
+    "gray": (1, cv2.COLOR_GRAY2BGR),
+}
+
+
+def raw_frame(contents, width, height, fmt="bgr", work_width=0, pool=None):
+    """
+    Frame around uncompressed pixels (height x width, row-major, no padding).
+    BGR input is used in place as a read-only view of `contents`; other
+    layouts are converted into a pooled BGR buffer. Returns None if the size
+    doesn't match.
+    """
+    if fmt not in RAW_FORMATS or width <= 0 or height <= 0:
+        return None
+    channels, conversion = RAW_FORMATS[fmt]
+    if not contents or len(contents) != width * height * channels:
+        return None
+
+    pixels = np.frombuffer(contents, np.uint8).reshape((height, width, channels) if channels > 1 else (height, width))
+    if conversion is None:
+        return frame_from_image(pixels, work_width, pool)
+    full = pool.acquire((height, width, 3)) if pool is not None else None
+    full = cv2.cvtColor(pixels, conversion, dst=full)
+    return frame_from_image(full, work_width, pool, [full] if pool is not None else ())
+
+
+def _downscale(img, width, pool=None):
+    height = max(1, int(round(img.shape[0] * width / img.shape[1])))
+    dst = pool.acquire((height, width) + img.shape[2:]) if pool is not None else None
+    return cv2.resize(img, (width, height), dst=dst, interpolation=cv2.INTER_AREA)
@@ -0,0 +1,65 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class FrameGate:
+    """
+    Per-session change detector in front of the model pipeline.
+
+    Each frame is reduced to a tiny grayscale thumbnail and compared with
+    the thumbnail of the last frame that was fully analyzed. If the mean
+    absolute difference stays under `threshold` (0-255 scale, after removing
+    global brightness shifts from auto-exposure) and the cached result is
+    younger than `max_age` seconds, the cached result can be reused.
+    """
+
+    def __init__(self, threshold=3.0, max_age=3.0, size=(32, 24)):
+        self.threshold = threshold
+        self.max_age = max_age
+        self.size = size
+
+        self._reference = None
+        self._result = None
+        self._analyzed_at = 0.0
+        self.reused = 0
+        self.analyzed = 0
+
+    def thumbnail(self, img):
+        small = cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        thumb = small.astype(np.float32)
+        thumb -= thumb.mean()
+        return thumb
+
+    def difference(self, thumb):
+        if self._reference is None or self._reference.shape != thumb.shape:
+            return None
+        return float(np.mean(np.abs(thumb - self._reference)))
+
+    def lookup(self, thumb):
+        """
+        Returns the cached result if this frame is close enough to the
+        analyzed one, else None.
+        """
+        if self._result is None:
+            return None
+        if time.monotonic() - self._analyzed_at > self.max_age:
+            return None
+        diff = self.difference(thumb)
+        if diff is None or diff > self.threshold:
+            return None
+        self.reused += 1
+        return self._result
+
+    def store(self, thumb, result):
+        self._reference = thumb
+        self._result = result
+        self._analyzed_at = time.monotonic()
+        self.analyzed += 1
+
+    def reset(self):
+        self._reference = None
+        self._result = None
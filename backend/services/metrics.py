@@ -0,0 +1,191 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond decode up to multi-second stalls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def set_total(self, value, *labelvalues):
+        # Mirrors a total that is counted elsewhere (e.g. BufferPool's own counters) at scrape time
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    @contextmanager
+    def track(self, *labelvalues):
+        self.inc(*labelvalues)
+        try:
+            yield
+        finally:
+            self.dec(*labelvalues)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [per-bucket counts..., +Inf count], sum
+        self._counts = {}
+        self._sums = {}
+
+    def observe(self, value, *labelvalues):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(labelvalues)
+            if counts is None:
+                counts = self._counts[labelvalues] = [0] * (len(self.buckets) + 1)
+                self._sums[labelvalues] = 0.0
+            counts[i] += 1
+            self._sums[labelvalues] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted((k, list(v), self._sums[k]) for k, v in self._counts.items())
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus text-format registry. Updates are a lock and a few
+    dict operations, so recording on the hot path costs microseconds.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Pipeline metrics, shared by the API and anything else that runs the services
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "predict_stage_seconds", "Latency of one pipeline stage, including queueing for its executor/batch.", ["stage"])
+REQUEST_SECONDS = metrics.histogram(
+    "predict_request_seconds", "End-to-end latency of one analyzed frame.", ["endpoint"])
+STATUS_TOTAL = metrics.counter(
+    "predict_status_total", "Frames by presence status.", ["status"])
+REUSED_TOTAL = metrics.counter(
+    "predict_reused_total", "Frames answered from the previous analysis by the frame gate.")
+FACE_SOURCE_TOTAL = metrics.counter(
+    "face_source_total", "How the face crop was found: haar, yunet or dnn (full search), roi or tracker (followed from the last frame), person_crop or none.", ["source"])
+EMOTION_FAILURES_TOTAL = metrics.counter(
+    "emotion_failures_total", "Face crops the emotion model failed to score.")
+IN_FLIGHT = metrics.gauge(
+    "predict_in_flight", "Frames currently being processed.", ["endpoint"])
+ADMISSION_TOTAL = metrics.counter(
+    "admission_total", "Frames by admission outcome: admitted, superseded, queue_full or deadline.", ["outcome"])
+ADMISSION_QUEUED = metrics.gauge(
+    "admission_queued", "Frames waiting for an admission slot.")
+ADMISSION_ACTIVE = metrics.gauge(
+    "admission_active", "Frames holding an admission slot.")
+STREAM_DROPPED_TOTAL = metrics.counter(
+    "stream_dropped_total", "/stream frames replaced by a newer one before they were analyzed.")
+FRAME_POOL_BUFFERS_TOTAL = metrics.counter(
+    "frame_pool_buffers_total", "Frame buffers handed out by the buffer pool, by event: reused or allocated.", ["event"])
@@ -1,25 +1,55 @@
-from ultralytics import YOLO
 import numpy as np
 
+from services import tracing
+from services.registry import get_registry
+from services.backends import presence_model_path
+
 class PresenceService:
-    def __init__(self, model_path="yolov8n.pt"):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path="yolov8n.pt", registry=None, preload=True, backend="torch"):
+        # YOLO weights come from the shared registry so they are loaded once per process.
+        # backend "onnx"/"torchscript" serves yolov8n.onnx / yolov8n.torchscript instead.
+        self.registry = registry or get_registry()
+        self.backend_name = backend
+        model_path = presence_model_path(model_path, backend)
+        self.model_path = model_path
+        self.registry.register("yolo", model_path)
+        if preload:
+            self.registry.yolo(model_path)
         # Class IDs
         self.CLASS_PERSON = 0
         self.CLASS_PHONE = 67
 
+    @property
+    def model(self):
+        return self.registry.yolo(self.model_path)
+
     def detect_presence(self, img, conf_person=0.6, conf_phone=0.4):
         """
         Detects person and mobile phone.
         Returns status: 'ok', 'no_user', 'mobile_detected'
         """
         if img is None:
-            return "no_user"
+            return "no_user", [], []
 
         # Run inference
         # We use a lower base confidence to catch objects, then filter.
-        results = self.model.predict(img, conf=0.3, classes=[self.CLASS_PERSON, self.CLASS_PHONE], verbose=False)
-        
+        with tracing.span("presence.forward", batch=1):
+            results = self.model.predict(img, conf=0.3, classes=[self.CLASS_PERSON, self.CLASS_PHONE], verbose=False)
+        return self._classify(results, conf_person, conf_phone)
+
+    def detect_presence_batch(self, imgs, conf_person=0.6, conf_phone=0.4):
+        """
+        Same as detect_presence, but runs a single YOLO forward over a list of frames.
+        Returns one (status, persons, phones) tuple per frame.
+        """
+        if not imgs:
+            return []
+
+        with tracing.span("presence.forward", batch=len(imgs)):
+            results = self.model.predict(list(imgs), conf=0.3, classes=[self.CLASS_PERSON, self.CLASS_PHONE], verbose=False)
+        return [self._classify([result], conf_person, conf_phone) for result in results]
+
+    def _classify(self, results, conf_person, conf_phone):
         persons = []
         phones = []
 
@@ -0,0 +1,109 @@
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+from services.backends import preprocess_faces
+
+# ONNX Runtime calibration methods by CLI name
+CALIBRATION_METHODS = ("minmax", "entropy", "percentile")
+
+
+def letterbox(img, size=640, color=114):
+    """
+    YOLOv8 network input for one BGR frame: resized keeping the aspect
+    ratio, padded to size x size, RGB CHW float32 in [0, 1].
+    """
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = max(1, int(round(h * r))), max(1, int(round(w * r)))
+    canvas = np.full((size, size, 3), color, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(canvas[..., ::-1].transpose(2, 0, 1), dtype=np.float32) / 255.0
+
+
+def emotion_calibration_batches(faces, img_size=224, batch_size=8):
+    """
+    Preprocessed (N, 3, img_size, img_size) batches of BGR face crops, exactly
+    as the emotion backends feed them to the network.
+    """
+    for i in range(0, len(faces), batch_size):
+        yield preprocess_faces([np.ascontiguousarray(f[..., ::-1]) for f in faces[i:i + batch_size]], img_size)
+
+
+def presence_calibration_batches(frames, size=640, batch_size=4):
+    for i in range(0, len(frames), batch_size):
+        yield np.stack([letterbox(f, size) for f in frames[i:i + batch_size]])
+
+
+def quantize_onnx(float_path, int8_path, batches=None, method="minmax", per_channel=True):
+    """
+    Writes an int8 copy of an ONNX model.
+
+    With calibration `batches` (an iterable of input arrays) activations and
+    weights are quantized statically in QDQ format, which ONNX Runtime fuses
+    into int8 convolutions. Without them only the weights are quantized
+    (dynamic quantization); for conv nets that is usually slower than float.
+    Model metadata (YOLO's names/stride/imgsz) is carried over.
+    """
+    import onnx
+    from onnxruntime.quantization import (
+        CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static,
+    )
+
+    if batches is None:
+        quantize_dynamic(float_path, int8_path, weight_type=QuantType.QInt8, per_channel=per_channel)
+        _copy_metadata(float_path, int8_path)
+        return int8_path
+
+    input_name = onnx.load(float_path, load_external_data=False).graph.input[0].name
+
+    class BatchReader(CalibrationDataReader):
+        def __init__(self):
+            self._batches = iter(batches)
+
+        def get_next(self):
+            batch = next(self._batches, None)
+            return None if batch is None else {input_name: batch}
+
+    methods = {
+        "minmax": CalibrationMethod.MinMax,
+        "entropy": CalibrationMethod.Entropy,
+        "percentile": CalibrationMethod.Percentile,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        # Shape inference + graph cleanup first, as ONNX Runtime recommends for static quantization
+        source = float_path
+        try:
+            from onnxruntime.quantization.shape_inference import quant_pre_process
+            source = os.path.join(tmp, "prep.onnx")
+            quant_pre_process(float_path, source, skip_symbolic_shape=True)
+        except Exception as e:
+            print(f"Quantization pre-processing skipped: {e}")
+            source = float_path
+
+        quantize_static(
+            source, int8_path, BatchReader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=per_channel,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=methods[method],
+        )
+    _copy_metadata(float_path, int8_path)
+    return int8_path
+
+
+def _copy_metadata(src_path, dst_path):
+    import onnx
+
+    src = onnx.load(src_path, load_external_data=False)
+    if not src.metadata_props:
+        return
+    dst = onnx.load(dst_path)
+    del dst.metadata_props[:]
+    for prop in src.metadata_props:
+        dst.metadata_props.add(key=prop.key, value=prop.value)
+    onnx.save(dst, dst_path)
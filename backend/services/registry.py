@@ -0,0 +1,223 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+from services.backends import load_onnx_emotion, load_torchscript_emotion
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLoadError(RuntimeError):
+    pass
+
+
+def _load_yolo(model_path):
+    from ultralytics import YOLO
+    return YOLO(model_path)
+
+
+def _load_hsemotion(model_name):
+    from hsemotion.facial_emotions import HSEmotionRecognizer
+    return HSEmotionRecognizer(model_name=model_name, device='cpu')
+
+
+def _warmup_yolo(model, runs):
+    # Odd sizes on purpose so letterboxing and batching paths both get exercised
+    frames = [np.zeros((480, 640, 3), dtype=np.uint8), np.zeros((360, 480, 3), dtype=np.uint8)]
+    for _ in range(runs):
+        model.predict(frames[0], verbose=False)
+        model.predict(frames, verbose=False)
+
+
+def _warmup_hsemotion(model, runs):
+    faces = [np.zeros((112, 112, 3), dtype=np.uint8), np.zeros((96, 80, 3), dtype=np.uint8)]
+    for _ in range(runs):
+        model.predict_multi_emotions(faces[:1], logits=False)
+        model.predict_multi_emotions(faces, logits=False)
+
+
+def _warmup_emotion_backend(backend, runs):
+    faces = [np.zeros((112, 112, 3), dtype=np.uint8), np.zeros((96, 80, 3), dtype=np.uint8)]
+    for _ in range(runs):
+        backend.predict_proba(faces[:1])
+        backend.predict_proba(faces)
+
+
+def _torch_module(model):
+    # YOLO and HSEmotionRecognizer keep their nn.Module in .model; the
+    # emotion backends wrap either a recognizer or a scripted module.
+    for candidate in (model, getattr(model, "model", None), getattr(model, "recognizer", None),
+                      getattr(model, "module", None)):
+        if candidate is None:
+            continue
+        if hasattr(candidate, "share_memory") and hasattr(candidate, "parameters"):
+            return candidate
+        inner = getattr(candidate, "model", None)
+        if hasattr(inner, "share_memory") and hasattr(inner, "parameters"):
+            return inner
+    return None
+
+
+class ModelRegistry:
+    """
+    Loads each model once per process and hands the same instance to every
+    service that asks for it (PresenceService, PersonDetector, EmotionService,
+    EmotionDetector).
+
+    Models are keyed by (kind, name); for exported backends the name is the
+    path of the exported file. Services `register` what they need;
+    `load_all` then loads and warms up everything registered so the first
+    real frame doesn't pay for lazy torch initialization.
+    """
+
+    LOADERS = {
+        "yolo": _load_yolo,
+        "hsemotion": _load_hsemotion,
+        "emotion-onnx": load_onnx_emotion,
+        "emotion-torchscript": load_torchscript_emotion,
+    }
+    WARMUPS = {
+        "yolo": _warmup_yolo,
+        "hsemotion": _warmup_hsemotion,
+        "emotion-onnx": _warmup_emotion_backend,
+        "emotion-torchscript": _warmup_emotion_backend,
+    }
+
+    def __init__(self):
+        self._models = {}
+        self._errors = {}
+        self._registered = []
+        self._lock = threading.RLock()
+
+        self.load_seconds = {}
+        self.warmup_seconds = {}
+        self._ready = threading.Event()
+
+    def register(self, kind, name):
+        key = (kind, name)
+        with self._lock:
+            if key not in self._registered:
+                self._registered.append(key)
+        return key
+
+    def registered(self):
+        with self._lock:
+            return list(self._registered)
+
+    def get(self, kind, name):
+        """
+        Returns the model, loading it on first use. A failed load is
+        remembered and raised again instead of being retried on every frame.
+        """
+        key = (kind, name)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            if key in self._models:
+                return self._models[key]
+            if key in self._errors:
+                raise ModelLoadError(f"{kind} model {name} failed to load: {self._errors[key]}")
+
+            self.register(kind, name)
+            logger.info("Loading %s model %s...", kind, name)
+            start = time.perf_counter()
+            try:
+                model = self.LOADERS[kind](name)
+            except Exception as e:
+                self._errors[key] = str(e)
+                logger.error("Error loading %s model %s: %s", kind, name, e)
+                raise ModelLoadError(f"{kind} model {name} failed to load: {e}") from e
+
+            self.load_seconds[key] = time.perf_counter() - start
+            self._models[key] = model
+            logger.info("Loaded %s model %s in %.2fs", kind, name, self.load_seconds[key])
+            return model
+
+    def yolo(self, model_path="yolov8n.pt"):
+        return self.get("yolo", model_path)
+
+    def hsemotion(self, model_name='enet_b0_8_best_vgaf'):
+        return self.get("hsemotion", model_name)
+
+    def warmup(self, kind, name, runs=2):
+        model = self.get(kind, name)
+        warm = self.WARMUPS.get(kind)
+        if warm is None:
+            return
+        start = time.perf_counter()
+        warm(model, runs)
+        self.warmup_seconds[(kind, name)] = time.perf_counter() - start
+        logger.info("Warmed up %s model %s in %.2fs", kind, name, self.warmup_seconds[(kind, name)])
+
+    def load_all(self, warmup=True, runs=2):
+        """
+        Loads (and optionally warms up) every registered model.
+        Marks the registry ready only if all of them succeeded.
+        """
+        ok = True
+        for kind, name in list(self._registered):
+            try:
+                self.get(kind, name)
+                if warmup:
+                    self.warmup(kind, name, runs)
+            except Exception as e:
+                ok = False
+                if (kind, name) not in self._errors:
+                    self._errors[(kind, name)] = str(e)
+                    logger.error("Warmup of %s model %s failed: %s", kind, name, e)
+        if ok:
+            self._ready.set()
+        return ok
+
+    def share_memory(self):
+        """
+        Moves the weights of every loaded torch model into shared memory, so
+        forked workers keep reading one copy instead of copying pages on
+        write. Returns the number of models moved.
+        """
+        shared = 0
+        for key, model in list(self._models.items()):
+            module = _torch_module(model)
+            if module is None:
+                continue
+            try:
+                module.share_memory()
+                shared += 1
+            except Exception as e:
+                logger.warning("Could not share %s model %s: %s", key[0], key[1], e)
+        return shared
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def status(self):
+        models = {}
+        for kind, name in self._registered:
+            key = (kind, name)
+            models[f"{kind}:{name}"] = {
+                "loaded": key in self._models,
+                "load_seconds": round(self.load_seconds[key], 3) if key in self.load_seconds else None,
+                "warmup_seconds": round(self.warmup_seconds[key], 3) if key in self.warmup_seconds else None,
+                "error": self._errors.get(key),
+            }
+        return {"ready": self.ready, "models": models}
+
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Process-wide registry shared by the API and the local driver.
+    """
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = ModelRegistry()
+        return _default_registry
@@ -0,0 +1,91 @@
+import time
+import uuid
+from collections import OrderedDict
+
+
+class SessionState:
+    """
+    Pipeline state kept server-side between frames of one client.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.created_at = time.time()
+        self.last_seen = time.monotonic()
+
+        self.frame_count = 0
+        self.last_status = None
+        self.last_persons = []
+        self.last_phones = []
+        self.last_face_coords = None
+        self.last_analysis = None
+        self.last_result = None
+        self.face_tracker = None
+        self.frame_gate = None
+        self.affect = None
+        # Compressed copy of the last frame, decoded only for /sessions/{id}/debug.jpg
+        self.last_frame_jpeg = None
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+        self.frame_count += 1
+
+
+class SessionStore:
+    """
+    Bounded map of session_id -> SessionState.
+
+    Idle sessions expire after `ttl_seconds`; beyond `max_sessions` the least
+    recently used one is evicted, so memory stays bounded however many
+    clients come and go.
+    """
+
+    def __init__(self, max_sessions=1000, ttl_seconds=300.0):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+
+    def get(self, session_id=None):
+        """
+        Returns the state for `session_id`, creating it if needed.
+        Without an id, returns a throwaway state that is not stored.
+        """
+        if not session_id:
+            return SessionState(None)
+
+        self._expire()
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = SessionState(session_id)
+            self._sessions[session_id] = state
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return state
+
+    def peek(self, session_id):
+        """
+        Returns the stored state without creating or refreshing it.
+        """
+        return self._sessions.get(session_id)
+
+    def drop(self, session_id):
+        self._sessions.pop(session_id, None)
+
+    def new_id(self):
+        return uuid.uuid4().hex
+
+    def _expire(self):
+        if not self.ttl_seconds:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        # OrderedDict is in LRU order, so stop at the first live session
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if state.last_seen >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,367 @@
+import glob
+import hashlib
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from services.emotion import EMOTION_LABELS, VALENCE_LABELS, scores_vector
+
+STATUS_LABELS = ("ok", "no_user", "mobile_detected")
+
+# One fixed-width record per analyzed frame. engagement/valence are -1 when
+# the frame had no analysis (no face, or presence wasn't "ok").
+RECORD = np.dtype([
+    ("t", "<f8"),
+    ("emotions", "<f4", (len(EMOTION_LABELS),)),
+    ("engagement", "<i2"),
+    ("valence", "i1"),
+    ("status", "i1"),
+    ("reused", "u1"),
+    ("faces", "u1"),
+])
+
+MAGIC = b"TLN1"
+HEADER_SIZE = 16
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def record_for(result, t=None):
+    """
+    Timeline record (a 0-d RECORD array) for one PipelineResult.
+    """
+    rec = np.zeros((), dtype=RECORD)
+    rec["t"] = time.time() if t is None else t
+    rec["status"] = STATUS_LABELS.index(result.status) if result.status in STATUS_LABELS else -1
+    rec["reused"] = bool(result.reused)
+    rec["faces"] = min(255, len(result.faces)) if result.faces is not None else int(result.face_coords is not None)
+    analysis = result.analysis
+    if analysis is None:
+        rec["engagement"] = -1
+        rec["valence"] = -1
+    else:
+        rec["emotions"] = scores_vector(analysis.get("all_scores") or {})
+        rec["engagement"] = analysis["engagement_score"]
+        rec["valence"] = VALENCE_LABELS.index(analysis["valence"]) if analysis["valence"] in VALENCE_LABELS else -1
+    return rec
+
+
+class TimelineStore:
+    """
+    Append-only per-session timelines, files of RECORD rows.
+
+    append() only copies the record into the session's in-memory buffer;
+    buffers are written out with a single write() once they hold
+    `flush_records` rows or are `flush_seconds` old (by a background thread,
+    or on the next append). Queries memory-map the files and binary-search
+    the time column, so only the pages of the requested range are read.
+
+    Each process writes its own file per session (<id>.<pid>.tl), in
+    arrival order, so every file is in time order even with several
+    serve.py workers; a query merges all files of the session. Rows still
+    buffered in another worker show up once it flushes them, at most
+    `flush_seconds` later.
+
+    Files not written to for `retention_seconds` are deleted, and beyond
+    `max_sessions` sessions the least recently written ones go first.
+    """
+
+    def __init__(self, directory, flush_records=64, flush_seconds=5.0, retention_seconds=None,
+                 max_sessions=None, prune_seconds=60.0):
+        self.directory = directory
+        self.flush_records = max(1, flush_records)
+        self.flush_seconds = flush_seconds
+        self.retention_seconds = retention_seconds
+        self.max_sessions = max_sessions
+        self.prune_seconds = prune_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        # session_id -> (buffer, count, first_append_monotonic)
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Taken before _lock is released, so buffers are written in the order they were filled
+        self._io_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+        self._last_prune = 0.0
+
+    def _name(self, session_id):
+        return session_id if _SAFE_ID.match(session_id) else hashlib.sha1(session_id.encode()).hexdigest()
+
+    def path(self, session_id):
+        # This process's file for the session
+        return os.path.join(self.directory, f"{self._name(session_id)}.{os.getpid()}.tl")
+
+    def paths(self, session_id):
+        # Every process's file for the session
+        return sorted(glob.glob(os.path.join(self.directory, f"{self._name(session_id)}.*.tl")))
+
+    def append(self, session_id, rec):
+        with self._lock:
+            entry = self._pending.get(session_id)
+            if entry is None:
+                entry = [np.empty(self.flush_records, dtype=RECORD), 0, time.monotonic()]
+                self._pending[session_id] = entry
+            entry[0][entry[1]] = rec
+            entry[1] += 1
+            if entry[1] < self.flush_records:
+                return
+            full = self._pending.pop(session_id)
+            self._io_lock.acquire()
+        try:
+            self._write(session_id, full[0][:full[1]])
+        finally:
+            self._io_lock.release()
+
+    def flush(self, max_age=0.0):
+        """
+        Writes out buffers older than max_age seconds (all of them by default).
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = [sid for sid, entry in self._pending.items() if now - entry[2] >= max_age]
+            if not due:
+                return
+            batches = [(sid, self._pending.pop(sid)) for sid in due]
+            self._io_lock.acquire()
+        try:
+            for sid, (buf, count, _) in batches:
+                if count:
+                    self._write(sid, buf[:count])
+        finally:
+            self._io_lock.release()
+
+    def start(self):
+        # Background flush of buffers older than flush_seconds, and pruning
+        if self._flusher is None:
+            self._stop.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="timeline-flush", daemon=True)
+            self._flusher.start()
+
+    def close(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=2.0)
+            self._flusher = None
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(max(0.5, self.flush_seconds / 2)):
+            self.flush(self.flush_seconds)
+            if time.monotonic() - self._last_prune >= self.prune_seconds:
+                self._last_prune = time.monotonic()
+                self.prune()
+
+    def prune(self):
+        """
+        Deletes timelines past retention_seconds, then the least recently
+        written sessions beyond max_sessions. Returns the number of files removed.
+        """
+        now = time.time()
+        removed = 0
+        sessions = {}
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".tl"):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if self.retention_seconds and now - mtime > self.retention_seconds:
+                removed += _unlink(entry.path)
+                continue
+            sessions.setdefault(entry.name.split(".", 1)[0], []).append((mtime, entry.path))
+
+        if self.max_sessions and len(sessions) > self.max_sessions:
+            by_age = sorted(sessions.values(), key=lambda files: max(m for m, _ in files))
+            for files in by_age[:len(sessions) - self.max_sessions]:
+                for _, path in files:
+                    removed += _unlink(path)
+        return removed
+
+    def _write(self, session_id, rows):
+        # Caller holds _io_lock
+        with open(self.path(session_id), "ab") as f:
+            # Append mode starts at the end: empty means new (or just pruned)
+            if f.tell() == 0:
+                f.write(MAGIC + np.uint32(RECORD.itemsize).tobytes() + bytes(HEADER_SIZE - 8))
+            f.write(rows.tobytes())
+
+    def _pending_rows(self, session_id):
+        with self._lock:
+            entry = self._pending.get(session_id)
+            return entry[0][:entry[1]].copy() if entry is not None else np.empty(0, dtype=RECORD)
+
+    def _mapped(self, path):
+        # Read-only view of one timeline file, or None; a trailing partial record is ignored
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        count = (size - HEADER_SIZE) // RECORD.itemsize
+        if count <= 0:
+            return np.empty(0, dtype=RECORD)
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if header[:4] != MAGIC or int(np.frombuffer(header[4:8], np.uint32)[0]) != RECORD.itemsize:
+            raise ValueError(f"{path} is not a timeline file of this version")
+        return np.memmap(path, dtype=RECORD, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+    def exists(self, session_id):
+        return len(self._pending_rows(session_id)) > 0 or bool(self.paths(session_id))
+
+    def _ranges(self, session_id, start, end):
+        # (memmap, lo, hi): the rows with start <= t < end in each of the session's files
+        for path in self.paths(session_id):
+            mapped = self._mapped(path)
+            if mapped is None or not len(mapped):
+                continue
+            t = mapped["t"]
+            lo = 0 if start is None else int(np.searchsorted(t, start, side="left"))
+            hi = len(mapped) if end is None else int(np.searchsorted(t, end, side="left"))
+            if hi > lo:
+                yield mapped, lo, hi
+
+    def _pending_in(self, session_id, start, end):
+        pending = self._pending_rows(session_id)
+        if not len(pending):
+            return pending
+        keep = np.ones(len(pending), dtype=bool)
+        if start is not None:
+            keep &= pending["t"] >= start
+        if end is not None:
+            keep &= pending["t"] < end
+        return pending[keep]
+
+    def count(self, session_id, start=None, end=None):
+        """
+        Number of records with start <= t < end, without reading them.
+        """
+        written = sum(hi - lo for _, lo, hi in self._ranges(session_id, start, end))
+        return written + len(self._pending_in(session_id, start, end))
+
+    def query(self, session_id, start=None, end=None, limit=None):
+        """
+        Records with start <= t < end, written and still buffered, in time
+        order; with `limit`, only the latest `limit` of them are read.
+        """
+        parts = []
+        for mapped, lo, hi in self._ranges(session_id, start, end):
+            if limit is not None:
+                lo = max(lo, hi - limit)
+            parts.append(np.array(mapped[lo:hi]))
+        pending = self._pending_in(session_id, start, end)
+        if len(pending):
+            parts.append(pending)
+        if not parts:
+            return np.empty(0, dtype=RECORD)
+        rows = np.concatenate(parts)
+        if len(parts) > 1:
+            # Merge the per-process files (and this process's buffer)
+            rows = rows[np.argsort(rows["t"], kind="stable")]
+        if limit is not None:
+            rows = rows[-limit:]
+        return rows
+
+    def buckets(self, session_id, bucket_seconds, start=None, end=None, chunk_records=65536):
+        """
+        aggregate() over the records with start <= t < end, summed
+        `chunk_records` rows at a time so the range is never copied whole.
+        """
+        sums = []
+        for mapped, lo, hi in self._ranges(session_id, start, end):
+            for i in range(lo, hi, chunk_records):
+                sums.append(_bucket_sums(mapped[i:min(i + chunk_records, hi)], bucket_seconds))
+        pending = self._pending_in(session_id, start, end)
+        if len(pending):
+            sums.append(_bucket_sums(pending, bucket_seconds))
+        return _bucket_dicts(_merge_sums(sums), bucket_seconds)
+
+
+def _unlink(path):
+    try:
+        os.remove(path)
+        return 1
+    except OSError:
+        return 0
+
+
+def aggregate(rows, bucket_seconds):
+    """
+    Per-bucket summary of timeline rows: bucket start, frame count, share of
+    frames per presence status, and the mean engagement/emotions over the
+    frames that had an analysis (None for buckets without any).
+    """
+    if not len(rows):
+        return []
+    return _bucket_dicts(_bucket_sums(rows, bucket_seconds), bucket_seconds)
+
+
+def _bucket_sums(rows, bucket_seconds):
+    # Per-bucket totals of some rows; the rows need not be in time order
+    buckets, inv = np.unique(np.floor(rows["t"] / bucket_seconds).astype(np.int64), return_inverse=True)
+    n = len(buckets)
+    analyzed = rows["engagement"] >= 0
+    emotions = np.where(analyzed[:, None], rows["emotions"], 0).astype(np.float64)
+    return {
+        "bucket": buckets,
+        "frames": np.bincount(inv, minlength=n),
+        "analyzed": np.bincount(inv, weights=analyzed, minlength=n),
+        "engagement": np.bincount(inv, weights=np.where(analyzed, rows["engagement"], 0), minlength=n),
+        "emotions": np.stack([np.bincount(inv, weights=emotions[:, k], minlength=n) for k in range(emotions.shape[1])], axis=1),
+        "status": np.stack([np.bincount(inv, weights=rows["status"] == i, minlength=n) for i in range(len(STATUS_LABELS))], axis=1),
+    }
+
+
+def _merge_sums(sums):
+    # Adds up bucket totals of several chunks (buckets may repeat across chunks)
+    if len(sums) == 1:
+        return sums[0]
+    if not sums:
+        return None
+    buckets, inv = np.unique(np.concatenate([part["bucket"] for part in sums]), return_inverse=True)
+    merged = {"bucket": buckets}
+    for key in ("frames", "analyzed", "engagement", "emotions", "status"):
+        values = np.concatenate([part[key] for part in sums])
+        total = np.zeros((len(buckets),) + values.shape[1:], dtype=values.dtype)
+        np.add.at(total, inv, values)
+        merged[key] = total
+    return merged
+
+
+def _bucket_dicts(sums, bucket_seconds):
+    if sums is None:
+        return []
+    out = []
+    for j, bucket in enumerate(sums["bucket"].tolist()):
+        n, frames = int(sums["analyzed"][j]), int(sums["frames"][j])
+        out.append({
+            "t": float(bucket * bucket_seconds),
+            "frames": frames,
+            "analyzed": n,
+            "status": {label: round(int(sums["status"][j, i]) / frames, 4) for i, label in enumerate(STATUS_LABELS)},
+            "engagement": round(float(sums["engagement"][j]) / n, 2) if n else None,
+            "emotions": dict(zip(EMOTION_LABELS, np.round(sums["emotions"][j] / n, 4).tolist())) if n else None,
+        })
+    return out
+
+
+def to_dicts(rows):
+    """
+    JSON-friendly form of raw timeline rows.
+    """
+    return [
+        {
+            "t": float(r["t"]),
+            "status": STATUS_LABELS[r["status"]] if 0 <= r["status"] < len(STATUS_LABELS) else None,
+            "engagement": int(r["engagement"]) if r["engagement"] >= 0 else None,
+            "valence": VALENCE_LABELS[r["valence"]] if r["valence"] >= 0 else None,
+            "emotions": dict(zip(EMOTION_LABELS, np.round(r["emotions"].astype(np.float64), 4).tolist())) if r["engagement"] >= 0 else None,
+            "reused": bool(r["reused"]),
+            "faces": int(r["faces"]),
+        }
+        for r in rows
+    ]
@@ -0,0 +1,387 @@
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Traces the current code is working for. A tuple, because a micro-batched
+# forward works for every request in the batch at once.
+_active = contextvars.ContextVar("traces", default=())
+
+# Pseudo thread id for spans measured on the event loop: they span awaits,
+# so they carry wall time only and would otherwise interleave with the
+# spans of other requests on the loop thread.
+ASYNC_TID = 0
+
+
+class Trace:
+    """
+    Spans of one request, as Chrome trace events.
+
+    Spans measured on a worker thread carry wall and thread CPU time; the
+    difference is time spent off-CPU (waiting on the GIL, I/O or a torch
+    thread pool). Optional profiler samples are Python stacks of the
+    threads working for the request.
+    """
+
+    def __init__(self, name, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.started_at = time.time()
+        self.start_ns = time.perf_counter_ns()
+        self.duration_ms = None
+        self.events = []
+        self.samples = Counter()
+        self.thread_names = {ASYNC_TID: "request (event loop)"}
+        self._lock = threading.Lock()
+
+    def add(self, event, thread_name=None):
+        with self._lock:
+            self.events.append(event)
+            if thread_name is not None:
+                self.thread_names.setdefault(event["tid"], thread_name)
+
+    def add_sample(self, stack):
+        with self._lock:
+            self.samples[stack] += 1
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter_ns() - self.start_ns) / 1e6
+
+    def summary(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "spans": len(self.events),
+            "samples": sum(self.samples.values()),
+        }
+
+    def to_chrome(self):
+        """
+        Chrome trace-event JSON (chrome://tracing, Perfetto, speedscope).
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            names = dict(self.thread_names)
+        meta = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": self.name}}]
+        meta += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                 for tid, name in names.items()]
+        return {
+            "traceEvents": meta + [dict(e, pid=pid) for e in events],
+            "displayTimeUnit": "ms",
+            "otherData": self.summary(),
+        }
+
+    def folded(self):
+        """
+        Profiler samples as folded stacks ("outer;inner count" per line), for
+        flamegraph.pl or speedscope.
+        """
+        with self._lock:
+            items = sorted(self.samples.items(), key=lambda kv: kv[1], reverse=True)
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+
+class _Span:
+    __slots__ = ("name", "args", "cpu", "traces", "t0", "c0")
+
+    def __init__(self, name, args, cpu, traces):
+        self.name = name
+        self.args = args
+        self.cpu = cpu
+        self.traces = traces
+
+    def __enter__(self):
+        if self.cpu:
+            _sampler.enter(self.traces)
+            self.c0 = time.thread_time_ns()
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter_ns()
+        args = dict(self.args) if self.args else {}
+        if self.cpu:
+            args["cpu_ms"] = round((time.thread_time_ns() - self.c0) / 1e6, 3)
+            _sampler.exit(self.traces)
+            thread = threading.current_thread()
+            tid, thread_name = thread.ident, thread.name
+        else:
+            tid, thread_name = ASYNC_TID, None
+        if exc[0] is not None:
+            args["error"] = exc[0].__name__
+        event = {"name": self.name, "cat": self.name.split(".")[0], "ph": "X",
+                 "ts": self.t0 / 1000.0, "dur": (t1 - self.t0) / 1000.0, "tid": tid, "args": args}
+        for trace in self.traces:
+            trace.add(event, thread_name)
+        return False
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, cpu=True, **args):
+    """
+    Times a block for the current request's trace; free when none is active.
+    cpu=False for blocks that await (wall time only, on the request row).
+    """
+    traces = _active.get()
+    if not traces:
+        return _NO_SPAN
+    return _Span(name, args, cpu, traces)
+
+
+def active():
+    return _active.get()
+
+
+def activate(traces):
+    """
+    Makes `traces` (a Trace or a tuple of them) current; returns a token for deactivate().
+    """
+    if isinstance(traces, Trace):
+        traces = (traces,)
+    return _active.set(tuple(traces))
+
+
+def deactivate(token):
+    _active.reset(token)
+
+
+class StackSampler:
+    """
+    Sampling profiler for traced requests: while a thread is inside a CPU
+    span, its Python stack is sampled every `interval` seconds via
+    sys._current_frames() and counted into the traces it works for.
+    Idle when nothing is traced.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.enabled = False
+        # thread ident -> [traces, depth]
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self.enabled = True
+        # A thread started before a fork is gone in the child; start a new one there
+        if self._thread is None or not self._thread.is_alive():
+            self._threads.clear()
+            self._thread = threading.Thread(target=self._run, name="trace-sampler", daemon=True)
+            self._thread.start()
+
+    def enter(self, traces):
+        if not self.enabled:
+            return
+        ident = threading.get_ident()
+        with self._lock:
+            entry = self._threads.get(ident)
+            if entry is None:
+                self._threads[ident] = [traces, 1]
+            else:
+                entry[1] += 1
+
+    def exit(self, traces):
+        if not self.enabled:
+            return
+        ident = threading.get_ident()
+        with self._lock:
+            entry = self._threads.get(ident)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._threads[ident]
+
+    def _run(self):
+        own = threading.get_ident()
+        while self.enabled:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._threads:
+                    continue
+                threads = {ident: entry[0] for ident, entry in self._threads.items()}
+            frames = sys._current_frames()
+            for ident, traces in threads.items():
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                stack = self._stack(frame)
+                for trace in traces:
+                    trace.add_sample(stack)
+
+    def _stack(self, frame):
+        parts = []
+        while frame is not None and len(parts) < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+
+_sampler = StackSampler()
+
+
+class TraceStore:
+    """
+    Decides which requests are traced and keeps the finished traces: the
+    last `keep` ones, plus the `keep_slowest` slowest (which keep their
+    profiler samples; other traces drop them). With `directory`, every kept
+    trace is also written there as <trace_id>.json by a background writer,
+    keeping at most `max_files` of them (oldest deleted first).
+    """
+
+    def __init__(self, sample_rate=0.0, keep=100, keep_slowest=10, directory=None, profile=False, profile_interval=0.005,
+                 max_files=1000):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.max_files = max_files
+        self.profile = profile
+        self.keep_slowest = keep_slowest
+        self._recent = deque(maxlen=keep)
+        self._slowest = []
+        self._lock = threading.Lock()
+        # Created on first write, so not before serve.py forks
+        self._writer = None
+        self._written = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if profile:
+            _sampler.interval = profile_interval
+
+    def start(self):
+        # In each serving process (serve.py imports the app before forking)
+        if self.profile:
+            _sampler.start()
+
+    def close(self):
+        # Waits for pending trace files
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+
+    def should_trace(self, requested=False):
+        return requested or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def finish(self, trace):
+        trace.finish()
+        with self._lock:
+            self._recent.append(trace)
+            self._slowest.append(trace)
+            self._slowest.sort(key=lambda t: t.duration_ms, reverse=True)
+            for dropped in self._slowest[self.keep_slowest:]:
+                dropped.samples.clear()
+            del self._slowest[self.keep_slowest:]
+            if self.directory:
+                # Callers are often on the event loop; serializing a trace is not free
+                if self._writer is None:
+                    self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-writer")
+                self._writer.submit(self._write, trace)
+
+    def _write(self, trace):
+        try:
+            with open(os.path.join(self.directory, f"{trace.trace_id}.json"), "w") as f:
+                json.dump(trace.to_chrome(), f)
+        except OSError as e:
+            print(f"Trace write error: {e}")
+            return
+        if self._written is None:
+            self._written = len(self._files())
+        else:
+            self._written += 1
+        if self.max_files and self._written > self.max_files:
+            self._rotate()
+
+    def _rotate(self):
+        # Other serving processes write to the same directory, so count what is there
+        files = sorted(self._files(), key=lambda entry: entry[0])
+        for _, path in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        self._written = min(len(files), self.max_files)
+
+    def _files(self):
+        # (mtime, path) of every trace file in the directory
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        return files
+
+    def get(self, trace_id):
+        with self._lock:
+            for trace in list(self._recent) + self._slowest:
+                if trace.trace_id == trace_id:
+                    return trace
+        return None
+
+    def recent(self):
+        with self._lock:
+            return [t.summary() for t in reversed(self._recent)]
+
+    def slowest(self):
+        with self._lock:
+            return [t.summary() for t in self._slowest]
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware tracing HTTP requests under `prefix`, when the `header`
+    is "1" or the store samples them. Untraced requests pass straight
+    through; traced ones get an X-Trace-Id response header.
+    """
+
+    def __init__(self, app, store, header="X-Trace", prefix="/"):
+        self.app = app
+        self.store = store
+        self.header = header.lower().encode("latin-1")
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            return await self.app(scope, receive, send)
+        requested = any(name == self.header and value == b"1" for name, value in scope["headers"])
+        if not self.store.should_trace(requested):
+            return await self.app(scope, receive, send)
+
+        trace = Trace(scope["path"])
+        trace_id = trace.trace_id.encode("latin-1")
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", ())) + [(b"x-trace-id", trace_id)])
+            await send(message)
+
+        token = activate(trace)
+        try:
+            with span("request", cpu=False):
+                await self.app(scope, receive, send_with_id)
+        finally:
+            deactivate(token)
+            self.store.finish(trace)
@@ -0,0 +1,146 @@
+import threading
+
+import cv2
+
+
+class FaceTracker:
+    """
+    Per-session face localizer. A coder in front of a webcam barely moves
+    between frames, so a full-frame Haar search is only run every
+    `redetect_every` frames or when the face is lost; in between we either
+
+    - "roi": search a small window around the last box, restricted to
+      face sizes close to the last one, or
+    - "tracker": follow the last box with a lightweight OpenCV tracker (MIL).
+
+    locate() returns (x, y, w, h) in frame coordinates, or None. Pass
+    `search` (a no-argument callable returning a box or None) to replace the
+    full-frame Haar pass, e.g. with a person-box-guided search. With a
+    `locator` (services.face.FaceLocator) using yunet or dnn, the ROI
+    search runs that detector instead of Haar.
+    """
+
+    def __init__(self, mode="roi", redetect_every=15, roi_margin=0.5, scale_range=(0.7, 1.4), min_confidence=0.0,
+                 locator=None):
+        self.mode = mode
+        self.redetect_every = redetect_every
+        self.roi_margin = roi_margin
+        self.scale_range = scale_range
+        # Haar levelWeight below which an ROI hit counts as lost
+        self.min_confidence = min_confidence
+        self.locator = locator
+
+        self.box = None
+        self.frames_since_detect = 0
+        self.full_detections = 0
+        self.local_detections = 0
+
+        self._tracker = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.box = None
+            self._tracker = None
+
+    def locate(self, img, cascade, gray=None, min_size=(30, 30), search=None):
+        return self.locate_with_source(img, cascade, gray, min_size, search)[0]
+
+    def locate_with_source(self, img, cascade, gray=None, min_size=(30, 30), search=None):
+        """
+        locate(), plus how the box was found: "roi" or "tracker" when the
+        last face was followed, "search" for a full search.
+        """
+        with self._lock:
+            box = None
+            if self.box is not None and self.frames_since_detect < self.redetect_every:
+                if self.mode == "tracker":
+                    box = self._follow(img)
+                else:
+                    box = self._search_roi(img, cascade, gray)
+
+            if box is not None:
+                source = "tracker" if self.mode == "tracker" else "roi"
+                self.local_detections += 1
+                self.frames_since_detect += 1
+            else:
+                source = "search"
+                # Periodic refresh, first frame, or the face slipped out of the ROI
+                box = search() if search is not None else self._search_full(img, cascade, gray, min_size)
+                self.full_detections += 1
+                # The search frame counts, so a search runs every redetect_every frames
+                self.frames_since_detect = 1
+                self._tracker = None
+                if box is not None and self.mode == "tracker":
+                    self._start_tracker(img, box)
+
+            self.box = box
+            return box, source
+
+    def _search_full(self, img, cascade, gray, min_size):
+        if cascade is None:
+            return None
+        if gray is None:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4, minSize=min_size)
+        if len(faces) == 0:
+            return None
+        return tuple(int(v) for v in max(faces, key=lambda f: f[2] * f[3]))
+
+    def _search_roi(self, img, cascade, gray):
+        x, y, w, h = self.box
+        mx, my = int(w * self.roi_margin), int(h * self.roi_margin)
+        x1, y1 = max(0, x - mx), max(0, y - my)
+        x2, y2 = min(img.shape[1], x + w + mx), min(img.shape[0], y + h + my)
+        if x2 - x1 < 8 or y2 - y1 < 8:
+            return None
+
+        lo, hi = self.scale_range
+        min_side = max(20, int(min(w, h) * lo))
+        max_side = max(min_side + 1, int(max(w, h) * hi))
+        if self.locator is not None and self.locator.detector != "haar":
+            # Same detector as the full search, on the small window
+            return self.locator.search_region(img, (x1, y1, x2, y2), min_side, max_side)
+
+        if cascade is None:
+            return None
+
+        # Only the window is converted to grayscale
+        if gray is not None:
+            roi = gray[y1:y2, x1:x2]
+        else:
+            roi = cv2.cvtColor(img[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+
+        faces, _, weights = cascade.detectMultiScale3(
+            roi, scaleFactor=1.1, minNeighbors=4,
+            minSize=(min_side, min_side), maxSize=(max_side, max_side),
+            outputRejectLevels=True,
+        )
+        if len(faces) == 0:
+            return None
+
+        best = max(range(len(faces)), key=lambda i: faces[i][2] * faces[i][3])
+        if self.min_confidence and len(weights) and float(weights[best]) < self.min_confidence:
+            return None
+        fx, fy, fw, fh = faces[best]
+        return int(fx + x1), int(fy + y1), int(fw), int(fh)
+
+    def _start_tracker(self, img, box):
+        create = getattr(cv2, "TrackerMIL_create", None)
+        if create is None:
+            return
+        self._tracker = create()
+        self._tracker.init(img, tuple(int(v) for v in box))
+
+    def _follow(self, img):
+        if self._tracker is None:
+            return None
+        ok, box = self._tracker.update(img)
+        if not ok:
+            return None
+        x, y, w, h = (int(v) for v in box)
+        # Reject boxes that drifted off the frame
+        if w <= 0 or h <= 0 or x + w <= 0 or y + h <= 0 or x >= img.shape[1] or y >= img.shape[0]:
+            return None
+        x, y = max(0, x), max(0, y)
+        return x, y, min(w, img.shape[1] - x), min(h, img.shape[0] - y)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The backend is run from its own directory (`from services.x import ...`)
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
@@ -0,0 +1,192 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services.admission import AdmissionController, LatestFrame, Overloaded, Superseded
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _wait_for(predicate, timeout=1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not reached")
+        await asyncio.sleep(0.005)
+
+
+def test_admits_up_to_max_active_then_queues():
+    async def scenario():
+        ctl = AdmissionController(max_active=2, max_queued=4, deadline=1.0)
+        await ctl.acquire()
+        await ctl.acquire()
+        waiter = asyncio.create_task(ctl.acquire())
+        await _wait_for(lambda: ctl.queued == 1)
+        assert not waiter.done()
+        ctl.release()
+        await waiter
+        assert ctl.active == 2 and ctl.queued == 0
+
+    run(scenario())
+
+
+def test_queue_full_is_shed():
+    async def scenario():
+        ctl = AdmissionController(max_active=1, max_queued=0, deadline=1.0)
+        await ctl.acquire()
+        with pytest.raises(Overloaded) as e:
+            await ctl.acquire()
+        assert e.value.reason == "queue_full"
+        assert e.value.retry_after >= 1
+
+    run(scenario())
+
+
+def test_deadline_is_shed_and_slot_not_leaked():
+    async def scenario():
+        ctl = AdmissionController(max_active=1, max_queued=4, deadline=0.05)
+        await ctl.acquire()
+        with pytest.raises(Overloaded) as e:
+            await ctl.acquire()
+        assert e.value.reason == "deadline"
+        assert ctl.queued == 0
+        ctl.release()
+        assert ctl.active == 0
+
+    run(scenario())
+
+
+def test_newer_frame_supersedes_waiting_one():
+    async def scenario():
+        ctl = AdmissionController(max_active=1, max_queued=4, deadline=1.0)
+        await ctl.acquire()
+        older = asyncio.create_task(ctl.acquire("s"))
+        await _wait_for(lambda: ctl.queued == 1)
+        newer = asyncio.create_task(ctl.acquire("s"))
+        with pytest.raises(Superseded):
+            await older
+        ctl.release()
+        await newer
+        assert ctl.active == 1 and ctl.queued == 0
+
+    run(scenario())
+
+
+def test_latest_frame_drops_unseen():
+    async def scenario():
+        box = LatestFrame()
+        box.put(b"1")
+        box.put(b"2")
+        assert await box.get() == b"2"
+        assert box.take_dropped() == 1
+        box.close()
+        assert await box.get() is None
+
+    run(scenario())
+
+
+# API paths: the slot is held by the test, so no request reaches the models
+
+@pytest.fixture
+def api_module():
+    return pytest.importorskip("api")
+
+
+@pytest.fixture
+def install_admission(api_module, monkeypatch):
+    def install(**kwargs):
+        ctl = AdmissionController(**kwargs)
+        monkeypatch.setattr(api_module, "admission", ctl)
+        return ctl
+    return install
+
+
+def _post(client, session_id=None):
+    headers = {"X-Session-Id": session_id} if session_id else {}
+    return client.post("/predict", files={"file": ("a.jpg", b"jpeg", "image/jpeg")}, headers=headers)
+
+
+def _client(api):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test")
+
+
+def test_predict_over_capacity_returns_503_with_retry_after(api_module, install_admission):
+    async def scenario():
+        ctl = install_admission(max_active=1, max_queued=0, deadline=1.0)
+        await ctl.acquire()
+        async with _client(api_module) as client:
+            r = await _post(client)
+        assert r.status_code == 503
+        assert int(r.headers["Retry-After"]) >= 1
+        assert r.json()["reason"] == "queue_full"
+
+    run(scenario())
+
+
+def test_predict_past_deadline_returns_503(api_module, install_admission):
+    async def scenario():
+        ctl = install_admission(max_active=1, max_queued=4, deadline=0.05)
+        await ctl.acquire()
+        async with _client(api_module) as client:
+            r = await _post(client)
+        assert r.status_code == 503
+        assert r.json()["reason"] == "deadline"
+
+    run(scenario())
+
+
+def test_predict_superseded_returns_409(api_module, install_admission):
+    async def scenario():
+        ctl = install_admission(max_active=1, max_queued=4, deadline=0.3)
+        await ctl.acquire()
+        async with _client(api_module) as client:
+            older = asyncio.create_task(_post(client, "s"))
+            await _wait_for(lambda: ctl.queued == 1)
+            newer = asyncio.create_task(_post(client, "s"))
+            r = await older
+            assert r.status_code == 409
+            assert r.json() == {"error": "superseded"}
+            # The newer one still can't get the held slot
+            assert (await newer).status_code == 503
+
+    run(scenario())
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.inbox = asyncio.Queue()
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    async def receive(self):
+        return await self.inbox.get()
+
+
+def test_stream_survives_superseded_frame(api_module, install_admission):
+    async def scenario():
+        ctl = install_admission(max_active=1, max_queued=4, deadline=1.0)
+        await ctl.acquire()
+        ws = FakeWebSocket()
+        handler = asyncio.create_task(api_module.stream(ws, session_id="s"))
+        ws.inbox.put_nowait({"type": "websocket.receive", "bytes": b"jpeg"})
+        await _wait_for(lambda: ctl.queued == 1)
+
+        # Same session from elsewhere (a second socket or /predict)
+        other = asyncio.create_task(ctl.acquire("s"))
+        await _wait_for(lambda: any(m.get("error") == "superseded" for m in ws.sent))
+        assert not handler.done()
+
+        ws.inbox.put_nowait({"type": "websocket.disconnect"})
+        await asyncio.wait_for(handler, timeout=1.0)
+        ctl.release()
+        await other
+
+    run(scenario())
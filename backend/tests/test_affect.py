@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from services.affect import AffectEngine
+from services.emotion import EMOTION_LABELS, scores_vector
+
+# Replayed through frontend/src/hooks/useAffectState.ts (Date.now() stubbed to t):
+# (t, scores, stress, bored, confused, confident, mode)
+HOOK_REPLAY = [
+    (0.0, dict(neutral=0.8, happiness=0.1, surprise=0.1), 0, 0.8, 0.1, 0.1, "neutral"),
+    (0.5, dict(neutral=0.8, happiness=0.1, surprise=0.1), 0, 0.8, 0.1, 0.1, "neutral"),
+    (1.0, dict(neutral=0.8, happiness=0.1, surprise=0.1), 0, 0.8, 0.1, 0.1, "neutral"),
+    (1.5, dict(neutral=0.8, happiness=0.1, surprise=0.1), 0, 0.8, 0.1, 0.1, "neutral"),
+    # Focused timer reaches 2s
+    (2.0, dict(neutral=0.8, happiness=0.1, surprise=0.1), 0, 0.8, 0.1, 0.1, "focused"),
+    # Surprise + fear rising above its 5-frame average: +0.2
+    (2.5, dict(surprise=0.5, fear=0.2, neutral=0.3), 0.2, 0.3, 0.9, -0.2, "neutral"),
+    (3.0, dict(surprise=0.5, fear=0.2, neutral=0.3), 0.2, 0.3, 0.9, -0.2, "confused"),
+    (3.5, dict(surprise=0.5, fear=0.2, neutral=0.3), 0.2, 0.3, 0.9, -0.2, "confused"),
+    (4.0, dict(surprise=0.5, fear=0.2, neutral=0.3), 0.2, 0.3, 0.9, -0.2, "confused"),
+    # The window includes the current frame: all five at 0.7, no boost
+    (4.5, dict(surprise=0.5, fear=0.2, neutral=0.3), 0.2, 0.3, 0.7, -0.2, "confused"),
+    (5.0, dict(anger=0.5, neutral=0.5), 0.5, 0.5, 0, 0, "neutral"),
+    (5.5, dict(anger=0.5, neutral=0.5), 0.5, 0.5, 0, 0, "neutral"),
+    (6.0, dict(anger=0.5, neutral=0.5), 0.5, 0.5, 0, 0, "angry_frustrated"),
+    # The angry timer decays instead of resetting
+    (6.5, dict(happiness=0.9, neutral=0.1), 0, 0.1, 0, 0.9, "neutral"),
+    (7.0, dict(happiness=0.9, neutral=0.1), 0, 0.1, 0, 0.9, "neutral"),
+    (7.5, dict(happiness=0.9, neutral=0.1), 0, 0.1, 0, 0.9, "neutral"),
+    (8.0, dict(happiness=0.9, neutral=0.1), 0, 0.1, 0, 0.9, "calm_exploratory"),
+    (8.5, dict(sadness=0.38, neutral=0.62), 0.38, 0.62, 0, 0, "neutral"),
+    (9.0, dict(sadness=0.38, neutral=0.62), 0.38, 0.62, 0, 0, "neutral"),
+    (9.5, dict(sadness=0.38, neutral=0.62), 0.38, 0.62, 0, 0, "neutral"),
+    (10.0, dict(sadness=0.38, neutral=0.62), 0.38, 0.62, 0, 0, "focused"),
+    # Tired wins over focused once its timer reaches 2.5s
+    (10.5, dict(sadness=0.38, neutral=0.62), 0.38, 0.62, 0, 0, "tired"),
+    (11.0, dict(sadness=0.38, neutral=0.62), 0.38, 0.62, 0, 0, "tired"),
+    # A 2s gap counts as one step of dt
+    (13.0, dict(neutral=0.9, happiness=0.1), 0, 0.9, 0, 0.1, "focused"),
+    (13.5, dict(neutral=0.9, happiness=0.1), 0, 0.9, 0, 0.1, "focused"),
+]
+
+
+def test_matches_the_frontend_hook():
+    engine = AffectEngine()
+    for t, scores, stress, bored, confused, confident, mode in HOOK_REPLAY:
+        state = engine.update(scores, now=t)
+        expected = dict(stress=stress, bored=bored, confused=confused, confident=confident, mode=mode)
+        assert state == pytest.approx(expected, abs=1e-4), f"t={t}"
+
+
+def test_mean_covers_the_last_history_frames():
+    rng = np.random.default_rng(0)
+    engine = AffectEngine(history=20)
+    frames = rng.dirichlet(np.ones(len(EMOTION_LABELS)), size=45).astype(np.float32)
+    for i, vec in enumerate(frames):
+        engine.update(dict(zip(EMOTION_LABELS, vec.tolist())), now=i * 0.1)
+        assert len(engine) == min(i + 1, 20)
+        assert engine.mean() == pytest.approx(frames[max(0, i - 19):i + 1].mean(axis=0), abs=1e-5)
+    assert engine.mean().shape == scores_vector({}).shape
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from services.backends import HSEMOTION_LABELS, EmotionBackend, preprocess_faces
+
+
+class ZeroBackend(EmotionBackend):
+    name = "zero"
+
+    def forward(self, batch):
+        return np.zeros((len(batch), len(self.labels)), dtype=np.float32)
+
+
+def test_incomplete_backend_fails_at_construction():
+    class NoForward(EmotionBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        EmotionBackend()
+    with pytest.raises(TypeError):
+        NoForward()
+
+
+def test_backend_shares_preprocessing_and_softmax():
+    faces = [np.zeros((50, 40, 3), dtype=np.uint8), np.full((30, 30, 3), 255, dtype=np.uint8)]
+    backend = ZeroBackend(img_size=64)
+    assert np.array_equal(backend.preprocess(faces), preprocess_faces(faces, 64))
+    probs = backend.predict_proba(faces)
+    assert probs.shape == (2, len(HSEMOTION_LABELS))
+    assert np.allclose(probs, 1.0 / len(HSEMOTION_LABELS))
@@ -0,0 +1,55 @@
+import queue
+
+import pytest
+
+batch_process = pytest.importorskip("batch_process")
+from batch_process import STOP, FrameItem, Stage, write_ordered
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+
+def _run_stage(fn, items, batch_size=1):
+    inbox, outbox = queue.Queue(), queue.Queue()
+    for item in items:
+        inbox.put(item)
+    inbox.put(STOP)
+    stage = Stage("test", fn, inbox, outbox, workers=2, batch_size=batch_size).start()
+    sink = ListSink()
+    written = write_ordered(outbox, sink)
+    stage.join()
+    return stage, sink, written
+
+
+def test_stage_failure_marks_items_and_still_stops():
+    def fn(items):
+        for item in items:
+            if item.index == 2:
+                raise RuntimeError("corrupt frame")
+            item.status = "ok"
+            yield item
+
+    items = [FrameItem("src", i) for i in range(5)]
+    stage, sink, written = _run_stage(fn, items)
+    assert written == 5
+    assert [row["status"] for row in sink.rows] == ["ok", "ok", "error", "ok", "ok"]
+    assert stage.errors == 1
+
+
+def test_failed_batch_forwards_unprocessed_items():
+    def fn(items):
+        first = items[0]
+        first.status = "ok"
+        yield first
+        raise RuntimeError("model error")
+
+    items = [FrameItem("src", i) for i in range(4)]
+    stage, sink, written = _run_stage(fn, items, batch_size=4)
+    assert written == 4
+    assert sink.rows[0]["status"] == "ok"
+    assert stage.errors == len(items) - sum(row["status"] == "ok" for row in sink.rows)
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from services.batching import MicroBatcher
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Recorder:
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        if self.fail_on in items:
+            raise ValueError(f"bad item {self.fail_on}")
+        return [item * 10 for item in items]
+
+
+def test_flushes_when_batch_is_full():
+    async def scenario():
+        fn = Recorder()
+        batcher = MicroBatcher(fn, max_batch_size=3, max_wait_ms=5000)
+        start = time.perf_counter()
+        results = await asyncio.wait_for(batcher.submit_many([1, 2, 3]), timeout=1.0)
+        assert time.perf_counter() - start < 1.0
+        assert results == [10, 20, 30]
+        assert fn.batches == [[1, 2, 3]]
+
+    run(scenario())
+
+
+def test_flushes_partial_batch_after_max_wait():
+    async def scenario():
+        fn = Recorder()
+        batcher = MicroBatcher(fn, max_batch_size=8, max_wait_ms=30)
+        start = time.perf_counter()
+        results = await batcher.submit_many([1, 2])
+        assert time.perf_counter() - start >= 0.03
+        assert results == [10, 20]
+        assert fn.batches == [[1, 2]]
+
+    run(scenario())
+
+
+def test_each_submitter_gets_its_own_result():
+    async def scenario():
+        fn = Recorder()
+        batcher = MicroBatcher(fn, max_batch_size=4, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+        assert results == [i * 10 for i in range(10)]
+        assert [len(b) for b in fn.batches] == [4, 4, 2]
+
+    run(scenario())
+
+
+def test_failing_item_only_fails_its_submitter():
+    async def scenario():
+        fn = Recorder(fail_on=2)
+        batcher = MicroBatcher(fn, max_batch_size=3, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in (1, 2, 3)), return_exceptions=True)
+        assert results[0] == 10 and results[2] == 30
+        assert isinstance(results[1], ValueError)
+        # One failed batch, then each item alone
+        assert fn.batches == [[1, 2, 3], [1], [2], [3]]
+
+    run(scenario())
+
+
+def test_single_item_error_is_raised():
+    async def scenario():
+        batcher = MicroBatcher(Recorder(fail_on=1), max_batch_size=4, max_wait_ms=1)
+        with pytest.raises(ValueError):
+            await batcher.submit(1)
+
+    run(scenario())
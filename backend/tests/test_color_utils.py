@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+import pytest
+
+from color_utils import ColorAnalyzer, dominant_color, get_skin_tone_prediction
+
+# BGR
+SHIRT = (170, 70, 30)
+COLLAR = (235, 235, 235)
+BACKGROUND = (40, 90, 60)
+LIGHT_SKIN = (150, 180, 225)
+DARK_SKIN = (45, 65, 95)
+
+
+def _patch(parts, size=(96, 96), noise=6, seed=0):
+    """
+    Image of horizontal bands, `parts` being (bgr, share) pairs, plus Gaussian noise.
+    """
+    rng = np.random.default_rng(seed)
+    img = np.empty(size + (3,), dtype=np.float64)
+    row = 0
+    for color, share in parts:
+        rows = int(round(share * size[0]))
+        img[row:row + rows] = color
+        row += rows
+    img[row:] = parts[-1][0]
+    img += rng.normal(0, noise, img.shape)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+CLOTHING = _patch([(SHIRT, 0.6), (COLLAR, 0.15), (BACKGROUND, 0.25)])
+
+
+def _close(color, expected, tol=8):
+    return max(abs(int(a) - int(b)) for a, b in zip(color, expected)) <= tol
+
+
+def test_dominant_color_of_clothing_patch():
+    assert _close(dominant_color(CLOTHING), SHIRT)
+    # Same answer when seeded from the previous frame's centers
+    analyzer = ColorAnalyzer()
+    analyzer.dominant_color(CLOTHING)
+    assert _close(analyzer.dominant_color(CLOTHING, warm=True), SHIRT)
+
+
+def test_dominant_color_matches_sklearn_kmeans():
+    KMeans = pytest.importorskip("sklearn.cluster").KMeans
+    for seed, parts in enumerate([
+        [(SHIRT, 0.6), (COLLAR, 0.15), (BACKGROUND, 0.25)],
+        [(LIGHT_SKIN, 0.45), (BACKGROUND, 0.35), (SHIRT, 0.2)],
+        [(DARK_SKIN, 0.5), (COLLAR, 0.3), (SHIRT, 0.2)],
+    ]):
+        img = _patch(parts, seed=seed)
+        # The former implementation
+        pixels = cv2.resize(img, (64, 64)).reshape(-1, 3)
+        kmeans = KMeans(n_clusters=3, n_init=10, random_state=0)
+        labels = kmeans.fit_predict(pixels)
+        expected = kmeans.cluster_centers_[np.argmax(np.bincount(labels))]
+        assert _close(dominant_color(img), expected, tol=4)
+
+
+def _masked_brightness(img):
+    # Reference: mean HSV value over the skin mask, whole crop under 5% skin
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, np.array([0, 20, 50], np.uint8), np.array([25, 255, 255], np.uint8))
+    mask |= cv2.inRange(hsv, np.array([170, 20, 50], np.uint8), np.array([180, 255, 255], np.uint8))
+    values = hsv[..., 2][mask > 0]
+    return values.mean() if len(values) >= 0.05 * mask.size else hsv[..., 2].mean()
+
+
+@pytest.mark.parametrize("parts, tone", [
+    ([(LIGHT_SKIN, 0.7), (BACKGROUND, 0.3)], "White"),
+    ([(DARK_SKIN, 0.7), (COLLAR, 0.3)], "Black"),
+    # No skin at all: the whole crop's brightness decides
+    ([(SHIRT, 1.0)], "White"),
+    ([(BACKGROUND, 1.0)], "Black"),
+])
+def test_skin_tone_classification(parts, tone):
+    img = _patch(parts, seed=3)
+    assert ColorAnalyzer().skin_brightness(img) == pytest.approx(_masked_brightness(img))
+    prediction, remedies = get_skin_tone_prediction(img)
+    assert prediction == tone and len(remedies) == 5
+
+
+def test_empty_crops():
+    assert dominant_color(np.empty((0, 0, 3), np.uint8)) == (0, 0, 0)
+    assert get_skin_tone_prediction(np.empty((0, 0, 3), np.uint8)) == ("Unknown", [])
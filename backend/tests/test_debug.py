@@ -0,0 +1,95 @@
+import asyncio
+import base64
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from services.debug import debug_image_url, encode_debug, render_debug
+from services.frame import decode_image, frame_from_image
+
+ANALYSIS = {"valence": "Positive", "engagement_score": 80}
+
+
+def _result(status="ok", persons=(), phones=(), face_coords=None, analysis=None, faces=None):
+    return SimpleNamespace(status=status, persons=list(persons), phones=list(phones), face_coords=face_coords,
+                           analysis=analysis, faces=faces, reused=False)
+
+
+def _img(w=640, h=480):
+    return np.zeros((h, w, 3), dtype=np.uint8)
+
+
+def test_nothing_to_draw_returns_the_image_itself():
+    img = _img()
+    assert render_debug(img, _result()) is img
+
+
+def test_face_box_is_drawn_on_a_copy():
+    img = _img()
+    vis = render_debug(img, _result(face_coords=[100, 80, 200, 200], analysis=ANALYSIS))
+    assert vis is not img and not img.any()
+    # Green rectangle along the face box
+    assert tuple(vis[80, 150]) == (0, 255, 0)
+
+
+def test_preview_scales_image_and_boxes():
+    vis = render_debug(_img(), _result(status="no_user", persons=[[320, 240, 640, 480]]), max_width=160)
+    assert vis.shape == (120, 160, 3)
+    # The person box is drawn at a quarter of its coordinates
+    assert tuple(vis[60, 100]) == (255, 0, 0)
+
+
+def test_debug_image_url():
+    assert debug_image_url(b"") is None
+    url = debug_image_url(b"\xff\xd8jpeg")
+    assert url.startswith("data:image/jpeg;base64,")
+    assert base64.b64decode(url.split(",", 1)[1]) == b"\xff\xd8jpeg"
+
+
+# /predict payloads per debug mode
+
+@pytest.fixture
+def api():
+    return pytest.importorskip("api")
+
+
+def _respond(api, mode):
+    img = _img()
+    img[100:300, 200:400] = 90
+    result = _result(persons=[[150, 50, 450, 470]], face_coords=[220, 110, 120, 150], analysis=ANALYSIS)
+    frame = frame_from_image(img, work_width=320)
+    return img, result, asyncio.run(api._respond(result, frame, mode))
+
+
+def _jpeg(response):
+    return base64.b64decode(response["debug_image"].split(",", 1)[1])
+
+
+def test_debug_off(api):
+    _, _, response = _respond(api, "off")
+    assert response["debug_image"] is None
+    assert "boxes" not in response
+    assert response["analysis"] == ANALYSIS and response["status"] == "ok"
+
+
+def test_debug_boxes(api):
+    _, _, response = _respond(api, "boxes")
+    assert response["debug_image"] is None
+    assert response["boxes"] == {"persons": [[150, 50, 450, 470]], "phones": [], "face": [220, 110, 120, 150]}
+
+
+def test_debug_preview(api):
+    img, result, response = _respond(api, "preview")
+    jpg = _jpeg(response)
+    assert decode_image(jpg).shape[1] == api.config.DEBUG_PREVIEW_WIDTH
+    assert jpg == encode_debug(img, result, api.config.DEBUG_PREVIEW_WIDTH, api.config.DEBUG_PREVIEW_QUALITY)
+    assert "boxes" in response
+
+
+def test_debug_full(api):
+    img, result, response = _respond(api, "full")
+    jpg = _jpeg(response)
+    assert decode_image(jpg).shape == img.shape
+    assert jpg == encode_debug(img, result)
+    assert len(jpg) > len(_jpeg(_respond(api, "preview")[2]))
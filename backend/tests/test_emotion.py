@@ -0,0 +1,54 @@
+import numpy as np
+
+from services.backends import HSEMOTION_LABELS, EmotionBackend
+from services.emotion import EMOTION_LABELS, VALENCE_LABELS, EmotionService, analyze_batch, analyze_scores, scores_vector
+from services.registry import ModelRegistry
+
+
+def test_scalar_and_batch_paths_agree():
+    rng = np.random.default_rng(0)
+    probs = np.stack([rng.dirichlet(np.ones(len(EMOTION_LABELS)) * a) for a in rng.uniform(0.2, 3.0, 500)])
+    batch = analyze_batch(probs)
+    for i, row in enumerate(probs):
+        analysis = analyze_scores(dict(zip(EMOTION_LABELS, row.tolist())))
+        assert analysis["valence"] == VALENCE_LABELS[batch.valence[i]]
+        assert analysis["engagement_score"] == int(batch.engagement[i])
+
+
+def test_neutral_with_secondary_emotion():
+    scores = dict.fromkeys(EMOTION_LABELS, 0.0)
+    scores.update(neutral=0.55, surprise=0.05, happiness=0.3, anger=0.1)
+    assert analyze_scores(scores)["valence"] == "Neutral-Happy"
+    assert VALENCE_LABELS[analyze_batch(scores_vector(scores)[None]).valence[0]] == "Neutral-Happy"
+
+
+def test_no_scores():
+    assert analyze_scores({}) is None
+
+
+class PickyBackend(EmotionBackend):
+    # Scores every crop as happy, but fails any batch holding an empty crop
+    name = "picky"
+
+    def predict_proba(self, faces):
+        if any(face.size == 0 for face in faces):
+            raise ValueError("empty crop")
+        probs = np.zeros((len(faces), len(self.labels)), dtype=np.float32)
+        probs[:, list(HSEMOTION_LABELS).index("Happiness")] = 1.0
+        return probs
+
+    def forward(self, batch):
+        raise NotImplementedError
+
+
+def test_bad_crop_only_loses_its_own_scores():
+    backend = PickyBackend()
+    registry = ModelRegistry()
+    registry.LOADERS = {"emotion-onnx": lambda name: backend}
+    service = EmotionService(registry=registry, backend="onnx")
+
+    good = np.zeros((48, 48, 3), dtype=np.uint8)
+    bad = np.zeros((0, 48, 3), dtype=np.uint8)
+    scores = service.predict_batch([good, bad, good])
+    assert scores[1] is None
+    assert scores[0]["happiness"] == 1.0 and scores[2]["happiness"] == 1.0
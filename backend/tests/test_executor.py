@@ -0,0 +1,98 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+
+from services import tracing
+from services.executor import InferenceExecutor
+from services.tracing import Trace
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+class Concurrency:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, seconds=0.05):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(seconds)
+        with self._lock:
+            self.current -= 1
+
+
+def test_stage_limit_is_enforced():
+    executor = InferenceExecutor(threads=8, stage_limits={"encode": 2})
+    limited, unlimited = Concurrency(), Concurrency()
+
+    async def scenario():
+        await asyncio.gather(*(executor.run("encode", limited) for _ in range(6)))
+        await asyncio.gather(*(executor.run("decode", unlimited) for _ in range(6)))
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert limited.peak == 2
+    assert unlimited.peak > 2
+
+
+def test_worker_threads_see_the_callers_context():
+    executor = InferenceExecutor(threads=2)
+
+    async def handle(rid):
+        request_id.set(rid)
+        return await executor.run("decode", request_id.get)
+
+    async def scenario():
+        return await asyncio.gather(*(handle(rid) for rid in ("a", "b", "c")))
+
+    try:
+        assert asyncio.run(scenario()) == ["a", "b", "c"]
+    finally:
+        executor.shutdown()
+
+
+def test_traced_calls_get_a_span_on_the_worker_thread():
+    executor = InferenceExecutor(threads=1)
+    trace = Trace("/predict")
+
+    async def scenario():
+        token = tracing.activate(trace)
+        try:
+            return await executor.run("presence", threading.get_ident)
+        finally:
+            tracing.deactivate(token)
+
+    try:
+        worker = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert [(e["name"], e["tid"]) for e in trace.events] == [("presence.run", worker)]
+    assert worker != threading.get_ident()
+
+
+def test_process_stages_run_in_the_process_pool():
+    executor = InferenceExecutor(threads=2, processes=1, process_stages=("encode",))
+
+    async def scenario():
+        return await executor.run("encode", os.getpid), await executor.run("decode", os.getpid)
+
+    try:
+        encode_pid, decode_pid = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert encode_pid != os.getpid()
+    assert decode_pid == os.getpid()
+
+
+def test_process_stages_need_processes():
+    executor = InferenceExecutor(threads=2, processes=0, process_stages=("encode",))
+    assert executor.process_stages == set()
+    assert executor.pool_for("encode") is executor.thread_pool
+    executor.shutdown()
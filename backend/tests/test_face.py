@@ -0,0 +1,46 @@
+import threading
+
+import numpy as np
+
+from services.face import FaceLocator, extract_face, extract_faces, head_box, local_cascade
+
+
+def _blank(w=320, h=240):
+    return np.zeros((h, w, 3), dtype=np.uint8)
+
+
+def test_no_persons_no_cascade_finds_nothing():
+    crop, coords, source = extract_face(_blank(), [], FaceLocator())
+    assert crop is None and coords is None and source == "none"
+
+
+def test_person_without_face_falls_back_to_head_estimate():
+    person = [80, 30, 240, 240]
+    crop, coords, source = extract_face(_blank(), [person], FaceLocator(), local_cascade())
+    assert source == "person_crop"
+    assert coords == list(head_box(person))
+    assert crop.shape[:2] == (coords[3], coords[2])
+
+
+def test_coordinates_are_scaled_to_the_full_frame():
+    work, full = _blank(), _blank(640, 480)
+    _, coords, _ = extract_face(work, [[80, 30, 240, 240]], FaceLocator(), None, full=full, scale=2.0)
+    assert coords == list(head_box([160, 60, 480, 480]))
+
+
+def test_multi_face_is_largest_first():
+    persons = [[0, 0, 100, 200], [150, 0, 310, 230]]
+    found = extract_faces(_blank(), persons, FaceLocator(), None)
+    assert [source for _, _, source in found] == ["person_crop", "person_crop"]
+    assert found[0][1][2] >= found[1][1][2]
+
+
+def test_local_cascade_is_per_thread():
+    cascades = []
+    t = threading.Thread(target=lambda: cascades.append(local_cascade()))
+    t.start()
+    t.join()
+    mine = local_cascade()
+    assert mine is local_cascade()
+    if mine is not None:
+        assert cascades[0] is not mine
@@ -0,0 +1,120 @@
+import asyncio
+import pickle
+
+import httpx
+import numpy as np
+import pytest
+
+from services.frame import BufferPool, decode_frame, encode_jpeg, raw_frame
+
+
+def test_pool_reuses_released_buffers():
+    pool = BufferPool(per_shape=2)
+    a = pool.acquire((4, 6, 3))
+    pool.release(a)
+    assert pool.acquire((4, 6, 3)) is a
+    assert pool.acquire((4, 6, 3)) is not a
+    assert (pool.reused, pool.allocated) == (1, 2)
+
+
+def test_pool_bounds_idle_buffers():
+    pool = BufferPool(per_shape=1, max_shapes=2)
+    first, second = pool.acquire((2, 2)), pool.acquire((2, 2))
+    pool.release(first)
+    pool.release(second)
+    assert pool.acquire((2, 2)) is first
+    assert pool.acquire((2, 2)) is not second
+    # Least recently used shape goes first
+    for shape in ((1, 1), (3, 3), (5, 5)):
+        pool.release(np.empty(shape, dtype=np.uint8))
+    assert pool.acquire((1, 1)).shape == (1, 1)
+    assert pool.reused == 1
+
+
+def test_frame_hands_pooled_buffers_back_once():
+    pool = BufferPool()
+    img = np.zeros((480, 640, 3), dtype=np.uint8)
+    frame = decode_frame(encode_jpeg(img), work_width=320, pool=pool)
+    assert frame.pooled == [frame.work]
+    frame.release()
+    frame.release()
+    assert pool.acquire(frame.work.shape) is frame.work
+    assert pool.acquire(frame.work.shape) is not frame.work
+
+
+def test_pooled_frame_can_be_pickled():
+    pool = BufferPool()
+    frame = raw_frame(np.zeros(480 * 640 * 3, np.uint8).tobytes(), 640, 480, "rgb", work_width=320, pool=pool)
+    copy = pickle.loads(pickle.dumps(frame))
+    assert copy.pooled == [] and copy.full.shape == (480, 640, 3)
+    copy.release()
+    assert pool.reused == 0
+
+
+def test_raw_frame_checks_the_size():
+    pixels = np.zeros((4, 6, 3), np.uint8)
+    assert raw_frame(pixels.tobytes(), 6, 4).work.shape == (4, 6, 3)
+    assert raw_frame(pixels.tobytes(), 6, 5) is None
+    assert raw_frame(pixels.tobytes(), 6, 4, "rgba") is None
+    assert raw_frame(pixels[..., 0].tobytes(), 6, 4, "gray").work.shape == (4, 6, 3)
+    assert raw_frame(b"", 6, 4) is None
+
+
+def test_predict_raw_rejects_mismatched_size():
+    api = pytest.importorskip("api")
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = bytes(6 * 4 * 3)
+            r = await client.post("/predict/raw?width=6&height=5", content=body)
+            assert r.status_code == 200 and r.json() == {"error": "Invalid image"}
+            r = await client.post("/predict/raw?width=6&height=4&format=yuv", content=body)
+            assert r.status_code == 422
+            r = await client.post("/predict/raw?width=0&height=4", content=body)
+            assert r.status_code == 422
+
+    asyncio.run(scenario())
+
+
+def _bbox(img):
+    # (x1, y1, x2, y2) of the bright pixels
+    ys, xs = np.nonzero(img.max(axis=2) > 128)
+    return [xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]
+
+
+@pytest.mark.parametrize("reduced", [False, True])
+def test_boxes_on_the_working_copy_map_to_the_full_frame(reduced):
+    img = np.zeros((960, 1280, 3), dtype=np.uint8)
+    box = [400, 240, 720, 560]
+    img[box[1]:box[3], box[0]:box[2]] = 255
+    frame = decode_frame(encode_jpeg(img), work_width=320, reduced=reduced)
+
+    # 1280 -> 320: the reduced path decodes straight at 1/4
+    assert frame.work.shape == (240, 320, 3)
+    assert frame.scale == 4.0
+    assert frame.full.shape == img.shape
+
+    on_full = frame.to_full(_bbox(frame.work))
+    assert max(abs(a - b) for a, b in zip(on_full, box)) <= frame.scale
+    x1, y1, x2, y2 = on_full
+    assert frame.full[y1 + 8:y2 - 8, x1 + 8:x2 - 8].min() > 128
+    assert frame.boxes_to_full([_bbox(frame.work), None]) == [on_full, None]
+
+
+def test_reduced_decode_with_a_remaining_downscale():
+    img = np.zeros((480, 1000, 3), dtype=np.uint8)
+    img[100:300, 200:600] = 255
+    # 1000 / 2 = 500 is still wider than 320, so the half-size decode is resized too
+    frame = decode_frame(encode_jpeg(img), work_width=320, reduced=True)
+    assert frame.work.shape[1] == 320
+    assert frame.scale == pytest.approx(1000 / 320)
+    on_full = frame.to_full(_bbox(frame.work))
+    assert max(abs(a - b) for a, b in zip(on_full, [200, 100, 600, 300])) <= 2 * frame.scale
+
+
+def test_unscaled_frame_keeps_coordinates():
+    img = np.zeros((240, 320, 3), dtype=np.uint8)
+    frame = decode_frame(encode_jpeg(img), work_width=640, reduced=True)
+    assert frame.scale == 1.0 and frame.work is frame.full
+    assert frame.to_full([1, 2, 3, 4]) == [1, 2, 3, 4]
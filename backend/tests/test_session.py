@@ -0,0 +1,42 @@
+from services import session as session_module
+from services.session import SessionStore
+
+
+def test_get_creates_and_reuses_state():
+    store = SessionStore()
+    state = store.get("a")
+    assert store.get("a") is state and len(store) == 1
+    assert store.peek("a") is state and store.peek("b") is None
+    store.drop("a")
+    assert store.peek("a") is None
+
+
+def test_without_id_state_is_not_stored():
+    store = SessionStore()
+    assert store.get(None).session_id is None
+    assert store.get(None) is not store.get(None)
+    assert len(store) == 0
+
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore(max_sessions=2)
+    a = store.get("a")
+    store.get("b")
+    assert store.get("a") is a
+    store.get("c")
+    assert store.peek("b") is None
+    assert store.peek("a") is a and store.peek("c") is not None
+
+
+def test_idle_sessions_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(session_module.time, "monotonic", lambda: now[0])
+    store = SessionStore(ttl_seconds=30)
+    idle = store.get("idle")
+    active = store.get("active")
+    now[0] += 20
+    active.touch()
+    now[0] += 20
+    store.get("new")
+    assert store.peek("idle") is None and store.peek("active") is active
+    assert active.frame_count == 1 and idle.frame_count == 0
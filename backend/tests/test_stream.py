@@ -0,0 +1,117 @@
+import asyncio
+import logging
+
+import numpy as np
+import pytest
+
+from services.frame import encode_jpeg
+from services.session import SessionStore
+
+api = pytest.importorskip("api")
+
+JPEG = encode_jpeg(np.zeros((120, 160, 3), dtype=np.uint8))
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.inbox = asyncio.Queue()
+        self.sent = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    async def receive(self):
+        return await self.inbox.get()
+
+    async def close(self, code=1000):
+        self.closed = code
+
+    def frame(self, contents):
+        self.inbox.put_nowait({"type": "websocket.receive", "bytes": contents})
+
+    def disconnect(self):
+        self.inbox.put_nowait({"type": "websocket.disconnect"})
+
+
+@pytest.fixture
+def stream_env(monkeypatch):
+    monkeypatch.setattr(api, "admission", None)
+    monkeypatch.setattr(api, "session_store", SessionStore())
+    calls = []
+
+    def install(pipeline):
+        async def run_pipeline(frame, session, multi_face=False):
+            calls.append(frame.work.shape)
+            session.touch()
+            return pipeline(session)
+        monkeypatch.setattr(api, "_run_pipeline", run_pipeline)
+        return calls
+    return install
+
+
+async def _until(predicate, timeout=1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+def test_stream_answers_each_frame_and_keeps_session_state(stream_env):
+    calls = stream_env(lambda session: api.PipelineResult("ok", {"valence": "Neutral"}))
+
+    async def scenario():
+        ws = FakeWebSocket()
+        handler = asyncio.create_task(api.stream(ws, session_id="s"))
+        ws.frame(JPEG)
+        await _until(lambda: len(ws.sent) == 2)
+        ws.frame(b"not an image")
+        await _until(lambda: len(ws.sent) == 3)
+        ws.frame(JPEG)
+        await _until(lambda: len(ws.sent) == 4)
+        ws.disconnect()
+        await asyncio.wait_for(handler, timeout=1.0)
+        return ws
+
+    ws = asyncio.run(scenario())
+    assert ws.sent[0] == {"session_id": "s"}
+    assert ws.sent[1]["frame"] == 1 and ws.sent[1]["status"] == "ok" and ws.sent[1]["analysis"] == {"valence": "Neutral"}
+    assert ws.sent[2]["error"] == "Invalid image"
+    assert ws.sent[3]["frame"] == 2
+    assert calls == [(120, 160, 3), (120, 160, 3)]
+    assert api.session_store.peek("s").last_frame_jpeg == JPEG
+    assert ws.closed is None
+
+
+def test_stream_without_session_id_gets_one(stream_env):
+    stream_env(lambda session: api.PipelineResult("no_user"))
+
+    async def scenario():
+        ws = FakeWebSocket()
+        ws.disconnect()
+        await asyncio.wait_for(api.stream(ws), timeout=1.0)
+        return ws
+
+    ws = asyncio.run(scenario())
+    assert len(ws.sent) == 1 and len(ws.sent[0]["session_id"]) == 32
+
+
+def test_pipeline_errors_are_logged_not_taken_for_a_disconnect(stream_env, caplog):
+    def fail(session):
+        raise RuntimeError("pipeline broke")
+    stream_env(fail)
+
+    async def scenario():
+        ws = FakeWebSocket()
+        handler = asyncio.create_task(api.stream(ws, session_id="s"))
+        ws.frame(JPEG)
+        await asyncio.wait_for(handler, timeout=1.0)
+        return ws
+
+    with caplog.at_level(logging.ERROR, logger="api"):
+        ws = asyncio.run(scenario())
+    assert ws.closed == 1011
+    assert any(r.exc_info and "pipeline broke" in str(r.exc_info[1]) for r in caplog.records)
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from services import timeline
+from services.emotion import EMOTION_LABELS
+from services.timeline import RECORD, TimelineStore, aggregate, record_for, to_dicts
+
+
+def _analysis(engagement=70, valence="Positive"):
+    scores = {label: 0.0 for label in EMOTION_LABELS}
+    scores["happiness"] = 0.9
+    scores["neutral"] = 0.1
+    return {"engagement_score": engagement, "valence": valence, "all_scores": scores}
+
+
+def _result(status="ok", analysis=None, faces=None, face_coords=None, reused=False):
+    return SimpleNamespace(status=status, analysis=analysis, faces=faces, face_coords=face_coords, reused=reused)
+
+
+def _rec(t, engagement=50):
+    rec = np.zeros((), dtype=RECORD)
+    rec["t"] = t
+    rec["engagement"] = engagement
+    rec["valence"] = 0
+    return rec
+
+
+def test_record_for_analyzed_frame():
+    rec = record_for(_result(analysis=_analysis(), face_coords=(1, 2, 3, 4)), t=12.5)
+    assert rec["t"] == 12.5
+    assert rec["status"] == 0
+    assert rec["engagement"] == 70
+    assert rec["valence"] == 1
+    assert rec["faces"] == 1
+    assert rec["emotions"][EMOTION_LABELS.index("happiness")] == pytest.approx(0.9)
+
+
+def test_record_for_frame_without_analysis():
+    rec = record_for(_result(status="no_user", faces=[]), t=1.0)
+    assert rec["status"] == 1
+    assert rec["engagement"] == -1
+    assert rec["valence"] == -1
+    assert rec["faces"] == 0
+
+
+def test_query_range_over_written_and_buffered_rows(tmp_path):
+    store = TimelineStore(str(tmp_path), flush_records=4)
+    for t in range(10):
+        store.append("s", _rec(float(t)))
+    # 8 written in two batches, 2 still buffered
+    assert os.path.getsize(store.path("s")) == timeline.HEADER_SIZE + 8 * RECORD.itemsize
+    assert store.query("s")["t"].tolist() == [float(t) for t in range(10)]
+    assert store.query("s", start=3, end=9)["t"].tolist() == [3.0, 4.0, 5.0, 6.0, 7.0, 8.0]
+    assert store.exists("s") and not store.exists("other")
+    assert len(store.query("other")) == 0
+
+
+def test_buffers_are_written_in_fill_order(tmp_path):
+    store = TimelineStore(str(tmp_path), flush_records=1)
+    write = store._write
+    first = threading.Event()
+
+    def slow_write(session_id, rows):
+        if rows["t"][0] == 1.0:
+            first.set()
+            time.sleep(0.05)
+        write(session_id, rows)
+
+    store._write = slow_write
+    t1 = threading.Thread(target=store.append, args=("s", _rec(1.0)))
+    t1.start()
+    first.wait(1.0)
+    t2 = threading.Thread(target=store.append, args=("s", _rec(2.0)))
+    t2.start()
+    t1.join()
+    t2.join()
+    written = np.memmap(store.path("s"), dtype=RECORD, mode="r", offset=timeline.HEADER_SIZE)
+    assert written["t"].tolist() == [1.0, 2.0]
+
+
+def test_query_merges_files_of_several_workers(tmp_path, monkeypatch):
+    store = TimelineStore(str(tmp_path), flush_records=2)
+    for pid, times in ((101, (1.0, 3.0, 5.0, 7.0)), (102, (2.0, 4.0, 6.0, 8.0))):
+        monkeypatch.setattr(timeline.os, "getpid", lambda pid=pid: pid)
+        for t in times:
+            store.append("s", _rec(t))
+    assert len(store.paths("s")) == 2
+    assert store.query("s", start=2, end=7)["t"].tolist() == [2.0, 3.0, 4.0, 5.0, 6.0]
+
+
+def test_prune_applies_retention_and_session_cap(tmp_path):
+    store = TimelineStore(str(tmp_path), flush_records=1, retention_seconds=3600, max_sessions=2)
+    now = time.time()
+    for i, session_id in enumerate(("old", "a", "b", "c")):
+        store.append(session_id, _rec(float(i)))
+    os.utime(store.path("old"), (now - 7200, now - 7200))
+    os.utime(store.path("a"), (now - 60, now - 60))
+    assert store.prune() == 2
+    assert not store.exists("old") and not store.exists("a")
+    assert store.exists("b") and store.exists("c")
+
+
+def test_close_flushes_buffers(tmp_path):
+    store = TimelineStore(str(tmp_path), flush_records=64)
+    store.append("s", _rec(1.0))
+    assert not os.path.exists(store.path("s"))
+    store.close()
+    assert len(TimelineStore(str(tmp_path)).query("s")) == 1
+
+
+def test_aggregate_buckets():
+    rows = np.zeros(4, dtype=RECORD)
+    rows["t"] = [0.5, 1.0, 10.2, 10.8]
+    rows["engagement"] = [40, -1, 60, 80]
+    rows["status"] = [0, 1, 0, 0]
+    rows["emotions"][:, 0] = [1.0, 0.0, 0.5, 0.0]
+
+    buckets = aggregate(rows, 10.0)
+    assert [b["t"] for b in buckets] == [0.0, 10.0]
+    assert buckets[0]["frames"] == 2 and buckets[0]["analyzed"] == 1
+    assert buckets[0]["status"]["ok"] == 0.5 and buckets[0]["status"]["no_user"] == 0.5
+    assert buckets[0]["engagement"] == 40.0
+    assert buckets[1]["engagement"] == 70.0
+    assert buckets[1]["emotions"][EMOTION_LABELS[0]] == 0.25
+    assert aggregate(rows[:0], 10.0) == []
+
+
+def test_to_dicts():
+    rows = np.zeros(2, dtype=RECORD)
+    rows["t"] = [1.0, 2.0]
+    rows["engagement"] = [55, -1]
+    rows["valence"] = [2, -1]
+    rows["status"] = [0, 2]
+    rows["faces"] = [1, 0]
+    first, second = to_dicts(rows)
+    assert first["engagement"] == 55 and first["valence"] == "Negative" and first["status"] == "ok"
+    assert first["emotions"] is not None and first["faces"] == 1
+    assert second["engagement"] is None and second["valence"] is None and second["emotions"] is None
+    assert second["status"] == "mobile_detected"
+
+
+def test_query_limit_keeps_latest_rows(tmp_path, monkeypatch):
+    store = TimelineStore(str(tmp_path), flush_records=3)
+    for pid, times in ((101, (1.0, 3.0, 5.0, 7.0)), (102, (2.0, 4.0, 6.0, 8.0, 9.0))):
+        monkeypatch.setattr(timeline.os, "getpid", lambda pid=pid: pid)
+        for t in times:
+            store.append("s", _rec(t))
+        if pid == 101:
+            # Another process's buffer never ends up in this one's file
+            store.flush()
+    # 8.0 and 9.0 are still buffered
+    assert store.query("s", limit=3)["t"].tolist() == [7.0, 8.0, 9.0]
+    assert store.query("s", end=6, limit=2)["t"].tolist() == [4.0, 5.0]
+    assert store.count("s") == 9 and store.count("s", start=2, end=6) == 4
+
+
+def test_buckets_match_aggregate_of_the_range(tmp_path, monkeypatch):
+    store = TimelineStore(str(tmp_path), flush_records=4)
+    rng = np.random.default_rng(1)
+    for pid in (101, 102):
+        monkeypatch.setattr(timeline.os, "getpid", lambda pid=pid: pid)
+        for t in np.sort(rng.uniform(0, 100, 25)):
+            rec = _rec(float(t), engagement=int(rng.integers(-1, 100)))
+            rec["status"] = rng.integers(0, 3)
+            rec["emotions"] = rng.dirichlet(np.ones(len(EMOTION_LABELS)))
+            store.append("s", rec)
+        if pid == 101:
+            store.flush()
+    expected = aggregate(store.query("s", start=10, end=90), 7.0)
+    chunked = store.buckets("s", 7.0, start=10, end=90, chunk_records=3)
+    assert [b["t"] for b in chunked] == [b["t"] for b in expected]
+    for got, want in zip(chunked, expected):
+        assert got["frames"] == want["frames"] and got["analyzed"] == want["analyzed"]
+        assert got["status"] == want["status"]
+        assert got["engagement"] == pytest.approx(want["engagement"])
+        if want["emotions"] is not None:
+            assert got["emotions"] == pytest.approx(want["emotions"], abs=1e-4)
+    assert store.buckets("other", 7.0) == []
@@ -0,0 +1,53 @@
+import asyncio
+import os
+
+from services import tracing
+from services.tracing import Trace, TraceMiddleware, TraceStore
+
+
+async def _app(scope, receive, send):
+    with tracing.span("work"):
+        pass
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _call(middleware, path="/predict", headers=()):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    scope = {"type": "http", "path": path, "headers": list(headers)}
+    asyncio.run(middleware(scope, receive, send))
+    return dict(sent[0]["headers"])
+
+
+def test_untraced_requests_pass_through():
+    store = TraceStore()
+    middleware = TraceMiddleware(_app, store, prefix="/predict")
+    assert b"x-trace-id" not in _call(middleware)
+    assert b"x-trace-id" not in _call(middleware, "/healthz", [(b"x-trace", b"1")])
+    assert store.recent() == []
+
+
+def test_trace_header_records_spans():
+    store = TraceStore()
+    middleware = TraceMiddleware(_app, store, header="X-Trace", prefix="/predict")
+    headers = _call(middleware, headers=[(b"x-trace", b"1")])
+    trace = store.get(headers[b"x-trace-id"].decode())
+    assert [e["name"] for e in trace.events] == ["work", "request"]
+
+
+def test_trace_files_are_capped(tmp_path):
+    store = TraceStore(directory=str(tmp_path), max_files=3)
+    traces = [Trace("/predict") for _ in range(5)]
+    for trace in traces:
+        store.finish(trace)
+    store.close()
+    names = sorted(os.listdir(tmp_path))
+    assert len(names) == 3
+    assert f"{traces[-1].trace_id}.json" in names
@@ -0,0 +1,60 @@
+import numpy as np
+
+from services.face import extract_face
+from services.tracking import FaceTracker
+
+
+class StubLocator:
+    """A yunet/dnn FaceLocator stand-in that always finds the same face."""
+
+    detector = "yunet"
+
+    def __init__(self, box=(100, 60, 80, 80)):
+        self.box = box
+        self.regions = []
+
+    def search_region(self, img, window, min_side, max_side, cascade=None):
+        self.regions.append((window, min_side, max_side))
+        return self.box
+
+    def largest(self, img, persons, cascade=None):
+        return self.box
+
+
+def _img():
+    return np.zeros((240, 320, 3), dtype=np.uint8)
+
+
+def test_roi_search_uses_the_locators_detector():
+    locator = StubLocator()
+    tracker = FaceTracker(mode="roi", redetect_every=5, locator=locator)
+    search = lambda: locator.box
+
+    assert tracker.locate_with_source(_img(), None, search=search) == (locator.box, "search")
+    # No Haar cascade at all: the ROI hit can only come from the locator
+    assert tracker.locate_with_source(_img(), None, search=search) == (locator.box, "roi")
+    window, min_side, max_side = locator.regions[0]
+    x1, y1, x2, y2 = window
+    assert x1 <= 100 and y1 <= 60 and x2 >= 180 and y2 >= 140
+    assert min_side <= 80 <= max_side
+
+
+def test_redetect_every_forces_a_full_search():
+    locator = StubLocator()
+    tracker = FaceTracker(mode="roi", redetect_every=2, locator=locator)
+    sources = [tracker.locate_with_source(_img(), None, search=lambda: locator.box)[1] for _ in range(4)]
+    assert sources == ["search", "roi", "search", "roi"]
+
+    tracker = FaceTracker(mode="roi", redetect_every=5, locator=locator)
+    sources = [tracker.locate_with_source(_img(), None, search=lambda: locator.box)[1] for _ in range(10)]
+    assert [i for i, source in enumerate(sources) if source == "search"] == [0, 5]
+
+
+def test_extract_face_labels_followed_faces():
+    locator = StubLocator()
+    tracker = FaceTracker(mode="roi", locator=locator)
+    person = [60, 20, 240, 240]
+    _, coords, source = extract_face(_img(), [person], locator, None, tracker)
+    assert source == "yunet" and coords == list(locator.box)
+    _, _, source = extract_face(_img(), [person], locator, None, tracker)
+    assert source == "roi"
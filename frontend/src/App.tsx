@@ -20,6 +20,10 @@ function App() {
   const audioCtxRef = useRef<AudioContext | null>(null);
   const oscillatorRef = useRef<OscillatorNode | null>(null);
 
+  // Backpressure: one /predict in flight at a time, and back off when the server sheds load
+  const inFlightRef = useRef(false);
+  const retryAtRef = useRef(0);
+
   // Timer Logic
   useEffect(() => {
     let timer: ReturnType<typeof setInterval>;
@@ -53,7 +57,12 @@ function App() {
       });
       setResult(response.data);
     } catch (err: any) {
-      console.error(err);
+      if (err.response?.status === 503) {
+        const retryAfter = Number(err.response.headers['retry-after']) || 1;
+        retryAtRef.current = Date.now() + retryAfter * 1000;
+      } else {
+        console.error(err);
+      }
     }
   };
 
@@ -170,12 +179,19 @@ function App() {
     let interval: ReturnType<typeof setInterval>;
     if (isLiveActive && mode === 'live') {
       interval = setInterval(async () => {
+        // Skip this tick rather than queue frames behind a slow or overloaded server
+        if (inFlightRef.current || Date.now() < retryAtRef.current) return;
         if (webcamRef.current) {
           const imageSrc = webcamRef.current.getScreenshot();
           if (imageSrc) {
-            const fetchRes = await fetch(imageSrc);
-            const blob = await fetchRes.blob();
-            await performAnalysis(blob);
+            inFlightRef.current = true;
+            try {
+              const fetchRes = await fetch(imageSrc);
+              const blob = await fetchRes.blob();
+              await performAnalysis(blob);
+            } finally {
+              inFlightRef.current = false;
+            }
           }
         }
       }, 1000);
@@ -22,12 +22,27 @@ export type EmotionAnalysis = {
   valence: string;
   engagement_score: number;
   all_scores: EmotionScores;
+  affect?: AffectState;
+};
+
+export type DebugBoxes = {
+  persons: number[][];
+  phones: number[][];
+  face: number[] | null;
+};
+
+export type FaceAnalysis = {
+  box: number[];
+  analysis: EmotionAnalysis | null;
 };
 
 export type AnalysisResult = {
   status: 'ok' | 'no_user' | 'mobile_detected';
   analysis: EmotionAnalysis | null;
   debug_image: string | null;
+  boxes?: DebugBoxes;
+  reused?: boolean;
+  faces?: FaceAnalysis[];
 };
 
 export type AffectState = {